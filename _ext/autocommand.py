@@ -1,8 +1,27 @@
 from docutils import nodes
 from docutils.parsers.rst import directives
+from sphinx.util import logging
 from sphinx.util.docutils import SphinxDirective
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
 import subprocess
 import shlex
+import tempfile
+
+import conanenv
+
+logger = logging.getLogger(__name__)
+
+# Outputs of the commands run by the prefetch at env-before-read-docs, also
+# inherited by the forked readers
+_prefetched = {}
+
+_command_re = re.compile(r"^\.\. autocommand::\s*\n(?:[ \t]+:[\w-]+:.*\n)*?[ \t]+:command:[ \t]*(.+?)[ \t]*$",
+                         re.MULTILINE)
+
 
 class autocommand(nodes.literal_block, nodes.Element):
     pass
@@ -13,6 +32,101 @@ def visit_autocommand_node(self, node):
 def depart_autocommand_node(self, node):
     self.depart_literal_block(node)
 
+
+def cache_folder(app):
+    return os.path.join(app.confdir, app.config.autocommand_cache_dir)
+
+
+def cache_path(app, command_str):
+    key = hashlib.sha256(f"{conanenv.conan_version()}\n{command_str}".encode()).hexdigest()
+    return os.path.join(cache_folder(app), key + ".json")
+
+
+def load_cached_output(app, command_str):
+    if app.config.autocommand_refresh:
+        return None
+    try:
+        with open(cache_path(app, command_str)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("command") != command_str or data.get("conan_version") != conanenv.conan_version():
+        return None
+    return data["output"]
+
+
+def store_cached_output(app, command_str, command_output):
+    folder = cache_folder(app)
+    os.makedirs(folder, exist_ok=True)
+    data = {"command": command_str, "conan_version": conanenv.conan_version(), "output": command_output}
+    # Write and rename, so parallel readers never see half-written entries
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, cache_path(app, command_str))
+
+
+def run_command(command_list):
+    try:
+        output = subprocess.run(command_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
+        return output.stdout, True
+    except subprocess.CalledProcessError as e:
+        return f"Error executing: {' '.join(command_list)}\n{e.output}", False
+
+
+def get_command_output(app, command_str, stats):
+    if command_str in _prefetched:
+        stats["misses"] += 1
+        return _prefetched.pop(command_str)
+
+    command_output = load_cached_output(app, command_str)
+    if command_output is not None:
+        stats["hits"] += 1
+        return command_output
+
+    stats["misses"] += 1
+    command_output, succeeded = run_command(shlex.split(command_str))
+    # Failures are not cached, they will be retried in the next build
+    if succeeded:
+        store_cached_output(app, command_str, command_output)
+    return command_output
+
+
+def scan_commands(env, docnames):
+    commands = set()
+    for docname in docnames:
+        try:
+            with open(env.doc2path(docname), encoding="utf-8") as f:
+                commands.update(_command_re.findall(f.read()))
+        except OSError:
+            continue
+    return commands
+
+
+def prefetch_commands(app, env, docnames):
+    # Looking up the cache resolves the Conan version (only if there are commands to read),
+    # before any parallel reader is forked, so all of them share it
+    commands = [c for c in sorted(scan_commands(env, docnames))
+                if load_cached_output(app, c) is None]
+    if not commands:
+        return
+
+    # The commands are I/O bound subprocesses, threads are enough to overlap them.
+    # "-j N" caps the pool, without it use as many workers as cores
+    jobs = app.parallel if app.parallel > 1 else (os.cpu_count() or 1)
+    jobs = min(jobs, len(commands))
+    logger.info(f"autocommand: prefetching {len(commands)} commands with {jobs} workers")
+
+    def prefetch(command_str):
+        command_output, succeeded = run_command(shlex.split(command_str))
+        if succeeded:
+            store_cached_output(app, command_str, command_output)
+        return command_str, command_output
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        _prefetched.update(executor.map(prefetch, commands))
+
+
 class AutocommandDirective(SphinxDirective):
     has_content = True
     option_spec = {
@@ -24,11 +138,8 @@ class AutocommandDirective(SphinxDirective):
         command_str = self.options['command']
         command_list = shlex.split(command_str)
 
-        try:
-            output = subprocess.run(command_list, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, check=True)
-            command_output = output.stdout
-        except subprocess.CalledProcessError as e:
-            command_output = f"Error executing: {' '.join(command_list)}\n{e.output}"
+        stats = self.env.autocommand_stats.setdefault(self.env.docname, {"hits": 0, "misses": 0})
+        command_output = get_command_output(self.env.app, command_str, stats)
 
         text = f"$ {' '.join(command_list)}\n{command_output}\n"
 
@@ -40,6 +151,29 @@ class AutocommandDirective(SphinxDirective):
         self.state.nested_parse(self.content, self.content_offset, new_node)
         return [new_node]
 
+
+def reset_stats(app, env, docnames):
+    # Per document, as the parallel readers are forked from an env that can
+    # already contain the merged stats of the previous chunks
+    env.autocommand_stats = {}
+    _prefetched.clear()
+
+
+def merge_stats(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.autocommand_stats:
+            env.autocommand_stats[docname] = other.autocommand_stats[docname]
+
+
+def report_stats(app, exception):
+    stats = getattr(app.env, "autocommand_stats", None)
+    if exception is None and stats:
+        hits = sum(s["hits"] for s in stats.values())
+        misses = sum(s["misses"] for s in stats.values())
+        logger.info(f"autocommand cache: {hits} hits, {misses} misses "
+                    f"(conan {conanenv.conan_version()})")
+
+
 def setup(app):
     app.add_node(autocommand,
                  html=(visit_autocommand_node, depart_autocommand_node),
@@ -48,8 +182,18 @@ def setup(app):
 
     app.add_directive('autocommand', AutocommandDirective)
 
+    # The cache lives outside the doctrees, so it survives "make clean"
+    # Use "-D autocommand_refresh=1" to ignore it and re-run every command
+    app.add_config_value('autocommand_cache_dir', '_build/.cache/autocommand', 'env')
+    app.add_config_value('autocommand_refresh', False, 'env')
+
+    app.connect('env-before-read-docs', reset_stats)
+    app.connect('env-before-read-docs', prefetch_commands)
+    app.connect('env-merge-info', merge_stats)
+    app.connect('build-finished', report_stats)
+
     return {
-        'version': '0.1',
+        'version': '0.3',
         'parallel_read_safe': True,
         'parallel_write_safe': True,
     }
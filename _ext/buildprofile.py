@@ -0,0 +1,237 @@
+"""
+Build profiling: wall time and peak memory per document, per build phase and per
+directive type.
+
+Disabled by default, enable it with ``make profile`` or ``-D buildprofile_enabled=1``.
+Every process (including the parallel readers and writers) appends its records
+to a JSON lines file in ``buildprofile_dir``, and at build-finished they are
+aggregated in ``profile.json`` plus a summary of the slowest items in the log.
+"""
+import glob
+import json
+import os
+import time
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+import sphinx.ext.graphviz
+from sphinx.util import logging
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_records_path = None
+_doc_starts = {}
+_phase_starts = {}
+
+
+def peak_memory_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def record(kind, name, seconds, **extra):
+    if _records_path is None:
+        return
+    entry = {"kind": kind, "name": name, "seconds": seconds, "pid": os.getpid(), **extra}
+    with open(_records_path.format(pid=os.getpid()), "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def timed_directive(directive_class, name):
+
+    class TimedDirective(directive_class):
+        def run(self):
+            start = time.perf_counter()
+            try:
+                return super().run()
+            finally:
+                record("directive", name, time.perf_counter() - start,
+                       doc=self.state.document.settings.env.docname)
+
+    TimedDirective.__name__ = directive_class.__name__
+    return TimedDirective
+
+
+def timed_render_dot(render_dot):
+
+    def wrapper(self, code, options, format, prefix='graphviz', filename=None):
+        start = time.perf_counter()
+        try:
+            return render_dot(self, code, options, format, prefix, filename)
+        finally:
+            docname = getattr(self.builder, "current_docname", None)
+            record("directive", "graphviz (render)", time.perf_counter() - start, doc=docname)
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def timed_write_doc(write_doc):
+
+    def wrapper(docname, doctree):
+        _doc_starts[("write", docname)] = time.perf_counter()
+        write_doc(docname, doctree)
+        start = _doc_starts.pop(("write", docname))
+        render_start = _doc_starts.pop(("render", docname), None)
+        end = time.perf_counter()
+        record("document", docname, end - start, phase="write",
+               render=end - render_start if render_start else None, peak_kb=peak_memory_kb())
+
+    return wrapper
+
+
+def phase_start(name):
+    _phase_starts[name] = time.perf_counter()
+
+
+def phase_end(name):
+    start = _phase_starts.pop(name, None)
+    if start is not None:
+        record("phase", name, time.perf_counter() - start, peak_kb=peak_memory_kb())
+
+
+def on_builder_inited(app):
+    global _records_path
+    if not app.config.buildprofile_enabled:
+        return
+    folder = os.path.join(app.confdir, app.config.buildprofile_dir)
+    os.makedirs(folder, exist_ok=True)
+    for old in glob.glob(os.path.join(folder, "records-*.jsonl")):
+        os.remove(old)
+    _records_path = os.path.join(folder, "records-{pid}.jsonl")
+    phase_end("init")
+
+    for name in app.config.buildprofile_directives:
+        directive_class = directives._directives.get(name)
+        if directive_class is not None:
+            app.add_directive(name, timed_directive(directive_class, name), override=True)
+    if not getattr(sphinx.ext.graphviz.render_dot, "profiled", False):
+        sphinx.ext.graphviz.render_dot = timed_render_dot(sphinx.ext.graphviz.render_dot)
+    app.builder.write_doc = timed_write_doc(app.builder.write_doc)
+
+
+def on_before_read(app, env, docnames):
+    phase_start("read")
+
+
+def on_source_read(app, docname, source):
+    _doc_starts[("read", docname)] = time.perf_counter()
+
+
+def on_doctree_read(app, doctree):
+    docname = app.env.docname
+    start = _doc_starts.pop(("read", docname), None)
+    if start is not None:
+        record("document", docname, time.perf_counter() - start, phase="read", peak_kb=peak_memory_kb())
+
+
+def on_env_updated(app, env):
+    phase_end("read")
+    phase_start("write")
+
+
+def on_doctree_resolved(app, doctree, docname):
+    record("size", docname, None, nodes=sum(1 for _ in doctree.findall(nodes.Element)))
+
+
+def on_page_context(app, pagename, templatename, context, doctree):
+    if ("write", pagename) in _doc_starts:
+        _doc_starts[("render", pagename)] = time.perf_counter()
+
+
+def load_records(folder):
+    records = []
+    for path in glob.glob(os.path.join(folder, "records-*.jsonl")):
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+def aggregate(records, top):
+    phases = {}
+    documents = {}
+    directive_types = {}
+    for r in records:
+        if r["kind"] == "phase":
+            phases[r["name"]] = {"seconds": r["seconds"], "peak_kb": r["peak_kb"]}
+        elif r["kind"] == "document":
+            doc = documents.setdefault(r["name"], {"read": 0, "write": 0, "render": 0, "peak_kb": 0})
+            doc[r["phase"]] += r["seconds"]
+            doc["render"] += r.get("render") or 0
+            doc["peak_kb"] = max(doc["peak_kb"], r["peak_kb"] or 0)
+        elif r["kind"] == "size":
+            documents.setdefault(r["name"], {"read": 0, "write": 0, "render": 0, "peak_kb": 0})["nodes"] = r["nodes"]
+        elif r["kind"] == "directive":
+            d = directive_types.setdefault(r["name"], {"count": 0, "seconds": 0, "max": 0, "slowest_doc": None})
+            d["count"] += 1
+            d["seconds"] += r["seconds"]
+            if r["seconds"] >= d["max"]:
+                d["max"] = r["seconds"]
+                d["slowest_doc"] = r["doc"]
+    for doc in documents.values():
+        doc["total"] = doc["read"] + doc["write"]
+    slowest = sorted(documents, key=lambda d: documents[d]["total"], reverse=True)[:top]
+    slowest_directives = sorted((r for r in records if r["kind"] == "directive"),
+                                key=lambda r: r["seconds"], reverse=True)[:top]
+    return {"phases": phases,
+            "documents": documents,
+            "directives": directive_types,
+            "slowest_documents": slowest,
+            "slowest_directives": [{"name": r["name"], "doc": r["doc"], "seconds": r["seconds"]}
+                                   for r in slowest_directives]}
+
+
+def on_build_finished(app, exception):
+    global _records_path
+    if _records_path is None:
+        return
+    phase_end("write")
+    folder = os.path.dirname(_records_path)
+    _records_path = None
+
+    report = aggregate(load_records(folder), app.config.buildprofile_top)
+    report_path = os.path.join(folder, "profile.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    logger.info(f"Build profile written to {report_path}")
+    for name, phase in report["phases"].items():
+        logger.info(f"  phase {name}: {phase['seconds']:.2f}s")
+    logger.info("  slowest documents (read + write):")
+    for docname in report["slowest_documents"]:
+        doc = report["documents"][docname]
+        logger.info(f"    {doc['total']:7.3f}s  {docname} (read {doc['read']:.3f}s, write {doc['write']:.3f}s)")
+    logger.info("  directives by total time:")
+    for name, d in sorted(report["directives"].items(), key=lambda i: i[1]["seconds"], reverse=True):
+        logger.info(f"    {d['seconds']:7.3f}s  {name} ({d['count']} calls, slowest in {d['slowest_doc']})")
+
+
+def setup(app):
+    app.add_config_value('buildprofile_enabled', False, '')
+    app.add_config_value('buildprofile_dir', '_build/profile', '')
+    app.add_config_value('buildprofile_top', 20, '')
+    app.add_config_value('buildprofile_directives',
+                         ['autocommand', 'conan-home-file', 'graphviz', 'code-block',
+                          'literalinclude', 'include', 'tabs', 'toctree'], '')
+
+    phase_start("init")
+    app.connect('builder-inited', on_builder_inited)
+    app.connect('env-before-read-docs', on_before_read)
+    app.connect('source-read', on_source_read)
+    app.connect('doctree-read', on_doctree_read)
+    app.connect('env-updated', on_env_updated)
+    app.connect('doctree-resolved', on_doctree_resolved)
+    app.connect('html-page-context', on_page_context)
+    app.connect('build-finished', on_build_finished)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
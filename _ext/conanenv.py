@@ -0,0 +1,38 @@
+import functools
+import os
+import subprocess
+
+# Resolved values are exported to the environment, so the Sphinx parallel workers
+# and any sub-build launched from this process reuse them instead of running Conan again
+VERSION_VAR = "CONAN_DOCS_CONAN_VERSION"
+HOME_VAR = "CONAN_DOCS_CONAN_HOME"
+
+
+def _run_conan(*args):
+    try:
+        output = subprocess.run(["conan", *args], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def conan_version():
+    version = os.environ.get(VERSION_VAR)
+    if version is None:
+        version = _run_conan("--version") or "unknown"
+        os.environ[VERSION_VAR] = version
+    return version
+
+
+@functools.lru_cache(maxsize=None)
+def conan_home():
+    home = os.environ.get(HOME_VAR)
+    if home is None:
+        conan_version()  # Run any pending migration of the home first
+        home = _run_conan("config", "home")
+        if home is None:
+            raise RuntimeError("Could not resolve the Conan home with 'conan config home'")
+        os.environ[HOME_VAR] = home
+    return home
@@ -1,10 +1,17 @@
+import hashlib
 import os
-import subprocess
 
 from docutils import nodes
 from docutils.parsers.rst import directives
 from sphinx.util.docutils import SphinxDirective
 
+import conanenv
+
+# (path, mtime, size) -> (text, sha256), so a file used by several directives
+# is read only once per process
+_snapshots = {}
+
+
 class conanhomefile(nodes.literal_block, nodes.Element):
     pass
 
@@ -14,6 +21,20 @@ def visit_conanhomefile_node(self, node):
 def depart_conanhomefile_node(self, node):
     self.depart_literal_block(node)
 
+
+def read_snapshot(file_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None, None
+    key = (file_path, st.st_mtime_ns, st.st_size)
+    if key not in _snapshots:
+        with open(file_path, 'r') as f:
+            text = f.read()
+        _snapshots[key] = text, hashlib.sha256(text.encode()).hexdigest()
+    return _snapshots[key]
+
+
 class ConanHomeFileDirective(SphinxDirective):
     has_content = True
     option_spec = {
@@ -22,15 +43,13 @@ class ConanHomeFileDirective(SphinxDirective):
     }
 
     def run(self):
-        output = subprocess.run(["conan", "config", "home"], stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT,
-                                text=True, check=True)
-        home_folder = output.stdout.strip()
+        file_path = os.path.join(conanenv.conan_home(), self.options['file-path'])
 
-        file_path = os.path.join(home_folder, self.options['file-path'])
-
-        with open(file_path, 'r') as f:
-            text = f.read()
+        text, digest = read_snapshot(file_path)
+        if text is None:
+            raise self.error(f"Cannot read the Conan home file: {file_path}")
+        # Pages are rebuilt only when the content of the file changes, not its mtime
+        self.env.conanhomefile_hashes.setdefault(self.env.docname, {})[file_path] = digest
 
         highlight_language = self.options.get('language', 'text')
 
@@ -41,6 +60,31 @@ class ConanHomeFileDirective(SphinxDirective):
         return [new_node]
 
 
+def init_hashes(app):
+    if not hasattr(app.env, 'conanhomefile_hashes'):
+        app.env.conanhomefile_hashes = {}
+
+
+def purge_hashes(app, env, docname):
+    env.conanhomefile_hashes.pop(docname, None)
+
+
+def merge_hashes(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.conanhomefile_hashes:
+            env.conanhomefile_hashes[docname] = other.conanhomefile_hashes[docname]
+
+
+def changed_docs(app, env, added, changed, removed):
+    outdated = []
+    for docname, hashes in env.conanhomefile_hashes.items():
+        if docname in removed:
+            continue
+        if any(read_snapshot(path)[1] != digest for path, digest in hashes.items()):
+            outdated.append(docname)
+    return outdated
+
+
 def setup(app):
     app.add_node(conanhomefile,
                  html=(visit_conanhomefile_node, depart_conanhomefile_node),
@@ -49,8 +93,14 @@ def setup(app):
 
     app.add_directive('conan-home-file', ConanHomeFileDirective)
 
+    app.connect('builder-inited', init_hashes)
+    app.connect('env-get-outdated', changed_docs)
+    app.connect('env-purge-doc', purge_hashes)
+    app.connect('env-merge-info', merge_hashes)
+
     return {
-        'version': '0.1',
+        'version': '0.2',
+        'env_version': 1,
         'parallel_read_safe': True,
         'parallel_write_safe': True,
     }
@@ -0,0 +1,244 @@
+"""
+Content-addressed cache of doctrees and environments, shared between builds.
+
+Sphinx only reuses the doctrees of the same checkout, so every CI run and every
+new branch parses all the documents again. With ``doctreecache_enabled``, this
+extension keeps in ``doctreecache_dir``, a folder CI can persist and restore
+between runs (one folder per concurrent job, every build saves a snapshot when
+it finishes):
+
+- ``objects/<key>.doctree``: the doctree of every document, keyed by a hash of
+  its source, its dependencies (includes, literalincludes...) and the build key.
+- ``snapshots/<build key>/<id>.pickle``: the last environments, with a manifest
+  (``<id>.json``) of the documents they were read from.
+
+The build key covers Python, Sphinx, docutils and the extensions (the source of
+the local ``_ext`` ones), the configuration values that affect reading and the
+Conan version, that the autocommand outputs depend on. Not the builder: like in
+Sphinx, the builders that load the same extensions can share the doctrees. It is
+computed once, when the configuration is ready, for the restore and the save.
+
+When a build starts without an environment, the snapshot sharing more documents
+with the sources is restored, with the doctrees of the unchanged documents, and
+Sphinx only reads the documents that changed, as in a local incremental build.
+"""
+import glob
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import docutils
+import sphinx
+from sphinx.application import ENV_PICKLE_FILENAME
+from sphinx.util import logging
+
+import conanenv
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+
+def file_hash(path, hashes):
+    if path not in hashes:
+        try:
+            with open(path, "rb") as f:
+                hashes[path] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            hashes[path] = None
+    return hashes[path]
+
+
+def build_key(app, config):
+    hashes = {}
+    extensions = {}
+    for name, extension in app.extensions.items():
+        path = getattr(sys.modules.get(name), "__file__", None) or ""
+        # The local extensions keep the same version when they change
+        local = os.path.abspath(path).startswith(os.path.abspath(app.confdir) + os.sep)
+        extensions[name] = file_hash(path, hashes) if local else str(extension.version)
+    key = {"python": list(sys.version_info[:2]),
+           "sphinx": sphinx.__display_version__,
+           "docutils": docutils.__version__,
+           "extensions": extensions,
+           "config": sorted((item.name, repr(item.value)) for item in config.filter('env')),
+           "conan": conanenv.conan_version()}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def document_key(key, srcdir, source, dependencies, hashes):
+    digest = hashlib.sha256(key.encode("utf-8"))
+    for path in [source] + sorted(dependencies):
+        digest.update(f"\n{path}:{file_hash(os.path.join(srcdir, path), hashes)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def copy_file(src, dst):
+    # Never hard links: Sphinx rewrites the doctrees in place
+    folder = os.path.dirname(dst)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def write_json(path, data):
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifests(folder):
+    manifests = {}
+    for path in glob.glob(os.path.join(folder, "snapshots", "*", "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifests[path] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return manifests
+
+
+def cache_folder(app):
+    return os.path.join(app.confdir, app.config.doctreecache_dir)
+
+
+def restore_snapshot(app, config):
+    """ Starts a build without environment from the closest snapshot of a previous one
+    """
+    if not config.doctreecache_enabled:
+        return
+    key = app._doctreecache_key = build_key(app, config)
+    if os.path.exists(os.path.join(app.doctreedir, ENV_PICKLE_FILENAME)):
+        return
+    folder = cache_folder(app)
+    hashes = {}
+    best, best_matches = None, []
+    for path in sorted(glob.glob(os.path.join(folder, "snapshots", key, "*.json")),
+                       key=os.path.getmtime, reverse=True):
+        try:
+            with open(path, encoding="utf-8") as f:
+                docs = json.load(f)["docs"]
+        except (OSError, ValueError, KeyError):
+            continue
+        matches = [(docname, doc["key"]) for docname, doc in docs.items()
+                   if document_key(key, app.srcdir, doc["source"], doc["dependencies"], hashes) == doc["key"]
+                   and os.path.isfile(os.path.join(folder, "objects", doc["key"] + ".doctree"))]
+        if len(matches) > len(best_matches):
+            best, best_matches = path, matches
+    if best is None:
+        logger.info("doctreecache: no snapshot for this build")
+        return
+
+    try:
+        with open(best[:-len(".json")] + ".pickle", "rb") as f:
+            env = pickle.load(f)
+    except Exception as e:
+        logger.info(f"doctreecache: cannot load the snapshot {best}: {e}")
+        return
+    restored = 0
+    for docname, doc_key in best_matches:
+        try:
+            copy_file(os.path.join(folder, "objects", doc_key + ".doctree"),
+                      os.path.join(app.doctreedir, docname + ".doctree"))
+            restored += 1
+        except OSError:
+            pass  # Pruned by a concurrent build, it is read again
+    # Up to date for Sphinx, the changed documents are the ones without doctree
+    now = time.time_ns() // 1000
+    env.all_docs = dict.fromkeys(env.all_docs, now)
+    # Maybe from another checkout, the paths of the documents are relative to it
+    env.srcdir = None
+    os.makedirs(app.doctreedir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=app.doctreedir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(env, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, os.path.join(app.doctreedir, ENV_PICKLE_FILENAME))
+    os.utime(best)
+    logger.info(f"doctreecache: restored {restored} of {len(env.all_docs)} documents "
+                f"from {os.path.relpath(best, folder)}")
+
+
+def save_snapshot(app, exception):
+    env_path = os.path.join(app.doctreedir, ENV_PICKLE_FILENAME)
+    key = getattr(app, "_doctreecache_key", None)
+    if exception is not None or key is None or not os.path.isfile(env_path):
+        return
+    env = app.env
+    folder = cache_folder(app)
+    hashes = {}
+    docs = {}
+    for docname in sorted(env.all_docs):
+        doctree = os.path.join(app.doctreedir, docname + ".doctree")
+        if not os.path.isfile(doctree):
+            continue
+        source = env.doc2path(docname, False)
+        dependencies = sorted(env.dependencies.get(docname, ()))
+        doc_key = document_key(key, app.srcdir, source, dependencies, hashes)
+        docs[docname] = {"key": doc_key, "source": source, "dependencies": dependencies}
+        obj = os.path.join(folder, "objects", doc_key + ".doctree")
+        if not os.path.exists(obj):
+            copy_file(doctree, obj)
+
+    manifest = {"docs": docs}
+    snapshot_id = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(folder, "snapshots", key, snapshot_id)
+    if not os.path.exists(path + ".json"):
+        copy_file(env_path, path + ".pickle")
+        write_json(path + ".json", manifest)
+        logger.info(f"doctreecache: saved snapshot {key}/{snapshot_id} ({len(docs)} documents)")
+    else:
+        os.utime(path + ".json")
+    prune(folder, app.config.doctreecache_keep, app.config.doctreecache_keep_days)
+
+
+def prune(folder, keep, keep_days):
+    """ Keeps the last snapshots of every build key, and the doctrees they use
+    """
+    oldest = time.time() - keep_days * DAY
+    by_key = {}
+    manifests = load_manifests(folder)
+    for path in manifests:
+        by_key.setdefault(os.path.dirname(path), []).append(path)
+    for paths in by_key.values():
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for i, path in enumerate(paths):
+            if i >= keep or os.path.getmtime(path) < oldest:
+                for f in (path, path[:-len(".json")] + ".pickle"):
+                    if os.path.exists(f):
+                        os.remove(f)
+                del manifests[path]
+    used = {doc["key"] for manifest in manifests.values() for doc in manifest["docs"].values()}
+    removed = 0
+    for obj in glob.glob(os.path.join(folder, "objects", "*.doctree")):
+        if os.path.basename(obj)[:-len(".doctree")] not in used:
+            os.remove(obj)
+            removed += 1
+    if removed:
+        logger.info(f"doctreecache: removed {removed} unused doctrees")
+
+
+def setup(app):
+    app.add_config_value('doctreecache_enabled', False, '')
+    app.add_config_value('doctreecache_dir', '_build/.cache/doctrees', '')
+    app.add_config_value('doctreecache_keep', 5, '')
+    app.add_config_value('doctreecache_keep_days', 30, '')
+
+    # After the rest of handlers, that can still change the configuration
+    app.connect('config-inited', restore_snapshot, priority=900)
+    app.connect('build-finished', save_snapshot)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,130 @@
+"""
+Last updated dates of the pages from the git history.
+
+A single ``git log --name-only`` at builder-inited gives the date of the last
+commit of every file of the docs. The date of a page is the newest of its source
+and its dependencies (``.inc`` includes, literalincludes...), and it is used:
+
+- As the "Last updated on" of the footer (``html_last_updated_fmt``), instead of
+  the time of the build.
+- As the ``<lastmod>`` of the page in the ``sitemap.xml`` of sphinx-sitemap.
+
+Files without commits (new, or out of the repository) keep the build time. In
+shallow clones all the files get the date of the cloned commits.
+"""
+import datetime
+import os
+import subprocess
+import xml.etree.ElementTree as ET
+
+from sphinx.locale import _
+from sphinx.util import logging
+from sphinx.util.i18n import format_date
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+RECORD_SEPARATOR = "\x1e"
+
+_commit_times = {}
+
+
+def read_commit_times(srcdir):
+    """ The time of the last commit of every file, relative to srcdir
+    """
+    try:
+        output = subprocess.run(["git", "-c", "core.quotePath=false", "log", f"--format={RECORD_SEPARATOR}%ct",
+                                 "--name-only", "--relative"],
+                                cwd=srcdir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    times = {}
+    # Newest commits first, the first time of a file is the last one
+    for record in output.split(RECORD_SEPARATOR)[1:]:
+        timestamp, *files = record.splitlines()
+        for name in files:
+            if name:
+                times.setdefault(os.path.normpath(name), int(timestamp))
+    return times
+
+
+def page_time(env, docname):
+    paths = [env.doc2path(docname, False), *env.dependencies.get(docname, ())]
+    times = [_commit_times[os.path.normpath(p)] for p in paths if os.path.normpath(p) in _commit_times]
+    return max(times) if times else None
+
+
+def init_commit_times(app):
+    if not app.config.gitdates_enabled or app.builder.format != "html":
+        return
+    _commit_times.clear()
+    _commit_times.update(read_commit_times(app.srcdir))
+    logger.info(f"gitdates: {len(_commit_times)} files with commits")
+
+
+def add_last_updated(app, pagename, templatename, context, doctree):
+    if not _commit_times or app.config.html_last_updated_fmt is None or pagename not in app.env.all_docs:
+        return
+    timestamp = page_time(app.env, pagename)
+    if timestamp is not None:
+        date = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+        context["last_updated"] = format_date(app.config.html_last_updated_fmt or _('%b %d, %Y'),
+                                              date=date, language=app.config.language)
+
+
+def sitemap_link(app, pagename):
+    # The links of the pages in sphinx-sitemap
+    if app.builder.name == "dirhtml":
+        return "" if pagename == "index" else pagename + "/"
+    return pagename + (app.config.html_file_suffix or ".html")
+
+
+def add_sitemap_lastmod(app, exception):
+    if exception is not None or not _commit_times or "sphinx_sitemap" not in app.extensions:
+        return
+    sitemap_path = os.path.join(app.outdir, app.config.sitemap_filename)
+    if not os.path.isfile(sitemap_path):
+        return
+    config = app.config
+    site_url = (config.site_url or config.html_baseurl).rstrip("/") + "/"
+    lang = config.language + "/" if config.language else ""
+    version = config.version + "/" if config.version else ""
+    # The same URLs that sphinx-sitemap writes
+    pages = {site_url + config.sitemap_url_scheme.format(lang=lang, version=version,
+                                                         link=sitemap_link(app, docname)): docname
+             for docname in app.env.found_docs}
+
+    ET.register_namespace("", SITEMAP_NS)
+    ET.register_namespace("xhtml", "http://www.w3.org/1999/xhtml")
+    tree = ET.parse(sitemap_path)
+    dated = 0
+    for url in tree.getroot().iter(f"{{{SITEMAP_NS}}}url"):
+        loc = url.find(f"{{{SITEMAP_NS}}}loc")
+        docname = pages.get(loc.text) if loc is not None else None
+        timestamp = page_time(app.env, docname) if docname else None
+        if timestamp is None or url.find(f"{{{SITEMAP_NS}}}lastmod") is not None:
+            continue
+        lastmod = ET.Element(f"{{{SITEMAP_NS}}}lastmod")
+        lastmod.text = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat()
+        url.insert(list(url).index(loc) + 1, lastmod)
+        dated += 1
+    if dated:
+        # Unchanged otherwise, not compressed again by staticassets
+        tree.write(sitemap_path, xml_declaration=True, encoding="utf-8", method="xml")
+    logger.info(f"gitdates: lastmod added to {dated} sitemap urls")
+
+
+def setup(app):
+    app.add_config_value('gitdates_enabled', True, 'html')
+
+    app.connect('builder-inited', init_commit_times)
+    app.connect('html-page-context', add_last_updated)
+    # After sphinx-sitemap writes the sitemap, before staticassets compresses it
+    app.connect('build-finished', add_sitemap_lastmod, priority=850)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
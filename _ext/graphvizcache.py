@@ -0,0 +1,249 @@
+"""
+Cached and parallel graphviz rendering.
+
+Replaces ``render_dot`` of ``sphinx.ext.graphviz``: the rendered diagrams are
+stored in ``_build/.cache/graphviz``, keyed by the dot code, its options, the
+dot command line and the Graphviz version, and copied from there to the output.
+The SVGs are optimized before storing them (no comments, doctype or whitespace
+between tags).
+
+The diagrams of the documents are collected while reading, and before writing
+the ones not in the cache are rendered together by a pool of ``dot`` processes,
+so the writers only copy them. Errors are reported by the writers, as usual;
+the diagrams that failed are not rendered again in the same build, and the
+prerendering is skipped when the ``dot`` command cannot be run.
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import sphinx.ext.graphviz
+from sphinx.ext.graphviz import GraphvizError, fix_svg_relative_paths, graphviz
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+# Output format of the diagrams for every builder format
+BUILDER_FORMATS = {"html": None, "latex": "pdf", "texinfo": "png"}
+
+_dot_versions = {}
+
+
+def dot_version(graphviz_dot):
+    if not graphviz_dot:
+        return None
+    if graphviz_dot not in _dot_versions:
+        try:
+            output = subprocess.run([graphviz_dot, "-V"], capture_output=True, text=True, check=True)
+            _dot_versions[graphviz_dot] = (output.stderr or output.stdout).strip()
+        except (OSError, subprocess.CalledProcessError):
+            _dot_versions[graphviz_dot] = None
+    return _dot_versions[graphviz_dot]
+
+
+def output_name(code, options, graphviz_dot, dot_args, format, prefix):
+    # The same file name of sphinx.ext.graphviz, so the outputs of previous builds are reused
+    hashkey = (code + str(options) + str(graphviz_dot) + str(dot_args)).encode()
+    return f'{prefix}-{hashlib.sha1(hashkey, usedforsecurity=False).hexdigest()}.{format}'
+
+
+def optimize_svg(svg):
+    svg = re.sub(r"<!--.*?-->", "", svg, flags=re.DOTALL)
+    svg = re.sub(r"<!DOCTYPE[^>]*>", "", svg)
+    return re.sub(r">\s+<", "><", svg).strip()
+
+
+class Diagram:
+    """ A diagram to render, with its place in the cache
+    """
+    def __init__(self, config, code, options, format, prefix, cwd, cache_dir):
+        self.code = code
+        self.format = format
+        self.graphviz_dot = options.get('graphviz_dot', config.graphviz_dot)
+        self.dot_args = list(config.graphviz_dot_args)
+        self.cwd = cwd
+        self.optimize = config.graphvizcache_optimize
+        self.name = output_name(code, options, self.graphviz_dot, config.graphviz_dot_args, format, prefix)
+        key = json.dumps([self.name, dot_version(self.graphviz_dot), self.optimize])
+        self.cached = os.path.join(cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + "." + format)
+
+    def render(self):
+        """ Renders it into the cache, raises OSError if dot cannot be run
+        """
+        if os.path.isfile(self.cached):
+            return
+        folder = os.path.dirname(self.cached)
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix="." + self.format)
+        os.close(fd)
+        try:
+            args = [self.graphviz_dot, *self.dot_args, '-T' + self.format, '-o' + tmp_path]
+            if self.format == 'png':
+                args.extend(['-Tcmapx', '-o%s.map' % tmp_path])
+            try:
+                ret = subprocess.run(args, input=self.code.encode(), capture_output=True,
+                                     cwd=self.cwd, check=True)
+            except subprocess.CalledProcessError as exc:
+                raise GraphvizError(f'dot exited with error:\n[stderr]\n{exc.stderr!r}\n'
+                                    f'[stdout]\n{exc.stdout!r}') from exc
+            if not os.path.getsize(tmp_path):
+                raise GraphvizError(f'dot did not produce an output file:\n[stderr]\n{ret.stderr!r}\n'
+                                    f'[stdout]\n{ret.stdout!r}')
+            if self.format == 'svg' and self.optimize:
+                with open(tmp_path, encoding="utf-8") as f:
+                    svg = optimize_svg(f.read())
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(svg)
+            if self.format == 'png':
+                os.replace(tmp_path + ".map", self.cached + ".map")
+            os.replace(tmp_path, self.cached)
+        finally:
+            for path in (tmp_path, tmp_path + ".map"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def copy_to(self, outfn):
+        os.makedirs(os.path.dirname(outfn), exist_ok=True)
+        shutil.copyfile(self.cached, outfn)
+        if self.format == 'png':
+            shutil.copyfile(self.cached + ".map", outfn + ".map")
+
+
+def cache_folder(app):
+    return os.path.join(app.confdir, app.config.graphvizcache_dir)
+
+
+def working_dir(srcdir, docname, filename):
+    return os.path.dirname(os.path.join(srcdir, filename or docname))
+
+
+def render_dot(self, code, options, format, prefix='graphviz', filename=None):
+    """ Drop-in replacement of sphinx.ext.graphviz.render_dot that goes through the cache
+    """
+    builder = self.builder
+    if not options.get('graphviz_dot', builder.config.graphviz_dot):
+        raise GraphvizError(f'graphviz_dot executable path must be set! {builder.config.graphviz_dot!r}')
+    diagram = Diagram(builder.config, code, options, format, prefix,
+                      working_dir(builder.srcdir, options.get('docname', 'index'), filename),
+                      cache_folder(builder.app))
+    relfn = posixpath.join(builder.imgpath, diagram.name)
+    outfn = os.path.join(builder.outdir, builder.imagedir, diagram.name)
+    if os.path.isfile(outfn):
+        return relfn, outfn
+
+    warned = getattr(builder, '_graphviz_warned_dot', {})
+    if warned.get(diagram.graphviz_dot):
+        return None, None
+    failures = builder.app._graphvizcache_failures
+    error = failures.get(diagram.cached)
+    if error is None:
+        try:
+            diagram.render()
+        except (OSError, GraphvizError) as exc:
+            error = failures[diagram.cached] = exc
+    if isinstance(error, OSError):
+        logger.warning(f'dot command {diagram.graphviz_dot!r} cannot be run (needed for graphviz '
+                       f'output), check the graphviz_dot setting')
+        builder._graphviz_warned_dot = dict(warned, **{diagram.graphviz_dot: True})
+        return None, None
+    if error is not None:
+        raise GraphvizError(*error.args)
+
+    diagram.copy_to(outfn)
+    if format == 'svg':
+        fix_svg_relative_paths(self, outfn)
+    return relfn, outfn
+
+
+def collect_diagrams(app, doctree):
+    diagrams = [(node['code'], node['options'], node.get('filename'))
+                for node in doctree.findall(graphviz)]
+    if diagrams:
+        app.env.graphvizcache_diagrams[app.env.docname] = diagrams
+
+
+def init_diagrams(app):
+    if not hasattr(app.env, 'graphvizcache_diagrams'):
+        app.env.graphvizcache_diagrams = {}
+    # The errors of the diagrams rendered in this build, by their place in the cache, a
+    # hash of the code, options, dot command line and Graphviz version
+    app._graphvizcache_failures = {}
+
+
+def purge_diagrams(app, env, docname):
+    env.graphvizcache_diagrams.pop(docname, None)
+
+
+def merge_diagrams(app, env, docnames, other):
+    for docname in docnames:
+        if docname in other.graphvizcache_diagrams:
+            env.graphvizcache_diagrams[docname] = other.graphvizcache_diagrams[docname]
+
+
+def prerender_diagrams(app, env):
+    """ Renders the diagrams missing in the cache before writing, all at once
+    """
+    builder = app.builder
+    if builder.format not in BUILDER_FORMATS:
+        return
+    format = BUILDER_FORMATS[builder.format] or app.config.graphviz_output_format
+    folder = cache_folder(app)
+    failures = app._graphvizcache_failures
+    pending = {}
+    missing_dot = set()
+    for docname, diagrams in env.graphvizcache_diagrams.items():
+        for code, options, filename in diagrams:
+            diagram = Diagram(app.config, code, options, format, 'graphviz',
+                              working_dir(app.srcdir, docname, filename), folder)
+            outfn = os.path.join(builder.outdir, builder.imagedir, diagram.name)
+            if not diagram.graphviz_dot or os.path.isfile(outfn) or os.path.isfile(diagram.cached) \
+                    or diagram.cached in failures:
+                continue
+            # dot -V fails, so would the rendering
+            if dot_version(diagram.graphviz_dot) is None:
+                missing_dot.add(diagram.graphviz_dot)
+                continue
+            pending[diagram.cached] = diagram
+    for graphviz_dot in sorted(missing_dot):
+        logger.info(f"graphvizcache: dot command {graphviz_dot!r} cannot be run, no diagrams prerendered")
+    if not pending:
+        return
+
+    def render(diagram):
+        try:
+            diagram.render()
+        except (OSError, GraphvizError) as exc:
+            failures[diagram.cached] = exc  # Reported by the writer, without rendering it again
+
+    # dot runs in subprocesses, threads are enough to run them in parallel
+    jobs = min(app.parallel if app.parallel > 1 else (os.cpu_count() or 1), len(pending))
+    logger.info(f"graphvizcache: rendering {len(pending)} diagrams with {jobs} workers")
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(render, pending.values()))
+
+
+def setup(app):
+    app.setup_extension('sphinx.ext.graphviz')
+    app.add_config_value('graphvizcache_dir', '_build/.cache/graphviz', '')
+    app.add_config_value('graphvizcache_optimize', True, 'html')
+
+    # The html, latex and texinfo visitors call the module level function
+    sphinx.ext.graphviz.render_dot = render_dot
+
+    app.connect('builder-inited', init_diagrams)
+    app.connect('doctree-read', collect_diagrams)
+    app.connect('env-purge-doc', purge_diagrams)
+    app.connect('env-merge-info', merge_diagrams)
+    app.connect('env-updated', prerender_diagrams)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,185 @@
+"""
+Cache of the Pygments highlighting of the code blocks, shared between builds.
+
+Every time a page is written all its ``code-block``, ``literalinclude`` and
+``autocommand`` blocks are lexed and formatted again, also when the page is
+only written because its toctree or sidebar changed. This extension replaces
+``PygmentsBridge.highlight_block`` with one that looks the result up in a SQLite
+database (``_build/.cache/highlight.sqlite``), keyed by a hash of the code, the
+language and options, the formatter and style, and the Pygments and Sphinx
+versions. The results are stored compressed, and the database is shared by the
+parallel writers and by the next builds.
+
+Blocks that fail to lex (they are highlighted again in relaxed mode, with a
+warning) are not cached, so the warning is shown in every build. Entries not
+used in ``highlightcache_keep_days`` days are removed at the end of the build.
+"""
+import hashlib
+import json
+import logging as std_logging
+import os
+import sqlite3
+import time
+import zlib
+
+import pygments
+import sphinx
+from sphinx import highlighting
+from sphinx.highlighting import PygmentsBridge
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+
+# The original method, also when the module is imported again (autobuild.py restarts)
+_highlight_block = getattr(PygmentsBridge.highlight_block, "__wrapped__", PygmentsBridge.highlight_block)
+_cache = None
+
+
+class WarningRecorder(std_logging.Filter):
+    """ Notes the warnings logged while highlighting a block, without filtering them
+    """
+    def __init__(self):
+        super().__init__()
+        self.warned = False
+
+    def filter(self, record):
+        if record.levelno >= std_logging.WARNING:
+            self.warned = True
+        return True
+
+
+class HighlightCache:
+    """ The database of highlighted blocks, with a connection per process
+    """
+    def __init__(self, path):
+        self.path = path
+        self.today = int(time.time() // DAY)
+        self._connection = None
+        self._pid = None
+        self.disabled = False
+
+    def connection(self):
+        # The parallel writers are forked, they cannot use the connection of the parent
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS blocks "
+                                     "(key BLOB PRIMARY KEY, used INTEGER, output BLOB) WITHOUT ROWID")
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        db = self.connection()
+        row = db.execute("SELECT used, output FROM blocks WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[0] < self.today:
+            with db:
+                db.execute("UPDATE blocks SET used = ? WHERE key = ?", (self.today, key))
+        return zlib.decompress(row[1]).decode("utf-8")
+
+    def put(self, key, output):
+        with self.connection() as db:
+            db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)",
+                       (key, self.today, zlib.compress(output.encode("utf-8"))))
+
+    def prune(self, keep_days):
+        with self.connection() as db:
+            return db.execute("DELETE FROM blocks WHERE used < ?", (self.today - keep_days,)).rowcount
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+
+def block_key(bridge, source, lang, opts, force, kwargs):
+    formatter_args = {name: value.__module__ + "." + value.__qualname__ if isinstance(value, type) else value
+                      for name, value in bridge.formatter_args.items()}
+    key = [source, lang, opts or {}, force, kwargs, bridge.dest, bridge.latex_engine,
+           bridge.formatter.__module__ + "." + bridge.formatter.__qualname__, formatter_args,
+           sorted(highlighting.lexers), pygments.__version__, sphinx.__display_version__]
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=repr).encode("utf-8")).digest()
+
+
+def highlight_block(self, source, lang, opts=None, force=False, location=None, **kwargs):
+    """ Drop-in replacement of PygmentsBridge.highlight_block that goes through the cache
+    """
+    cache = _cache
+    if cache is None or cache.disabled:
+        return _highlight_block(self, source, lang, opts, force, location, **kwargs)
+    if not isinstance(source, str):
+        source = source.decode()
+    key = block_key(self, source, lang, opts, force, kwargs)
+    try:
+        output = cache.get(key)
+    except sqlite3.Error as e:
+        cache.disabled = True
+        logger.warning(f"highlightcache: cannot use {cache.path}, highlighting without cache: {e}")
+        output = None
+    if output is not None:
+        return output
+
+    recorder = WarningRecorder()
+    highlighting_logger = std_logging.getLogger(logging.NAMESPACE + "." + highlighting.__name__)
+    highlighting_logger.addFilter(recorder)
+    try:
+        output = _highlight_block(self, source, lang, opts, force, location, **kwargs)
+    finally:
+        highlighting_logger.removeFilter(recorder)
+    if not recorder.warned and not cache.disabled:
+        try:
+            cache.put(key, output)
+        except sqlite3.Error:
+            pass  # Another process holding the database too long, highlighted again next time
+    return output
+
+
+highlight_block.__wrapped__ = _highlight_block
+
+
+def open_cache(app):
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = None
+    if app.config.highlightcache_enabled:
+        _cache = HighlightCache(os.path.join(app.confdir, app.config.highlightcache_file))
+
+
+def close_cache(app, exception):
+    global _cache
+    if _cache is None:
+        return
+    if exception is None and not _cache.disabled:
+        try:
+            removed = _cache.prune(app.config.highlightcache_keep_days)
+            if removed:
+                logger.info(f"highlightcache: removed {removed} unused blocks")
+        except sqlite3.Error:
+            pass
+    _cache.close()
+    _cache = None
+
+
+def setup(app):
+    app.add_config_value('highlightcache_enabled', True, '')
+    app.add_config_value('highlightcache_file', '_build/.cache/highlight.sqlite', '')
+    app.add_config_value('highlightcache_keep_days', 30, '')
+
+    # The html writer and the latex translators call the method of their bridges
+    PygmentsBridge.highlight_block = highlight_block
+
+    app.connect('builder-inited', open_cache)
+    app.connect('build-finished', close_cache)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,571 @@
+"""
+Minified pages with inlined critical CSS, an optional stage at the end of the HTML build.
+
+With ``htmlminify_enabled``, at build-finished the pages of the output are
+minified in a pool of processes: comments (but the conditional ones) and
+indentation are removed, and ``<pre>``, ``<textarea>``, ``<script>`` and
+``<style>`` are kept as they are.
+
+Their local stylesheets stop blocking the rendering: the rules needed above the
+fold are inlined in a ``<style>``, and the full files are preloaded and applied
+when loaded (``<noscript>`` keeps the regular links). The critical CSS is
+computed per layout, the pages that load the same stylesheets: it has the rules
+whose selectors match the elements that all its pages have in the header, the
+sidebar and the first ``htmlminify_fold_elements`` elements of the body, and
+the web fonts those rules use (only the woff2 source, never the icon fonts of
+``htmlminify_icon_fonts``). It is downloaded again with every page, so a layout
+keeps its regular links when its critical CSS is bigger than
+``htmlminify_critical_max_size`` bytes, or when inlining it would make its pages
+grow more than ``htmlminify_inline_budget`` bytes each (net of the bytes saved
+by the minification) over the pages written by Sphinx.
+
+The hashes of the final pages are kept in ``_build/.cache/htmlminify``, the
+pages that Sphinx did not write again are skipped, unless the critical CSS of
+their layout changed. Runs before ``staticassets``, that fingerprints and
+compresses the minified pages.
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sphinx.util import logging
+
+from staticassets import HASH_LENGTH
+
+logger = logging.getLogger(__name__)
+
+VERSION = "0.3"
+# Placeholder of the path to the root of the output in the critical CSS, different for every page
+ROOT = "\x00root\x00"
+
+_preserved_re = re.compile(r"<(pre|textarea|script|style)\b.*?</\1\s*>", re.DOTALL | re.IGNORECASE)
+_comment_re = re.compile(r"<!--(?!\[if\b).*?-->", re.DOTALL)
+_newline_space_re = re.compile(r"[ \t\r\f]*\n\s*")
+_spaces_re = re.compile(r"[ \t\r\f]{2,}")
+_default_type_re = re.compile(r"""(<(?:link|style|script)\b[^>]*?)\s+type=["']text/(?:css|javascript)["']""",
+                              re.IGNORECASE)
+
+_tag_re = re.compile(r"""<([a-zA-Z][\w:-]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+_html_attribute_re = re.compile(r"""([^\s=/"'<>]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+_stylesheet_re = re.compile(r"""<link\b(?=[^>]*\brel=["']stylesheet["'])[^>]*>""", re.IGNORECASE)
+_href_re = re.compile(r"""\bhref=["']([^"']*)["']""")
+_fingerprint_re = re.compile(r"\.[0-9a-f]{%d}(\.css)$" % HASH_LENGTH)
+_critical_re = re.compile(r"<style data-htmlminify>.*?</style>", re.DOTALL)
+_deferred_re = re.compile(r'<link rel="preload" href="([^"]*)" as="style" onload="[^"]*" data-htmlminify>'
+                          r'<noscript><link rel="stylesheet" href="[^"]*"></noscript>')
+FOLD_MARKER = 'itemprop="articleBody"'
+
+_css_comment_re = re.compile(r"/\*.*?\*/", re.DOTALL)
+_css_url_re = re.compile(r"url\((['\"]?)([^'\")]+)\1\)")
+_pseudo_args_re = re.compile(r"::?[\w-]+\([^()]*\)")
+_pseudo_re = re.compile(r"::?[\w-]+")
+_attribute_re = re.compile(r"""\[\s*([\w-]+)\s*(?:([~|^$*]?=)\s*(?:"([^"]*)"|'([^']*)'|([^\]\s]+)))?[^\]]*\]""")
+# Rules that only apply after an interaction, not needed to render the page
+_interaction_re = re.compile(r":(?:hover|focus|focus-within|focus-visible|active|visited|checked|disabled|invalid|target)"
+                             r"\b|::?(?:selection|placeholder|-moz-|-webkit-|-ms-)")
+_combinator_re = re.compile(r"\s*[>+~]\s*|\s+")
+# Selectors without tags, classes or ids that still apply to the whole page
+_global_selectors = ("*", ":root", "*::before", "*::after", "*:before", "*:after")
+_font_family_re = re.compile(r"(?<![\w-])font(?:-family)?\s*:\s*([^;}]+)")
+_animation_re = re.compile(r"(?<![\w-])animation(?:-name)?\s*:\s*([^;}]+)")
+_font_src_re = re.compile(r"src\s*:\s*([^;}]+)")
+_quotes = "'\" "
+_simple_re = re.compile(r"([#.]?)(-?[_a-zA-Z][\w-]*)")
+
+
+def minify_html(html):
+    """ Removes the comments and collapses the whitespace, but in the preserved elements
+    """
+    parts = []
+    last = 0
+    for match in _preserved_re.finditer(html):
+        parts.append(minify_markup(html[last:match.start()]))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(minify_markup(html[last:]))
+    return "".join(parts).strip() + "\n"
+
+
+def minify_markup(text):
+    text = _comment_re.sub("", text)
+    text = _newline_space_re.sub("\n", text)
+    text = _spaces_re.sub(" ", text)
+    return _default_type_re.sub(r"\1", text)
+
+
+def minify_css(css):
+    css = _css_comment_re.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def skip_string(text, i):
+    quote = text[i]
+    i += 1
+    while i < len(text) and text[i] != quote:
+        i += 2 if text[i] == "\\" else 1
+    return i + 1
+
+
+def find_any(text, i, chars):
+    while i < len(text) and text[i] not in chars:
+        i = skip_string(text, i) if text[i] in "\"'" else i + 1
+    return i
+
+
+def closing_brace(text, i):
+    depth = 0
+    while i < len(text):
+        if text[i] in "\"'":
+            i = skip_string(text, i)
+            continue
+        if text[i] == "{":
+            depth += 1
+        elif text[i] == "}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(text)
+
+
+def parse_css(text):
+    """ The rules of a stylesheet: (kind, prelude, body), with the body of @media and
+    @supports parsed too
+    """
+    items = []
+    i = 0
+    while i < len(text):
+        j = find_any(text, i, "{;")
+        prelude = text[i:j].strip()
+        if j >= len(text):
+            break
+        if text[j] == ";":
+            i = j + 1
+            continue  # @import, @charset... stay in the full stylesheets
+        end = closing_brace(text, j)
+        body = text[j + 1:end]
+        if prelude.startswith("@"):
+            name = prelude[1:].split(None, 1)[0].lower() if len(prelude) > 1 else ""
+            if name in ("media", "supports", "layer"):
+                items.append(("group", prelude, parse_css(body)))
+            else:
+                items.append(("at", prelude, body))
+        elif prelude:
+            items.append(("rule", prelude, body))
+        i = end + 1
+    return items
+
+
+def split_selectors(prelude):
+    selectors = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(prelude):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            selectors.append(prelude[start:i].strip())
+            start = i + 1
+    selectors.append(prelude[start:].strip())
+    return [s for s in selectors if s]
+
+
+def attribute_token(match):
+    name, operator = match.group(1).lower(), match.group(2)
+    if name == "type" and operator == "=":
+        return "a:type=" + next(v for v in match.groups()[2:] if v is not None).lower()
+    return "a:" + name
+
+
+def selector_matches(selector, tokens):
+    """ If all the tags, classes, ids and attributes of the selector are in the page, regardless
+    of their structure and values (but ``type``) and of the pseudo-classes. The selectors that
+    depend on a structure that cannot be told from the tokens are left out: the ones with nothing
+    but attributes or pseudo-classes, and the chains of bare tags (``ul ul``, ``li > p``)
+    """
+    if _interaction_re.search(selector):
+        return False
+    if selector.strip() in _global_selectors:
+        return True
+    if any(attribute_token(m) not in tokens for m in _attribute_re.finditer(selector)):
+        return False
+    selector = _pseudo_re.sub("", _pseudo_args_re.sub("", _attribute_re.sub("", selector)))
+    compounds = [c for c in _combinator_re.split(selector.strip()) if c]
+    found = False
+    only_tags = True
+    for compound in compounds:
+        for prefix, name in _simple_re.findall(compound):
+            kind = {"": "t:", ".": "c:", "#": "i:"}[prefix]
+            if (kind + (name.lower() if kind == "t:" else name)) not in tokens:
+                return False
+            found = True
+            only_tags = only_tags and kind == "t:"
+    return found and not (only_tags and len(compounds) > 1)
+
+
+def critical_rules(items, tokens):
+    output = []
+    for kind, prelude, body in items:
+        if kind == "rule":
+            selectors = [s for s in split_selectors(prelude) if selector_matches(s, tokens)]
+            if selectors:
+                output.append(f"{','.join(selectors)}{{{body}}}")
+        elif kind == "group":
+            inner = critical_rules(body, tokens)
+            if inner:
+                output.append(f"{prelude}{{{''.join(inner)}}}")
+    return output
+
+
+def declared_names(css, declaration_re):
+    """ The names in the values of some declarations (font families, animations), lowercase
+    """
+    names = set()
+    for value in declaration_re.findall(css):
+        for part in value.split(","):
+            # The family is the last word of the shorthand ``font: bold 14px/1 Lato``
+            words = part.strip().strip(_quotes)
+            if words:
+                names.add(words.lower())
+                names.add(words.rsplit(None, 1)[-1].strip(_quotes).lower())
+    return names
+
+
+def woff2_only(body):
+    """ The @font-face with only its woff2 source, the one of every browser that defers CSS
+    """
+    src = _font_src_re.search(body)
+    if not src:
+        return body
+    sources = [s for s in src.group(1).split(",") if "woff2" in s]
+    return body[:src.start(1)] + sources[0].strip() + body[src.end(1):] if sources else body
+
+
+def critical_css(stylesheets, tokens, icon_fonts=()):
+    """ The critical CSS of a layout, from its (path, parsed rules) stylesheets
+    """
+    rules = []
+    at_rules = []
+    for _, items in stylesheets:
+        rules.extend(critical_rules(items, tokens))
+        at_rules.extend(item for item in items if item[0] == "at")
+    css = "".join(rules)
+    # The fonts and animations used by the critical rules, but the icon fonts: the icons
+    # can wait for the full stylesheets
+    families = declared_names(css, _font_family_re) - {f.lower() for f in icon_fonts}
+    animations = declared_names(css, _animation_re)
+    extra = []
+    for _, prelude, body in at_rules:
+        name = prelude[1:].split(None, 1)[0].lower()
+        if name == "font-face":
+            family = re.search(r"font-family\s*:\s*([^;]+)", body)
+            if family and family.group(1).strip().strip(_quotes).lower() in families:
+                extra.append(f"{prelude}{{{woff2_only(body)}}}")
+        elif name.endswith("keyframes") and prelude.split(None, 1)[-1].strip().lower() in animations:
+            extra.append(f"{prelude}{{{body}}}")
+    return minify_css("".join(extra) + css)
+
+
+def read_stylesheet(outdir, path):
+    """ The rules of a stylesheet of the output, with their url() relative to the root
+    """
+    folder = posixpath.dirname(path)
+    with open(os.path.join(outdir, path), encoding="utf-8") as f:
+        css = _css_comment_re.sub("", f.read())
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+        # Without the cache busting query, staticassets fingerprints the inlined urls too,
+        # so the fonts are the same files of the full stylesheets
+        path, _, fragment = url.partition("#")
+        path = posixpath.normpath(posixpath.join(folder, path.split("?", 1)[0]))
+        return f"url({quote}{ROOT}{path}{'#' + fragment if fragment else ''}{quote})"
+
+    return parse_css(_css_url_re.sub(replace, css))
+
+
+def restore(html):
+    """ The page as Sphinx wrote it, without the critical CSS of a previous build
+    """
+    html = _critical_re.sub("", html)
+    return _deferred_re.sub(r'<link rel="stylesheet" href="\1">', html)
+
+
+def stylesheet_path(outdir, page, href):
+    """ The path of a local stylesheet from the root of the output, None if it is not local
+    """
+    href = href.split("?", 1)[0].split("#", 1)[0]
+    if not href or href.startswith(("http:", "https:", "//", "/", "data:")):
+        return None
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(page), href))
+    # Maybe fingerprinted by staticassets in a previous build
+    original = _fingerprint_re.sub(r"\1", path)
+    if os.path.isfile(os.path.join(outdir, original)):
+        return original
+    return path if os.path.isfile(os.path.join(outdir, path)) else None
+
+
+def deferrable(link):
+    return "media=" not in link.lower() and "data-htmlminify" not in link
+
+
+def page_stylesheets(outdir, page, html):
+    head = html.split("</head>", 1)[0]
+    paths = []
+    for link in _stylesheet_re.findall(head):
+        href = _href_re.search(link)
+        path = stylesheet_path(outdir, page, href.group(1)) if href and deferrable(link) else None
+        if path is not None:
+            paths.append(path)
+    return paths
+
+
+def fold_tokens(html, fold_elements):
+    """ The tags, classes, ids and attributes of the elements before the body and its first elements
+    """
+    tokens = {"t:html", "t:body"}
+    start = html.find("<body")
+    fold = html.find(FOLD_MARKER, start)
+    remaining = None
+    for match in _tag_re.finditer(html, max(start, 0)):
+        if remaining is not None:
+            remaining -= 1
+            if remaining < 0:
+                break
+        elif fold == -1 or match.start() > fold:
+            remaining = fold_elements
+        tokens.add("t:" + match.group(1).lower())
+        for name, *values in _html_attribute_re.findall(match.group(2)):
+            name = name.lower()
+            value = next((v for v in values if v), "")
+            tokens.add("a:" + name)
+            if name == "id":
+                tokens.add("i:" + value)
+            elif name == "class":
+                tokens.update("c:" + c for c in value.split())
+            elif name == "type":
+                tokens.add("a:type=" + value.lower())
+    return sorted(tokens)
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def deferred_link(href):
+    return (f'<link rel="preload" href="{href}" as="style" '
+            f'onload="this.onload=null;this.rel=\'stylesheet\'" data-htmlminify>'
+            f'<noscript><link rel="stylesheet" href="{href}"></noscript>')
+
+
+def scan_page(args):
+    """ The stylesheets, fold tokens and sizes of a page, runs in a worker process: the size
+    written by Sphinx, minified, and the bytes added by deferring its stylesheets
+    """
+    outdir, page, fold_elements = args
+    with open(os.path.join(outdir, page), encoding="utf-8") as f:
+        html = restore(f.read())
+    minified = minify_html(html)
+    head = minified.split("</head>", 1)[0]
+    deferring = 0
+    for link in _stylesheet_re.findall(head):
+        href = _href_re.search(link)
+        if href and deferrable(link) and stylesheet_path(outdir, page, href.group(1)) is not None:
+            deferring += len(deferred_link(href.group(1))) - len(link)
+    return page, {"stylesheets": page_stylesheets(outdir, page, html),
+                  "tokens": fold_tokens(html, fold_elements),
+                  "size": len(html.encode("utf-8")),
+                  "minified": len(minified.encode("utf-8")),
+                  "deferring": deferring}
+
+
+def inline_size(css, page):
+    """ The bytes of the <style> with the critical CSS in a page
+    """
+    root = "../" * page.count("/")
+    return len(f"<style data-htmlminify>{css.replace(ROOT, root)}</style>".encode("utf-8"))
+
+
+def process_page(args):
+    """ Minifies a page and defers its stylesheets, runs in a worker process
+    """
+    outdir, page, critical = args
+    path = os.path.join(outdir, page)
+    with open(path, encoding="utf-8") as f:
+        original = f.read()
+    html = minify_html(restore(original))
+    if critical is not None:
+        root = "../" * page.count("/")
+        head, sep, rest = html.partition("</head>")
+        inserted = False
+
+        def defer(match):
+            nonlocal inserted
+            link = match.group(0)
+            href = _href_re.search(link)
+            if not href or not deferrable(link) or stylesheet_path(outdir, page, href.group(1)) is None:
+                return link
+            deferred = deferred_link(href.group(1))
+            if not inserted:
+                inserted = True
+                deferred = f"<style data-htmlminify>{critical.replace(ROOT, root)}</style>" + deferred
+            return deferred
+
+        html = _stylesheet_re.sub(defer, head) + sep + rest
+    if html != original:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+    return len(html.encode("utf-8"))
+
+
+def state_path(app):
+    # One state for every output folder
+    outdir = os.path.abspath(str(app.outdir))
+    name = hashlib.sha256(outdir.encode("utf-8")).hexdigest()[:16] + ".json"
+    return os.path.join(app.confdir, app.config.htmlminify_dir, name)
+
+
+def stage_key(app):
+    config = app.config
+    return json.dumps([VERSION, config.htmlminify_fold_elements, config.htmlminify_critical_css,
+                       config.htmlminify_critical_max_size, config.htmlminify_inline_budget,
+                       sorted(config.htmlminify_icon_fonts)])
+
+
+def load_state(app):
+    try:
+        with open(state_path(app), encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state["pages"] if state.get("key") == stage_key(app) else {}
+
+
+def output_pages(outdir):
+    pages = []
+    for root, _, files in os.walk(outdir):
+        for name in files:
+            if name.endswith(".html"):
+                pages.append(os.path.relpath(os.path.join(root, name), outdir).replace(os.sep, "/"))
+    return sorted(pages)
+
+
+def enabled(app):
+    return app.config.htmlminify_enabled and app.builder.name in ("html", "dirhtml")
+
+
+def minify_output(app, exception):
+    if exception is not None or not enabled(app):
+        return
+    start = time.monotonic()
+    outdir = str(app.outdir)
+    config = app.config
+    previous = load_state(app)
+
+    pages = {}
+    pending = []
+    for page in output_pages(outdir):
+        known = previous.get(page)
+        if known is not None and known["hash"] == file_digest(os.path.join(outdir, page)):
+            pages[page] = known
+        else:
+            pending.append(page)
+
+    jobs = app.parallel if app.parallel > 1 else os.cpu_count()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for page, info in executor.map(scan_page, [(outdir, p, config.htmlminify_fold_elements) for p in pending],
+                                       chunksize=8):
+            pages[page] = info
+
+        # The critical CSS of every layout, from the elements shared by all its pages
+        layouts = {}
+        for page, info in pages.items():
+            layouts.setdefault(tuple(info["stylesheets"]), []).append(page)
+        critical = {}
+        inlined_layouts = 0
+        for stylesheets, layout_pages in layouts.items():
+            critical[stylesheets] = None
+            if not stylesheets or not config.htmlminify_critical_css:
+                continue
+            tokens = set.intersection(*(set(pages[page]["tokens"]) for page in layout_pages))
+            parsed = [(path, read_stylesheet(outdir, path)) for path in stylesheets]
+            css = critical_css(parsed, tokens, config.htmlminify_icon_fonts)
+            if len(css.encode("utf-8")) > config.htmlminify_critical_max_size:
+                continue
+            # The bytes that inlining adds to the pages, net of the minification
+            growth = sum(pages[page]["minified"] - pages[page]["size"] + pages[page]["deferring"]
+                         + inline_size(css, page) for page in layout_pages)
+            if growth <= config.htmlminify_inline_budget * len(layout_pages):
+                critical[stylesheets] = css
+                inlined_layouts += 1
+
+        work = []
+        for page, info in pages.items():
+            css = critical[tuple(info["stylesheets"])]
+            info["critical"] = hashlib.sha256(css.encode("utf-8")).hexdigest() if css is not None else None
+            if page in pending or previous[page].get("critical") != info["critical"]:
+                work.append((outdir, page, css))
+        sizes = list(executor.map(process_page, work, chunksize=8))
+
+    app.builder._htmlminify_pages = pages
+    before = sum(pages[page]["size"] for _, page, _ in work)
+    after = sum(sizes)
+    change = after - before
+    logger.info(f"htmlminify: {len(work)} pages processed in {time.monotonic() - start:.2f}s, "
+                f"{before / 1024:.0f} KiB -> {after / 1024:.0f} KiB, "
+                f"net {change / 1024:+.0f} KiB "
+                f"({100 * change / before if before else 0:+.1f}%), critical CSS inlined in "
+                f"{inlined_layouts} of {len(layouts)} layouts (the rest over htmlminify_critical_max_size "
+                f"or htmlminify_inline_budget), {len(pages) - len(work)} unchanged pages skipped")
+
+
+def save_state(app, exception):
+    pages = getattr(app.builder, "_htmlminify_pages", None)
+    if exception is not None or pages is None:
+        return
+    # The final pages, after the rest of the build-finished handlers
+    outdir = str(app.outdir)
+    for page, info in pages.items():
+        info["hash"] = file_digest(os.path.join(outdir, page))
+    path = state_path(app)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"key": stage_key(app), "pages": pages}, f)
+    os.replace(tmp_path, path)
+
+
+def setup(app):
+    app.add_config_value('htmlminify_enabled', False, 'html')
+    app.add_config_value('htmlminify_critical_css', True, '')
+    app.add_config_value('htmlminify_fold_elements', 30, '')
+    # Bytes, about the first round trip of a new connection
+    app.add_config_value('htmlminify_critical_max_size', 14 * 1024, '')
+    # Bytes a page can grow, net of the minification, when the critical CSS is inlined
+    app.add_config_value('htmlminify_inline_budget', 0, '')
+    app.add_config_value('htmlminify_icon_fonts', ['FontAwesome', 'fontawesome-webfont'], '')
+    app.add_config_value('htmlminify_dir', '_build/.cache/htmlminify', '')
+
+    # After the handlers that write pages, before staticassets fingerprints and compresses them
+    app.connect('build-finished', minify_output, priority=800)
+    app.connect('build-finished', save_state, priority=999)
+
+    return {
+        'version': VERSION,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
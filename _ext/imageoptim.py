@@ -0,0 +1,205 @@
+"""
+Optimized images for the HTML output.
+
+PNG/JPEG images copied to ``_images`` are recompressed losslessly and get WebP
+variants in several widths (add "avif" to ``imageoptim_formats`` for AVIF ones,
+slower to encode and not smaller for our screenshots). The pages use them
+through ``<picture>`` with ``srcset`` and lazy loading. Every processed file is
+stored in a cache keyed by the content hash of the source image, so unchanged
+images are never processed again.
+
+Needs Pillow, without it the images are copied as they are.
+"""
+import hashlib
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from docutils import nodes
+from sphinx.util import logging
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+RASTER_SUFFIXES = (".png", ".jpg", ".jpeg")
+
+_sizes = {}
+
+
+def available_formats(config):
+    formats = []
+    for fmt in config.imageoptim_formats:
+        if Image is not None and features.check(fmt):
+            formats.append(fmt)
+    return formats
+
+
+def init_formats(app):
+    # features.check loads the codecs, once per build instead of once per image
+    app._imageoptim_formats = available_formats(app.config)
+
+
+def image_size(path):
+    if path not in _sizes:
+        try:
+            with Image.open(path) as img:
+                _sizes[path] = img.size
+        except (OSError, Image.DecompressionBombError):
+            _sizes[path] = None
+    return _sizes[path]
+
+
+def variant_widths(width, widths):
+    return sorted({w for w in widths if w < width} | {width})
+
+
+def variant_name(dest, width, fmt):
+    stem = os.path.splitext(dest)[0]
+    return f"{stem}-{width}w.{fmt}"
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def optimize_image(src_path, digest, widths, formats, quality, cache_dir):
+    """ Create the optimized original and all the variants in the cache, runs in a worker process
+    """
+    suffix = os.path.splitext(src_path)[1].lower()
+    optimized = os.path.join(cache_dir, f"{digest}{suffix}")
+    with Image.open(src_path) as img:
+        img.load()
+        if not os.path.exists(optimized):
+            tmp_path = optimized + ".tmp"
+            if suffix == ".png":
+                img.save(tmp_path, format="PNG", optimize=True)
+            else:
+                img.save(tmp_path, format="JPEG", quality="keep", optimize=True, progressive=True)
+            # Lossless recompression is not always smaller, keep the original then
+            if os.path.getsize(tmp_path) >= os.path.getsize(src_path):
+                shutil.copyfile(src_path, tmp_path)
+            os.replace(tmp_path, optimized)
+
+        # Palette images would be resized with the nearest neighbour, and
+        # CMYK cannot be saved as WebP
+        base = img if img.mode in ("RGB", "RGBA", "L") else img.convert("RGBA")
+        for width in variant_widths(img.width, widths):
+            for fmt in formats:
+                target = os.path.join(cache_dir, f"{digest}-{width}w.{fmt}")
+                if os.path.exists(target):
+                    continue
+                resized = base if width == img.width else \
+                    base.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+                # Screenshots (PNG) at full size compress better and keep the text sharp
+                # without loss, once resampled the lossy encoding is much smaller
+                lossless = fmt == "webp" and suffix == ".png" and width == img.width
+                resized.save(target + ".tmp", format=fmt.upper(), quality=quality, lossless=lossless,
+                             speed=8)
+                os.replace(target + ".tmp", target)
+
+
+def visit_image(self, node):
+    olduri = node['uri']
+    start = len(self.body)
+    type(self).visit_image(self, node)
+
+    formats = self.builder.app._imageoptim_formats
+    dest = self.builder.images.get(olduri)
+    if not formats or dest is None or not olduri.lower().endswith(RASTER_SUFFIXES):
+        return
+    size = image_size(os.path.join(self.builder.srcdir, olduri))
+    if size is None:
+        return
+
+    for i in range(start, len(self.body)):
+        if self.body[i].startswith("<img"):
+            break
+    else:
+        return
+    width = size[0]
+    img_tag = self.body[i].replace("<img ", '<img loading="lazy" decoding="async" ', 1)
+    sources = []
+    for fmt in reversed(formats):  # The browser picks the first supported, AVIF first
+        srcset = ", ".join(f"{self.builder.imgpath}/{variant_name(dest, w, fmt)} {w}w"
+                           for w in variant_widths(width, self.config.imageoptim_widths))
+        sources.append(f'<source type="image/{fmt}" srcset="{srcset}" '
+                       f'sizes="(max-width: {width}px) 100vw, {width}px" />')
+    self.body[i] = f"<picture>{''.join(sources)}{img_tag.rstrip()}</picture>\n"
+
+
+def depart_image(self, node):
+    type(self).depart_image(self, node)
+
+
+def optimize_images(app, exception):
+    if exception is not None or app.builder.format != "html" or not app._imageoptim_formats:
+        return
+    formats = app._imageoptim_formats
+    cache_dir = os.path.join(app.confdir, app.config.imageoptim_cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    images_dir = os.path.join(app.outdir, app.builder.imagedir)
+    widths = app.config.imageoptim_widths
+
+    images = []
+    for src, dest in app.builder.images.items():
+        if src.lower().endswith(RASTER_SUFFIXES):
+            src_path = os.path.join(app.srcdir, src)
+            # Pillow cannot read it, the pages keep the plain <img> and the copied original
+            if image_size(src_path) is None:
+                logger.warning(f"imageoptim: cannot read {src}, it is not optimized")
+                continue
+            images.append((src_path, dest, file_digest(src_path)))
+
+    def cached_files(src_path, dest, digest):
+        suffix = os.path.splitext(src_path)[1].lower()
+        files = {dest: os.path.join(cache_dir, f"{digest}{suffix}")}
+        for w in variant_widths(image_size(src_path)[0], widths):
+            for fmt in formats:
+                files[variant_name(dest, w, fmt)] = os.path.join(cache_dir, f"{digest}-{w}w.{fmt}")
+        return files
+
+    missing = [(src_path, digest) for src_path, dest, digest in images
+               if not all(os.path.exists(p) for p in cached_files(src_path, dest, digest).values())]
+    if missing:
+        jobs = app.parallel if app.parallel > 1 else os.cpu_count()
+        logger.info(f"imageoptim: processing {len(missing)} images with {jobs} workers")
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(optimize_image, src_path, digest, widths, formats,
+                                       app.config.imageoptim_quality, cache_dir)
+                       for src_path, digest in missing]
+            for future in futures:
+                future.result()
+
+    saved = 0
+    for src_path, dest, digest in images:
+        for name, cached in cached_files(src_path, dest, digest).items():
+            target = os.path.join(images_dir, name)
+            if name == dest:
+                saved += os.path.getsize(src_path) - os.path.getsize(cached)
+            shutil.copyfile(cached, target)
+    logger.info(f"imageoptim: {len(images)} images, {len(missing)} processed, {saved} bytes saved")
+
+
+def setup(app):
+    app.add_config_value('imageoptim_formats', ['webp'], 'html')
+    app.add_config_value('imageoptim_widths', [480, 960, 1440], 'html')
+    app.add_config_value('imageoptim_quality', 80, 'html')
+    app.add_config_value('imageoptim_cache_dir', '_build/.cache/images', '')
+
+    if Image is None:
+        logger.info("imageoptim: Pillow is not installed, images will not be optimized")
+    else:
+        app.add_node(nodes.image, override=True, html=(visit_image, depart_image))
+        app.connect('builder-inited', init_formats)
+        app.connect('build-finished', optimize_images)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
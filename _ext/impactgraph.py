@@ -0,0 +1,221 @@
+"""
+Dependency graph of the pages, for the change-impact analysis of ``impact.py``.
+
+At the end of every HTML build the graph is saved in ``_build/.cache/impact.json``:
+
+- The source, output page and images (with their ``imageoptim`` variants) of every
+  document.
+- Its dependencies: includes, literalincludes of ``examples/``, images...
+- The documents it links to, with any role or toctree (from the resolved doctrees).
+- The files of the Conan home that it shows (``conan-home-file``), with their hashes.
+- A fingerprint of the titles and toctrees of the sources and included files, as
+  changing them changes the navigation of every page.
+- The files that affect all the pages: conf.py, the extensions, templates, theme
+  and static files.
+
+Partial builds: with ``-D impactgraph_changes=<impact.py json output>`` only the
+documents in it are written (plus their toctree parents and the index, that Sphinx
+always writes). The search index of the output is incomplete then.
+"""
+import glob
+import hashlib
+import json
+import os
+import posixpath
+import re
+import sys
+import tempfile
+
+from docutils import nodes
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+GRAPH_VERSION = 1
+# Dependencies that can contain titles and toctrees of the pages that include them
+TEXT_SUFFIXES = (".rst", ".inc", ".txt")
+
+_title_re = re.compile(r"^(?:(?P<oc>[=\-`:'\"~^_*+#<>])(?P=oc)+\n)?(?P<title>\S.*)\n"
+                       r"(?P<under>(?P<uc>[=\-`:'\"~^_*+#<>])(?P=uc)+)$", re.MULTILINE)
+_toctree_re = re.compile(r"^(?P<indent>[ \t]*)\.\. toctree::.*\n(?P<body>(?:(?P=indent)[ \t]+.*\n|[ \t]*\n)*)",
+                         re.MULTILINE)
+
+_pages = {}
+_references = {}
+_images = {}
+
+
+def structure_fingerprint(path):
+    """ A hash of the section titles and toctrees of a file, None if it cannot be read
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    titles = [m.group("title").strip() for m in _title_re.finditer(text)
+              if len(m.group("under")) >= len(m.group("title").strip())]
+    toctrees = [[line.strip() for line in m.group("body").splitlines() if line.strip()]
+                for m in _toctree_re.finditer(text)]
+    return hashlib.sha256(json.dumps([titles, toctrees]).encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def load_graph(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            graph = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return graph if graph.get("version") == GRAPH_VERSION else None
+
+
+def graph_path(app):
+    return os.path.join(app.confdir, app.config.impactgraph_file)
+
+
+def collect_links(app, doctree, docname):
+    """ The documents linked from a resolved doctree, and its images
+    """
+    builder = app.builder
+    if builder.name not in ("html", "dirhtml"):
+        return
+    if not _pages:
+        _pages.update((builder.get_target_uri(d), d) for d in app.env.found_docs)
+    base = posixpath.dirname(builder.get_target_uri(docname))
+    targets = set()
+    for node in doctree.findall(nodes.reference):
+        uri = node.get("refuri")
+        if not node.get("internal") or not uri:
+            continue
+        uri = uri.split("#", 1)[0]
+        target = _pages.get(posixpath.normpath(posixpath.join(base, uri)) if uri else None)
+        if target is not None and target != docname:
+            targets.add(target)
+    _references[docname] = sorted(targets)
+    _images[docname] = sorted({node["uri"] for node in doctree.findall(nodes.image)})
+
+
+def image_outputs(app, sources):
+    """ The files of the images in the output, with the variants created by imageoptim
+    """
+    builder = app.builder
+    outputs = []
+    for source in sources:
+        name = builder.images.get(source)
+        if name is None:
+            continue
+        stem = os.path.splitext(name)[0]
+        outputs.append(posixpath.join(builder.imagedir, name))
+        for variant in sorted(glob.glob(os.path.join(app.outdir, builder.imagedir, glob.escape(stem) + "-*w.*"))):
+            outputs.append(posixpath.join(builder.imagedir, os.path.basename(variant)))
+    return outputs
+
+
+def global_paths(app):
+    config = app.config
+    paths = [os.path.join(app.confdir, "conf.py"), os.path.join(app.confdir, "requirements.txt")]
+    for folder in (list(config.templates_path) + list(config.html_static_path)
+                   + list(getattr(config, "html_theme_path", []))):
+        paths.append(os.path.join(app.confdir, folder) + os.sep)
+    for extension in app.extensions:
+        path = getattr(sys.modules.get(extension), "__file__", None)
+        if path and os.path.abspath(path).startswith(os.path.abspath(app.confdir) + os.sep):
+            paths.append(os.path.dirname(path) + os.sep)
+    result = set()
+    for path in paths:
+        rel = os.path.relpath(path, app.srcdir).replace(os.sep, "/")
+        result.add(rel + "/" if path.endswith(os.sep) else rel)
+    return sorted(result)
+
+
+def save_graph(app, exception):
+    if exception is not None or app.builder.name not in ("html", "dirhtml") or not app.config.impactgraph_enabled:
+        return
+    env = app.env
+    builder = app.builder
+    path = graph_path(app)
+    previous = (load_graph(path) or {}).get("docs", {})
+
+    docs = {}
+    structure = {}
+    for docname in sorted(env.found_docs):
+        source = env.doc2path(docname, False).replace(os.sep, "/")
+        dependencies = sorted(d.replace(os.sep, "/") for d in env.dependencies.get(docname, ()))
+        old = previous.get(docname, {})
+        docs[docname] = {
+            "source": source,
+            "page": os.path.relpath(builder.get_outfilename(docname), app.outdir).replace(os.sep, "/"),
+            "structure": structure_fingerprint(os.path.join(app.srcdir, source)),
+            "dependencies": dependencies,
+            # Only known for the documents written in this build
+            "references": _references.get(docname, old.get("references", [])),
+            "images": image_outputs(app, _images[docname]) if docname in _images else old.get("images", []),
+        }
+        for dep in dependencies:
+            if dep.endswith(TEXT_SUFFIXES) and dep not in structure:
+                structure[dep] = structure_fingerprint(os.path.join(app.srcdir, dep))
+
+    external = {}
+    for docname, hashes in getattr(env, "conanhomefile_hashes", {}).items():
+        for file_path, digest in hashes.items():
+            external.setdefault(file_path, {"hash": digest, "docs": []})["docs"].append(docname)
+
+    graph = {"version": GRAPH_VERSION, "builder": builder.name, "docs": docs, "structure": structure,
+             "external": external, "global": global_paths(app)}
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(graph, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+    logger.info(f"impactgraph: graph of {len(docs)} documents saved")
+    # Autobuild runs more builds in the same process
+    _pages.clear()
+    _references.clear()
+    _images.clear()
+
+
+def limit_writes(app):
+    """ Partial build: only write the documents of the impact analysis
+    """
+    if not app.config.impactgraph_changes:
+        return
+    with open(os.path.join(app.confdir, app.config.impactgraph_changes), encoding="utf-8") as f:
+        changes = json.load(f)
+    if changes["full"]:
+        logger.info("impactgraph: partial build requested, but all the pages are affected")
+        return
+    wanted = set(changes["docs"])
+    logger.info(f"impactgraph: partial build, writing {len(wanted)} documents")
+    write = app.builder.write
+
+    def partial_write(build_docnames, updated_docnames, method='update'):
+        # Also the unchanged documents of the analysis, as the pages linking to a changed one
+        write(sorted(wanted & app.env.found_docs), [d for d in updated_docnames if d in wanted], method)
+
+    app.builder.write = partial_write
+
+
+def setup(app):
+    app.add_config_value('impactgraph_enabled', True, '')
+    app.add_config_value('impactgraph_file', '_build/.cache/impact.json', '')
+    app.add_config_value('impactgraph_changes', '', '')
+
+    app.connect('builder-inited', limit_writes)
+    app.connect('doctree-resolved', collect_links)
+    # After imageoptim created the variants of the images
+    app.connect('build-finished', save_graph, priority=900)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,115 @@
+"""
+LaTeX output split in one file per chapter, for incremental PDF builds.
+
+At the end of the latex build, the body of every document of ``latex_documents``
+is split in its chapters (the documents in the toctree of the start document),
+that are written to ``chapters/<target>-<docname>.tex`` and included from the
+main file with ``\\include``. A chapter file is only written when its content
+changes, and ``<target>.chapters.json`` lists the chapters with the hashes of
+their content and the LaTeX engine.
+
+With ``\\include`` LaTeX keeps the labels, page numbers and counters of every
+chapter in its own ``.aux``: ``latexpdf.py`` uses it to typeset the changed
+chapters alone, in parallel, before the final run over the whole document, and
+to skip the compilation when nothing changed.
+"""
+import hashlib
+import json
+import os
+import re
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+CHAPTERS_DIR = "chapters"
+
+_chapter_re = re.compile(r"^(?:\\sphinxstepscope\n+)?\\chapter\{", re.MULTILINE)
+_docname_re = re.compile(r"\\label\{\\detokenize\{([^}]*)::doc\}\}")
+# The end of the body in sphinx/templates/latex/latex.tex_t
+_footer_re = re.compile(r"^\\renewcommand\{\\indexname\}", re.MULTILINE)
+
+
+def chapter_name(target, docname):
+    return re.sub(r"[^A-Za-z0-9_-]", "-", f"{os.path.splitext(target)[0]}-{docname}")
+
+
+def split_chapters(target, tex):
+    """ The main file, with the chapters replaced by \\include, and the (name, content) chapters
+    """
+    begin = tex.find("\\begin{document}")
+    starts = [m.start() for m in _chapter_re.finditer(tex, max(begin, 0))]
+    if begin == -1 or not starts:
+        return tex, []
+    footer = _footer_re.search(tex, starts[-1])
+    end = footer.start() if footer else tex.rindex("\\end{document}")
+    chapters = []
+    includes = []
+    for start, stop in zip(starts, starts[1:] + [end]):
+        content = tex[start:stop]
+        docname = _docname_re.search(content)
+        name = chapter_name(target, docname.group(1) if docname else str(len(chapters)))
+        if any(name == n for n, _ in chapters):
+            name = f"{name}-{len(chapters)}"
+        chapters.append((name, content))
+        includes.append(f"\\include{{{CHAPTERS_DIR}/{name}}}\n")
+    return tex[:starts[0]] + "".join(includes) + "\n" + tex[end:], chapters
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def split_documents(app, exception):
+    if exception is not None or app.builder.name != "latex" or not app.config.latexchapters_enabled:
+        return
+    outdir = str(app.outdir)
+    folder = os.path.join(outdir, CHAPTERS_DIR)
+    os.makedirs(folder, exist_ok=True)
+    for entry in app.config.latex_documents:
+        target = entry[1]
+        path = os.path.join(outdir, target)
+        if not os.path.isfile(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            tex = f.read()
+        main, chapters = split_chapters(target, tex)
+        if not chapters:
+            continue
+        written = 0
+        manifest = []
+        for name, content in chapters:
+            written += write_if_changed(os.path.join(folder, name + ".tex"), content)
+            manifest.append({"name": name, "hash": hashlib.sha256(content.encode("utf-8")).hexdigest()})
+        # The chapters of previous builds that are gone, with their aux
+        current = {name for name, _ in chapters}
+        prefix = chapter_name(target, "")
+        for file_name in os.listdir(folder):
+            stem, ext = os.path.splitext(file_name)
+            if stem.startswith(prefix) and stem not in current and ext in (".tex", ".aux"):
+                os.remove(os.path.join(folder, file_name))
+        write_if_changed(path, main)
+        stem = os.path.splitext(path)[0]
+        write_if_changed(stem + ".chapters.json", json.dumps({"engine": app.config.latex_engine,
+                                                               "chapters": manifest}, indent=1))
+        logger.info(f"latexchapters: {target} split in {len(chapters)} chapters, {written} changed")
+
+
+def setup(app):
+    app.add_config_value('latexchapters_enabled', True, '')
+
+    app.connect('build-finished', split_documents)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,227 @@
+"""
+Incremental linkcheck builder.
+
+Replaces the ``linkcheck`` builder with one that keeps the results in a store
+(``_build/.cache/linkcheck.json``) and only checks again the links that are new
+or whose result is older than the TTL of its status: working links are trusted
+for a week, redirects for some days, and broken ones are always checked again.
+Add ``-D linkcheckcache_refresh=1`` to check everything.
+
+The links are grouped by host. Every host gets a few workers (``linkcheck_workers``
+is the total), that keep their connections alive and wait ``delay`` seconds
+between requests to the same host, configurable per host::
+
+    linkcheckcache_hosts = {'github.com': {'workers': 2, 'delay': 0.5}}
+
+The lanes per host use internals of the Sphinx linkcheck workers, so they are
+only enabled with the Sphinx versions in ``HOST_LANES_SPHINX``; with any other
+the links are checked by the stock checker, still with the cached results.
+
+The output (``output.txt``, ``output.json`` and the console) is the same of the
+regular builder, cached results included.
+"""
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import sphinx
+from sphinx.builders.linkcheck import (CheckExternalLinksBuilder, CheckResult,
+                                       HyperlinkAvailabilityChecker, HyperlinkAvailabilityCheckWorker)
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+# Statuses that come from a request to the server, the rest are decided locally
+CACHED_STATUSES = ("working", "redirected", "broken")
+# Sphinx versions whose HyperlinkAvailabilityCheckWorker has the _check() and _session that
+# HostAwareChecker uses, [first, last)
+HOST_LANES_SPHINX = ((7, 2), (7, 3))
+
+
+def load_store(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_store(path, store):
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(store, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def expiration(uri, entry, ttls):
+    ttl = ttls.get(entry["status"], 0)
+    # Up to a 20% more, so the links checked in the same run do not expire together
+    # and the runs after a full check stay small
+    spread = int(hashlib.sha256(uri.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return entry["checked"] + ttl * (1 + 0.2 * spread)
+
+
+class HostLimit:
+    """ Spaces the requests to a host at least ``delay`` seconds
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.next_request = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.delay
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HostAwareChecker(HyperlinkAvailabilityChecker):
+    """ Checks the links grouped by host, with a pool of keep-alive connections per host
+    """
+    def host_settings(self, netloc):
+        settings = {"workers": self.config.linkcheckcache_host_workers,
+                    "delay": self.config.linkcheckcache_host_delay}
+        settings.update(self.config.linkcheckcache_hosts.get(netloc, {}))
+        return settings
+
+    def check(self, hyperlinks):
+        hosts = {}
+        total_links = 0
+        for hyperlink in hyperlinks.values():
+            if self.is_ignored_uri(hyperlink.uri):
+                yield CheckResult(hyperlink.uri, hyperlink.docname, hyperlink.lineno, 'ignored', '', 0)
+            else:
+                hosts.setdefault(urlsplit(hyperlink.uri).netloc, []).append(hyperlink)
+                total_links += 1
+
+        if not hosts:
+            return
+        results = queue.Queue()
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            # The busiest hosts first, they take longer
+            for netloc, links in sorted(hosts.items(), key=lambda h: -len(h[1])):
+                settings = self.host_settings(netloc)
+                pending = queue.Queue()
+                for link in links:
+                    pending.put(link)
+                limit = HostLimit(settings["delay"])
+                for _ in range(max(1, min(settings["workers"], len(links)))):
+                    executor.submit(self.run_lane, pending, limit, results)
+
+            for _ in range(total_links):
+                yield results.get()
+
+    def run_lane(self, pending, limit, results):
+        """ Checks links of a single host, reusing the same session (and connections) for all of them
+        """
+        retry = queue.Queue()
+        worker = HyperlinkAvailabilityCheckWorker(self.config, results, retry, self.rate_limits)
+        try:
+            while True:
+                try:
+                    hyperlink = pending.get_nowait()
+                except queue.Empty:
+                    break
+                results.put(self.check_link(worker, retry, limit, hyperlink))
+        finally:
+            worker._session.close()
+
+    @staticmethod
+    def check_link(worker, retry, limit, hyperlink):
+        uri, docname, _, lineno = hyperlink
+        while True:
+            limit.wait()
+            try:
+                status, info, code = worker._check(docname, uri, hyperlink)
+            except Exception as e:
+                status, info, code = 'broken', str(e), 0
+            if status != 'rate-limited':
+                return CheckResult(uri, docname, lineno, status, info, code)
+            # The worker queued the link again with the time to retry, as told by the server
+            next_check, _ = retry.get_nowait()
+            logger.info(f"-rate limited-   {uri} | sleeping {next_check - time.time():.0f}s...")
+            time.sleep(max(0, next_check - time.time()))
+
+
+def checker_class(version_info=sphinx.version_info):
+    first, last = HOST_LANES_SPHINX
+    if first <= tuple(version_info[:2]) < last:
+        return HostAwareChecker
+    logger.info(f"linkcheckcache: no lanes per host with Sphinx {sphinx.__display_version__}, "
+                f"using the default checker")
+    return HyperlinkAvailabilityChecker
+
+
+class CachedCheckExternalLinksBuilder(CheckExternalLinksBuilder):
+    name = 'linkcheck'
+
+    def store_path(self):
+        return os.path.join(self.app.confdir, self.config.linkcheckcache_file)
+
+    def finish(self):
+        store = {} if self.config.linkcheckcache_refresh else load_store(self.store_path())
+        ttls = self.config.linkcheckcache_ttl
+        now = time.time()
+
+        cached, outdated = [], {}
+        for uri, hyperlink in self.hyperlinks.items():
+            entry = store.get(uri)
+            if entry is not None and expiration(uri, entry, ttls) > now:
+                cached.append(CheckResult(uri, hyperlink.docname, hyperlink.lineno,
+                                          entry["status"], entry["info"], entry["code"]))
+            else:
+                outdated[uri] = hyperlink
+        logger.info(f"linkcheckcache: {len(cached)} links cached, {len(outdated)} to check")
+
+        checker = checker_class()(self.config)
+        output_text = os.path.join(self.outdir, 'output.txt')
+        output_json = os.path.join(self.outdir, 'output.json')
+        with open(output_text, 'w', encoding='utf-8') as self.txt_outfile, \
+             open(output_json, 'w', encoding='utf-8') as self.json_outfile:
+            for result in cached:
+                self.process_result(result)
+            try:
+                for result in checker.check(outdated):
+                    self.process_result(result)
+                    if result.status in CACHED_STATUSES and result.uri.startswith(("http:", "https:")):
+                        store[result.uri] = {"status": result.status, "info": result.message,
+                                             "code": result.code, "checked": time.time()}
+            finally:
+                # Keep what was checked, even if interrupted. Drop the links not checked for long
+                # that are not in these docs anymore
+                oldest = now - self.config.linkcheckcache_keep_days * DAY
+                save_store(self.store_path(), {k: v for k, v in store.items()
+                                               if k in self.hyperlinks or v["checked"] > oldest})
+
+        if self.broken_hyperlinks:
+            self.app.statuscode = 1
+
+
+def setup(app):
+    app.add_config_value('linkcheckcache_file', '_build/.cache/linkcheck.json', '')
+    app.add_config_value('linkcheckcache_refresh', False, '')
+    app.add_config_value('linkcheckcache_ttl', {'working': 7 * DAY, 'redirected': 3 * DAY, 'broken': 0}, '')
+    app.add_config_value('linkcheckcache_keep_days', 60, '')
+    app.add_config_value('linkcheckcache_host_workers', 4, '')
+    app.add_config_value('linkcheckcache_host_delay', 0.0, '')
+    app.add_config_value('linkcheckcache_hosts', {}, '')
+
+    app.add_builder(CachedCheckExternalLinksBuilder, override=True)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,184 @@
+"""
+Redirects for moved and removed pages.
+
+Every HTML build records its documents (with their titles and labels) in
+``_build/.cache/redirects-<builder>.json``. When a document of the previous
+build is not there anymore, it gets a redirect to the document that now has its
+labels, its title or its file name, or else to the index of its folder. These
+redirects are kept in the state for the next builds, together with the manual
+ones of the ``redirects`` setting (old page -> new URL, as in the output).
+
+The output gets:
+
+- ``_redirects``: a 301 rule per line (``/2/old.html /2/new.html 301``) for
+  Netlify, Cloudflare Pages and alike.
+- ``redirects.map``: ``"/2/old.html" "/2/new.html";`` entries for a nginx map::
+
+      map $uri $conan_docs_redirect { include redirects.map; }
+      if ($conan_docs_redirect) { return 301 $conan_docs_redirect; }
+
+- A stub page at the old path, for servers without those, that redirects without
+  delay. Stubs are only written when their content changes.
+"""
+import json
+import os
+import posixpath
+import tempfile
+from urllib.parse import urlsplit
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+STUB_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Redirecting...</title>
+    <link rel="canonical" href="{url}">
+    <meta name="robots" content="noindex">
+    <meta http-equiv="refresh" content="0; url={url}">
+    <script>window.location.replace("{url}" + window.location.hash);</script>
+</head>
+<body>
+    <p>This page has moved to <a href="{url}">{url}</a>.</p>
+</body>
+</html>
+"""
+
+
+def state_path(app):
+    return os.path.join(app.confdir, app.config.redirects_cache_dir, f"redirects-{app.builder.name}.json")
+
+
+def load_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"documents": {}, "redirects": {}}
+
+
+def save_state(path, state):
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def current_documents(env):
+    labels = {}
+    for label, (docname, _, _) in env.domaindata["std"]["labels"].items():
+        labels.setdefault(docname, []).append(label)
+    return {docname: {"title": env.titles[docname].astext() if docname in env.titles else "",
+                      "labels": sorted(labels.get(docname, []))}
+            for docname in env.found_docs}
+
+
+def new_location(old, info, documents, master_doc):
+    """ The document that replaces a removed one: the one with its labels, its title or
+    its file name, or the index of the nearest folder
+    """
+    old_labels = set(info["labels"])
+    if old_labels:
+        best = max(documents, key=lambda d: len(old_labels & set(documents[d]["labels"])))
+        if old_labels & set(documents[best]["labels"]):
+            return best
+    for match in (lambda d: info["title"] and documents[d]["title"] == info["title"],
+                  lambda d: posixpath.basename(d) == posixpath.basename(old),
+                  lambda d: d.endswith("/index") and posixpath.basename(posixpath.dirname(d)) == posixpath.basename(old)):
+        candidates = sorted(d for d in documents if match(d))
+        if len(candidates) == 1:
+            return candidates[0]
+    folder = posixpath.dirname(old)
+    while folder:
+        if f"{folder}/index" in documents:
+            return f"{folder}/index"
+        folder = posixpath.dirname(folder)
+    return master_doc
+
+
+def update_redirects(state, documents, master_doc):
+    """ Adds the redirects of the documents removed since the previous build, returns the new ones
+    """
+    redirects = state["redirects"]
+    added = {}
+    for old, info in state["documents"].items():
+        if old not in documents and old not in redirects:
+            added[old] = new_location(old, info, documents, master_doc)
+    redirects.update(added)
+    # Follow the chains of moves, and forget the documents that exist again
+    for old in list(redirects):
+        if old in documents:
+            del redirects[old]
+            continue
+        target, seen = redirects[old], {old}
+        while target in redirects and target not in seen:
+            seen.add(target)
+            target = redirects[target]
+        redirects[old] = target
+    state["documents"] = documents
+    return added
+
+
+def write_if_changed(path, content):
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+
+def generate_redirects(app, exception):
+    if exception is not None or app.builder.name not in ("html", "dirhtml"):
+        return
+    builder = app.builder
+    path = state_path(app)
+    state = load_state(path)
+    added = update_redirects(state, current_documents(app.env), app.config.master_doc)
+    for old, new in sorted(added.items()):
+        logger.info(f"redirects: {old} was removed, redirected to {new}")
+    save_state(path, state)
+
+    # old output file -> target, relative to the output root
+    rules = {builder.get_target_uri(old): builder.get_target_uri(new) for old, new in state["redirects"].items()}
+    rules.update(app.config.redirects)
+    base = urlsplit(app.config.html_baseurl).path.rstrip("/") + "/" if app.config.html_baseurl else "/"
+
+    def absolute(url):
+        return url if urlsplit(url).scheme or url.startswith("/") else base + url
+
+    written = 0
+    for old, new in rules.items():
+        filename = old + "index.html" if old.endswith("/") or not old else old
+        # Relative, so the stubs work wherever the docs are served from
+        url = new if urlsplit(new).scheme or new.startswith("/") else \
+            posixpath.relpath(new or ".", posixpath.dirname(filename) or ".")
+        if new.endswith("/") and not url.endswith("/"):
+            url += "/"
+        written += write_if_changed(os.path.join(app.outdir, filename), STUB_TEMPLATE.format(url=url))
+
+    with open(os.path.join(app.outdir, "_redirects"), "w", encoding="utf-8") as f:
+        f.writelines(f"{absolute(old)} {absolute(new)} 301\n" for old, new in sorted(rules.items()))
+    with open(os.path.join(app.outdir, "redirects.map"), "w", encoding="utf-8") as f:
+        f.writelines(f'"{absolute(old)}" "{absolute(new)}";\n' for old, new in sorted(rules.items()))
+    logger.info(f"redirects: {len(rules)} redirects, {written} stub pages written")
+
+
+def setup(app):
+    app.add_config_value('redirects', {}, 'html')
+    app.add_config_value('redirects_cache_dir', '_build/.cache', '')
+    app.connect('build-finished', generate_redirects)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,107 @@
+"""
+Sharded search index for the HTML output.
+
+After Sphinx dumps ``searchindex.js``, its terms and title terms are split by
+their first characters in ``_search/<prefix>.<hash>.json`` shards, and the rest
+of the index (documents, titles, objects...) goes to ``_search/manifest.json``.
+The search page of the conan theme then downloads just the manifest and the
+shards of the words in the query, instead of the whole index.
+
+Partial matches are only found among the terms starting like the query word.
+``searchindex.js`` is still generated, as fallback (e.g. for ``file://`` pages).
+"""
+import hashlib
+import json
+import os
+
+from sphinx.util import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_PREFIX = "Search.setIndex("
+INDEX_SUFFIX = ")"
+
+
+def split_index(index, prefix_length):
+    shards = {}
+    for kind in ("terms", "titleterms"):
+        for term, docs in index.pop(kind).items():
+            shard = shards.setdefault(term[:prefix_length], {"terms": {}, "titleterms": {}})
+            shard[kind][term] = docs
+    return shards
+
+
+def write_shards(app, exception):
+    if exception is not None or app.builder.format != "html" or not app.config.searchshards_enabled:
+        return
+    index_path = os.path.join(app.outdir, "searchindex.js")
+    if not os.path.exists(index_path):
+        return
+    with open(index_path, encoding="utf-8") as f:
+        content = f.read()
+    if not content.startswith(INDEX_PREFIX) or not content.endswith(INDEX_SUFFIX):
+        logger.warning("searchshards: unexpected searchindex.js format, the search page will use it as is")
+        return
+    index = json.loads(content[len(INDEX_PREFIX):-len(INDEX_SUFFIX)])
+
+    folder = os.path.join(app.outdir, "_search")
+    os.makedirs(folder, exist_ok=True)
+
+    prefix_length = app.config.searchshards_prefix_length
+    shard_files = {}
+    written = 0
+    for key, shard in split_index(index, prefix_length).items():
+        data = json.dumps(shard, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        # Content hashed names, the browser can cache them for good. The existing ones are
+        # kept as they are, so staticassets does not compress them again
+        name = f"shard-{key.encode('utf-8').hex()}.{hashlib.sha256(data).hexdigest()[:10]}.json"
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(data)
+            written += 1
+        shard_files[key] = name
+
+    manifest = json.dumps(dict(index, prefix=prefix_length, shards=shard_files),
+                          separators=(",", ":"), sort_keys=True)
+    manifest_path = os.path.join(folder, "manifest.json")
+    if read_file(manifest_path) != manifest:
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            f.write(manifest)
+
+    # The shards of previous builds, with their compressed copies
+    current = set(shard_files.values()) | {"manifest.json"}
+    removed = 0
+    for name in os.listdir(folder):
+        base = name[:-len(".gz")] if name.endswith(".gz") else name[:-len(".br")] if name.endswith(".br") else name
+        if base not in current:
+            os.remove(os.path.join(folder, name))
+            removed += name == base
+    logger.info(f"searchshards: {len(shard_files)} shards, {written} written, {removed} removed")
+
+
+def read_file(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def add_context(app, pagename, templatename, context, doctree):
+    if pagename == "search":
+        context["search_shards"] = app.config.searchshards_enabled
+
+
+def setup(app):
+    app.add_config_value('searchshards_enabled', True, 'html')
+    app.add_config_value('searchshards_prefix_length', 2, 'html')
+
+    app.connect('html-page-context', add_context)
+    app.connect('build-finished', write_shards)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,256 @@
+"""
+Incremental spelling builder.
+
+Replaces the ``spelling`` builder of sphinxcontrib.spelling with one that stores
+the misspellings of every document in ``_build/.cache/spelling``, keyed by a
+hash of the text to check, the words accepted in the document, the word list,
+the dictionary and the spelling configuration. Only the documents whose key is
+not in the cache are checked, in a pool of worker processes, so the time of a
+run is proportional to what changed. The ``.spelling`` reports and the console
+output are the same of the regular builder.
+
+The contributors read from the git history are collected once per run, instead
+of once per checked paragraph.
+"""
+import collections
+import functools
+import glob
+import hashlib
+import importlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import docutils.utils
+from sphinx.util import logging, osutil
+from sphinx.util.console import red
+from sphinx.util.matching import Matcher
+from sphinx.util.osutil import ensuredir
+from sphinxcontrib.spelling import builder, checker, filters
+
+logger = logging.getLogger(__name__)
+
+# Where the hunspell/myspell dictionaries used by enchant usually are
+DICTIONARY_DIRS = ["/usr/share/hunspell", "/usr/share/myspell", "/usr/share/myspell/dicts",
+                   "/usr/local/share/hunspell", "/Library/Spelling", "~/Library/Spelling",
+                   "~/.config/enchant", "~/.config/enchant/hunspell"]
+
+_checker = None
+
+
+def filter_spec(spelling_filter):
+    """ A filter as plain data for the worker processes, that may not be forked: the words it
+    ignores or the import path of its class. None if it cannot be imported by name
+    """
+    if isinstance(spelling_filter, filters.IgnoreWordsFilterFactory):
+        return ["words", sorted(spelling_filter.words)]
+    spec = ["class", getattr(spelling_filter, "__module__", ""), getattr(spelling_filter, "__qualname__", "")]
+    try:
+        return spec if load_filter(spec) is spelling_filter else None
+    except (ImportError, AttributeError, ValueError):
+        return None
+
+
+def load_filter(spec):
+    kind, *values = spec
+    if kind == "words":
+        return filters.IgnoreWordsFilterFactory(values[0])
+    module_name, qualname = values
+    return functools.reduce(getattr, qualname.split("."), importlib.import_module(module_name))
+
+
+def init_checker(checker_args):
+    global _checker
+    _checker = checker.SpellingChecker(**dict(checker_args,
+                                              filters=[load_filter(s) for s in checker_args["filters"]]))
+
+
+def check_document(args):
+    """ Returns the misspellings of the text nodes of a document, runs in a worker process
+    """
+    items, good_words = args
+    _checker.push_filters([filters.IgnoreWordsFilterFactory(good_words)] if good_words else [])
+    misspellings = []
+    for source, lineno, text in items:
+        for word, suggestions, context_line, line_offset in _checker.check(text):
+            misspellings.append((source, lineno + line_offset if lineno is not None else None,
+                                 word, suggestions, context_line))
+    _checker.pop_filters()
+    return misspellings
+
+
+def dictionary_files(tag):
+    files = []
+    for folder in DICTIONARY_DIRS:
+        files.extend(glob.glob(os.path.join(os.path.expanduser(folder), f"{tag}.*")))
+    return [(f, os.path.getsize(f), os.path.getmtime(f)) for f in sorted(files)]
+
+
+class CachedSpellingBuilder(builder.SpellingBuilder):
+
+    def init(self):
+        if builder.enchant_import_error is not None:
+            raise RuntimeError('Cannot initialize spelling builder '
+                               'without PyEnchant installed') from builder.enchant_import_error
+        self.misspelling_count = 0
+        self.env.settings["smart_quotes"] = False
+        if not hasattr(self.env, 'spelling_document_words'):
+            self.env.spelling_document_words = collections.defaultdict(list)
+        os.makedirs(self.outdir, exist_ok=True)
+
+        self.contributors = set()
+        if self.config.spelling_ignore_contributor_names:
+            logger.info('Ignoring contributor names')
+            # An instance just to run its git query, without the tokenizer
+            contributor_filter = filters.ContributorFilter.__new__(filters.ContributorFilter)
+            self.contributors = contributor_filter._get_contributors()
+        word_list = self.get_wordlist_filename()
+        logger.info('Looking for custom word list in %s', word_list)
+        filter_classes = self.filter_classes()
+        self.checker_args = {"lang": self.config.spelling_lang,
+                             "tokenizer_lang": self.config.tokenizer_lang,
+                             "suggest": self.config.spelling_show_suggestions,
+                             "word_list_filename": word_list,
+                             "filters": [filter_spec(f) for f in filter_classes],
+                             "context_line": self.config.spelling_show_whole_line}
+        self.checker = checker.SpellingChecker(**dict(self.checker_args, filters=filter_classes))
+        self.cache_key = self.compute_cache_key(word_list)
+        self.documents = []
+
+    def filter_classes(self):
+        # The same filters of sphinxcontrib.spelling, but the contributors are looked up just once
+        f = [filters.ContractionFilter, builder.EmailFilter]
+        if self.config.spelling_ignore_wiki_words:
+            f.append(builder.WikiWordFilter)
+        if self.config.spelling_ignore_acronyms:
+            f.append(filters.AcronymFilter)
+        if self.config.spelling_ignore_pypi_package_names:
+            logger.info('Adding package names from PyPI to local dictionary…')
+            f.append(filters.PyPIFilterFactory())
+        if self.config.spelling_ignore_python_builtins:
+            f.append(filters.PythonBuiltinsFilter)
+        if self.config.spelling_ignore_importable_modules:
+            f.append(filters.ImportableModuleFilter)
+        if self.contributors:
+            f.append(filters.IgnoreWordsFilterFactory(self.contributors))
+        f.extend(self._load_filter_classes(self.config.spelling_filters))
+        return f
+
+    def compute_cache_key(self, word_list):
+        dictionary = self.checker.dictionary
+        with open(word_list, "rb") as f:
+            words = f.read()
+        key = {"words": hashlib.sha256(words).hexdigest(),
+               "dictionary": [dictionary.tag, dictionary.provider.name, dictionary.provider.file,
+                              dictionary_files(dictionary.tag)],
+               "contributors": sorted(self.contributors),
+               "config": {c.name: repr(c.value) for c in self.config
+                          if c.name.startswith("spelling_") or c.name == "tokenizer_lang"}}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def cache_folder(self):
+        return os.path.join(self.app.confdir, self.config.spellingcache_dir)
+
+    def text_items(self, doctree):
+        def text_filter(n):
+            if n.tagname != '#text':
+                return False
+            if n.parent and n.parent.tagname not in self.TEXT_NODES:
+                return False
+            # Nodes marked by the spelling:ignore role
+            return not hasattr(n, "spellingIgnore")
+
+        items = []
+        for node in doctree.findall(text_filter):
+            source, lineno = docutils.utils.get_source_line(node)
+            items.append((osutil.relpath(source), lineno, node.astext()))
+        return items
+
+    def write_doc(self, docname, doctree):
+        # Only collect the texts here, they are checked all together at finish()
+        if Matcher(self.config.spelling_exclude_patterns)(self.env.doc2path(docname, None)):
+            return
+        items = self.text_items(doctree)
+        good_words = sorted(set(self.env.spelling_document_words.get(docname, [])))
+        key = hashlib.sha256(json.dumps([self.cache_key, good_words, items]).encode("utf-8")).hexdigest()
+        self.documents.append((docname, key, items, good_words))
+
+    def load_cached(self, key):
+        try:
+            with open(os.path.join(self.cache_folder(), key + ".json"), encoding="utf-8") as f:
+                return [tuple(m) for m in json.load(f)]
+        except (OSError, ValueError):
+            return None
+
+    def store_cached(self, key, misspellings):
+        folder = self.cache_folder()
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(misspellings, f)
+        os.replace(tmp_path, os.path.join(folder, key + ".json"))
+
+    def check_documents(self, pending):
+        args = [(items, good_words) for _, _, items, good_words in pending]
+        jobs = self.app.parallel if self.app.parallel > 1 else os.cpu_count()
+        # The filters defined in conf.py cannot be imported again by the workers
+        if len(pending) < 2 or jobs < 2 or None in self.checker_args["filters"]:
+            global _checker
+            _checker = self.checker
+            return [check_document(a) for a in args]
+        logger.info(f"spellingcache: checking {len(pending)} documents with {jobs} workers")
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_checker,
+                                 initargs=(self.checker_args,)) as executor:
+            return list(executor.map(check_document, args, chunksize=4))
+
+    def report(self, docname, misspellings):
+        lines = []
+        for source, lineno, word, suggestions, context_line in misspellings:
+            msg_parts = [f'{source}:{lineno}: ', 'Spell check', red(word)]
+            if self.format_suggestions(suggestions) != '':
+                msg_parts.append(self.format_suggestions(suggestions))
+            msg_parts.append(context_line)
+            msg = ': '.join(msg_parts) + '.'
+            if self.config.spelling_warning:
+                logger.warning(msg)
+            elif self.config.spelling_verbose:
+                logger.info(msg)
+            lines.append("%s:%s: (%s) %s %s\n" % (source, lineno, word,
+                                                  self.format_suggestions(suggestions), context_line))
+
+        self.misspelling_count += len(lines)
+        output_filename = os.path.join(self.outdir, f'{docname}.spelling')
+        if lines:
+            logger.info('Writing %s', output_filename)
+            ensuredir(os.path.dirname(output_filename))
+            with open(output_filename, 'w', encoding='UTF-8') as output:
+                output.writelines(lines)
+        elif os.path.exists(output_filename):
+            # Fixed since the previous run
+            os.remove(output_filename)
+
+    def finish(self):
+        results = {key: self.load_cached(key) for _, key, _, _ in self.documents}
+        pending = [d for d in self.documents if results[d[1]] is None]
+        logger.info(f"spellingcache: {len(self.documents) - len(pending)} documents cached, "
+                    f"{len(pending)} to check")
+        for (_, key, _, _), misspellings in zip(pending, self.check_documents(pending)):
+            self.store_cached(key, misspellings)
+            results[key] = [tuple(m) for m in misspellings]
+
+        for docname, key, _, _ in self.documents:
+            self.report(docname, results[key])
+        super().finish()
+
+
+def setup(app):
+    app.setup_extension('sphinxcontrib.spelling')
+    app.add_config_value('spellingcache_dir', '_build/.cache/spelling', '')
+    app.add_builder(CachedSpellingBuilder, override=True)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
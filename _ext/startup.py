@@ -0,0 +1,166 @@
+"""
+Builder-aware extension loading and startup time budget.
+
+conf.py loads some extensions only for the builders that use them, e.g. the
+spell checker for ``spelling`` and the sitemap for the HTML builders, so a
+preview build does not pay for importing them. The builder is read from
+the sphinx-build command line (``-b``, ``-M``) or from ``CONAN_DOCS_BUILDER``,
+for Sphinx used as a library. When it cannot be told, all the extensions are
+loaded.
+
+It also measures the startup of the build, until the first document is read,
+split in phases and per extension, in wall-clock time (the time before conf.py
+is only known on Linux)::
+
+    startup: 1.02s (python and sphinx 0.31s, conf.py and sphinx components 0.20s, extensions 0.32s, ...)
+
+and warns when it is over ``startup_budget`` seconds (0 disables it). The
+warning can be silenced with ``suppress_warnings = ['startup.budget']``. It must
+be the first of the extensions, to time the rest.
+"""
+import os
+import sys
+import time
+
+from docutils.parsers.rst import directives
+from sphinx.util import logging
+from sphinx.util.docutils import SphinxDirective
+
+logger = logging.getLogger(__name__)
+
+BUILDER_VAR = "CONAN_DOCS_BUILDER"
+HTML_BUILDERS = ("html", "dirhtml", "singlehtml", "htmlhelp", "qthelp", "applehelp", "devhelp", "epub")
+AUTODOC_DIRECTIVES = ("automodule", "autoclass", "autoexception", "autofunction", "autodecorator",
+                      "autodata", "automethod", "autoattribute", "autoproperty")
+
+
+def process_uptime():
+    """ Wall time since the process started, None where it cannot be told (only Linux)
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            started = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime") as f:
+            return max(0.0, float(f.read().split()[0]) - started)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+# When conf.py imported this module, the interpreter and Sphinx were loaded already
+_conf_started = time.perf_counter()
+_before_conf = process_uptime()
+_marks = {}
+_extension_times = {}
+
+
+def active_builder(argv=None):
+    """ The builder of this sphinx-build run, or None if it cannot be told
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg in ("-b", "--builder", "-M") and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--builder="):
+            return arg.split("=", 1)[1]
+        if arg.startswith("-b") and len(arg) > 2:
+            return arg[2:]
+    return os.environ.get(BUILDER_VAR) or None
+
+
+def select_extensions(extensions, builders, builder):
+    """ The extensions to load for the builder: the ones not in ``builders`` (extension -> the
+    builders that need it) and the ones needed by this builder. All of them if it is unknown
+    """
+    if builder is None:
+        return list(extensions)
+    return [e for e in extensions if e not in builders or builder in builders[e]]
+
+
+class AnyOption(dict):
+    def __bool__(self):
+        return True
+
+    def __getitem__(self, key):
+        return directives.unchanged
+
+
+class StubDirective(SphinxDirective):
+    """ Takes the place of a directive whose extension is not loaded in this build, renders nothing
+    """
+    has_content = True
+    optional_arguments = 1
+    final_argument_whitespace = True
+    option_spec = AnyOption()
+
+    def run(self):
+        logger.info(f"{self.name}: skipped, its extension is not loaded in this build",
+                    location=self.get_location())
+        return []
+
+
+def add_stub_directives(app, config):
+    for name in config.startup_stub_directives:
+        app.add_directive(name, StubDirective, override=True)
+
+
+def timed_load_extension(load_extension):
+    depth = [0]
+
+    def wrapper(app, extname):
+        # Nested loads are counted in the extension that requires them
+        depth[0] += 1
+        start = time.perf_counter()
+        try:
+            load_extension(app, extname)
+        finally:
+            depth[0] -= 1
+            if depth[0] == 0:
+                _extension_times[extname] = _extension_times.get(extname, 0) + time.perf_counter() - start
+
+    return wrapper
+
+
+def mark(name):
+    def handler(app, *args):
+        _marks.setdefault(name, time.perf_counter())
+    return handler
+
+
+def report_startup(app, env, docnames):
+    if "read" in _marks:  # Only the first read of the process, not the autobuild rebuilds
+        return
+    _marks["read"] = time.perf_counter()
+    phases = [("python and sphinx", _before_conf)] if _before_conf is not None else []
+    phases += [("conf.py and sphinx components", _marks["extensions"] - _conf_started),
+               ("extensions", _marks["config"] - _marks["extensions"]),
+               ("environment and builder", _marks["builder"] - _marks["config"]),
+               ("outdated documents", _marks["read"] - _marks["builder"])]
+    total = sum(seconds for _, seconds in phases)
+    slowest = sorted(_extension_times.items(), key=lambda e: -e[1])[:5]
+    logger.info(f"startup: {total:.2f}s (" + ", ".join(f"{n} {s:.2f}s" for n, s in phases) + "), "
+                f"{len(docnames)} documents to read")
+    logger.verbose("startup: slowest extensions: " + ", ".join(f"{n} {s:.2f}s" for n, s in slowest))
+
+    budget = app.config.startup_budget
+    if budget and total > budget:
+        logger.warning(f"startup: {total:.2f}s is over the budget of {budget:.2f}s, slowest extensions: "
+                       + ", ".join(f"{n} {s:.2f}s" for n, s in slowest),
+                       type="startup", subtype="budget")
+
+
+def setup(app):
+    app.add_config_value('startup_budget', 0.0, '')
+    app.add_config_value('startup_stub_directives', (), '')
+
+    mark("extensions")(app)
+    app.registry.load_extension = timed_load_extension(app.registry.load_extension)
+    app.connect('config-inited', mark("config"), priority=0)
+    app.connect('config-inited', add_stub_directives)
+    app.connect('builder-inited', mark("builder"), priority=0)
+    app.connect('env-before-read-docs', report_startup, priority=0)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,205 @@
+"""
+Fingerprinted and precompressed static output for the HTML builders.
+
+At build-finished, the CSS, JS, fonts and images in ``_static`` get a copy named
+after their content hash (``css/theme.3f2a9c01d4.css``), the references in the
+CSS files and in all the generated pages are rewritten to those names, and the
+text files of the output get ``.gz`` (and ``.br`` if brotli is installed)
+siblings, compressed in a process pool. ``assets-manifest.json`` lists the
+fingerprinted files, the web server can serve them with immutable cache headers.
+The fingerprinted files of the previous manifest that the new one does not list,
+and their compressed copies, are removed.
+
+The original names are kept, for scripts that load assets by name.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from sphinx.util import logging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_SUFFIXES = (".css", ".js", ".woff", ".woff2", ".ttf", ".eot", ".svg", ".png", ".jpg", ".gif")
+COMPRESS_SUFFIXES = (".html", ".css", ".js", ".svg", ".json", ".txt", ".xml", ".ttf", ".eot")
+HASH_LENGTH = 10
+
+# A reference to a static file, maybe already fingerprinted by a previous build,
+# and with the "?v=" Sphinx adds to CSS and JS files
+_static_ref_re = re.compile(r"_static/([^\"'\s?#)]+?)(?:\.[0-9a-f]{%d})?(\.[a-z0-9]+)(\?v=[^\"'\s)]*)?(?=[\"'\s)#])"
+                            % HASH_LENGTH)
+_css_url_re = re.compile(r"url\((['\"]?)([^'\")?#]+)([^'\")]*)\1\)")
+_fingerprinted_re = re.compile(r"\.[0-9a-f]{%d}\.[a-z0-9]+$" % HASH_LENGTH)
+
+
+def fingerprinted_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{digest}{ext}"
+
+
+def rewrite_css(content, css_path, static_dir, manifest):
+    """ Point the url() of a CSS file to the fingerprinted names
+    """
+    folder = os.path.dirname(css_path)
+
+    def replace(match):
+        quote, url, extra = match.groups()
+        if url.startswith(("data:", "http:", "https:", "/")):
+            return match.group(0)
+        target = os.path.relpath(os.path.normpath(os.path.join(folder, url)), static_dir).replace(os.sep, "/")
+        if target not in manifest:
+            return match.group(0)
+        new_url = os.path.relpath(os.path.join(static_dir, manifest[target]), folder).replace(os.sep, "/")
+        return f"url({quote}{new_url}{extra}{quote})"
+
+    return _css_url_re.sub(replace, content)
+
+
+def fingerprint_static(static_dir):
+    assets = []
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            if name.endswith(FINGERPRINT_SUFFIXES) and not _fingerprinted_re.search(name):
+                path = os.path.join(root, name)
+                assets.append(os.path.relpath(path, static_dir).replace(os.sep, "/"))
+
+    manifest = {}
+    # CSS last, its content changes when the url() are rewritten, so does its hash
+    for asset in sorted(assets, key=lambda a: a.endswith(".css")):
+        path = os.path.join(static_dir, asset)
+        with open(path, "rb") as f:
+            content = f.read()
+        if asset.endswith(".css"):
+            content = rewrite_css(content.decode("utf-8"), path, static_dir, manifest).encode("utf-8")
+        manifest[asset] = fingerprinted_name(asset, content)
+        target = os.path.join(static_dir, manifest[asset])
+        if not os.path.exists(target):
+            with open(target, "wb") as f:
+                f.write(content)
+    return manifest
+
+
+def remove_stale(outdir, previous, current):
+    """ Removes the fingerprinted files of a previous build that the current one does not use
+    """
+    removed = 0
+    for asset in sorted(set(previous) - set(current)):
+        # Only fingerprinted names inside _static, the manifest could be edited or corrupt
+        if not asset.startswith("_static/") or not _fingerprinted_re.search(asset) or ".." in asset.split("/"):
+            continue
+        path = os.path.join(outdir, *asset.split("/"))
+        for f in (path, path + ".gz", path + ".br"):
+            if os.path.isfile(f):
+                os.remove(f)
+                removed += f == path
+    return removed
+
+
+def read_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def rewrite_pages(outdir, manifest):
+    def replace(match):
+        asset = match.group(1) + match.group(2)
+        if asset not in manifest:
+            return match.group(0)
+        return f"_static/{manifest[asset]}"
+
+    rewritten = 0
+    for root, _, files in os.walk(outdir):
+        for name in files:
+            if not name.endswith(".html"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+            new_content = _static_ref_re.sub(replace, content)
+            # Unchanged pages keep their mtime, so they are not compressed again
+            if new_content != content:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(new_content)
+                rewritten += 1
+    return rewritten
+
+
+def compress_file(path):
+    with open(path, "rb") as f:
+        content = f.read()
+    written = 0
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        written += 1
+    if brotli is not None:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(content))
+        written += 1
+    return written
+
+
+def outdated_compressed(outdir):
+    files = []
+    for root, _, names in os.walk(outdir):
+        for name in names:
+            if not name.endswith(COMPRESS_SUFFIXES):
+                continue
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path)
+            siblings = [path + ".gz"] + ([path + ".br"] if brotli is not None else [])
+            if any(not os.path.exists(s) or os.path.getmtime(s) < mtime for s in siblings):
+                files.append(path)
+    return files
+
+
+def process_output(app, exception):
+    if exception is not None or app.builder.format != "html" or not app.config.staticassets_enabled:
+        return
+    outdir = str(app.outdir)
+    static_dir = os.path.join(outdir, "_static")
+
+    manifest = fingerprint_static(static_dir)
+    rewritten = rewrite_pages(outdir, manifest)
+    manifest_path = os.path.join(outdir, "assets-manifest.json")
+    previous = read_manifest(manifest_path)
+    assets_manifest = {"immutable": sorted(f"_static/{v}" for v in manifest.values()),
+                       "assets": {f"_static/{k}": f"_static/{v}" for k, v in manifest.items()}}
+    removed = 0
+    if previous != assets_manifest:
+        if isinstance(previous, dict) and isinstance(previous.get("immutable"), list):
+            removed = remove_stale(outdir, previous["immutable"], assets_manifest["immutable"])
+        with open(manifest_path, "w") as f:
+            json.dump(assets_manifest, f, indent=2)
+
+    files = outdated_compressed(outdir)
+    if files:
+        jobs = app.parallel if app.parallel > 1 else os.cpu_count()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(compress_file, files, chunksize=16))
+    logger.info(f"staticassets: {len(manifest)} assets fingerprinted, {removed} stale removed, "
+                f"{rewritten} pages rewritten, {len(files)} files compressed"
+                f"{'' if brotli else ' (gzip only, brotli not installed)'}")
+
+
+def setup(app):
+    app.add_config_value('staticassets_enabled', True, 'html')
+    # After the rest of build-finished handlers, that can still write pages
+    app.connect('build-finished', process_output, priority=900)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
@@ -0,0 +1,502 @@
+"""
+Import-free autodoc for the Conan sources.
+
+Replaces the ``autoclass``, ``autofunction``, ``automethod`` (and the
+attribute/property/exception) directives of ``sphinx.ext.autodoc`` with ones
+that read the signatures, docstrings and members of the documented objects
+parsing the sources in ``staticautodoc_path`` with ``ast``, so Conan and its
+dependencies are never imported. The names are resolved following the
+``from ... import ...`` of the modules, as Python would do.
+
+What is extracted from a file is stored in ``_build/.cache/autodoc``, keyed by
+the hash of its content, so unchanged modules are not parsed again, not even
+in the parallel readers or in the builds of other versions.
+
+Set ``staticautodoc_enabled = False`` to use the regular (importing) autodoc.
+"""
+import ast
+import hashlib
+import json
+import os
+import tempfile
+
+from docutils import nodes
+from docutils.statemachine import StringList
+from sphinx.ext.autodoc.directive import DummyOptionSpec
+from sphinx.util import logging
+from sphinx.util.docstrings import prepare_docstring
+from sphinx.util.docutils import SphinxDirective, switch_source_input
+
+logger = logging.getLogger(__name__)
+
+# Change it when the extracted data changes, to discard the cached one
+EXTRACTOR_VERSION = 1
+MAX_RESOLVE_DEPTH = 20
+PROPERTY_DECORATORS = ("property", "cached_property", "functools.cached_property")
+
+_summaries = {}
+
+
+def cache_folder(app):
+    return os.path.join(app.confdir, app.config.staticautodoc_cache_dir)
+
+
+def render_params(args):
+    """ The parameters of a function as they are written in its signature, with the
+    "/" and "*" separators as items of their own
+    """
+    def param(arg, default=None, prefix=""):
+        text = prefix + arg.arg
+        if arg.annotation is not None:
+            text += f": {ast.unparse(arg.annotation)}"
+        if default is not None:
+            text += (" = " if arg.annotation is not None else "=") + ast.unparse(default)
+        return text
+
+    positional = args.posonlyargs + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + args.defaults
+    params = [param(a, d) for a, d in zip(positional, defaults)]
+    if args.posonlyargs:
+        params.insert(len(args.posonlyargs), "/")
+    if args.vararg is not None:
+        params.append(param(args.vararg, prefix="*"))
+    elif args.kwonlyargs:
+        params.append("*")
+    params += [param(a, d) for a, d in zip(args.kwonlyargs, args.kw_defaults)]
+    if args.kwarg is not None:
+        params.append(param(args.kwarg, prefix="**"))
+    return params
+
+
+def comment_doc(lines, lineno):
+    """ The ``#:`` comments just before the line of an assignment
+    """
+    doc = []
+    i = lineno - 2
+    while i >= 0 and lines[i].strip().startswith("#:"):
+        doc.insert(0, lines[i].strip()[2:].strip())
+        i -= 1
+    return "\n".join(doc) or None
+
+
+def assigned_names(node, instance):
+    targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+    if instance:
+        return [t.attr for t in targets if isinstance(t, ast.Attribute)
+                and isinstance(t.value, ast.Name) and t.value.id == "self"]
+    return [t.id for t in targets if isinstance(t, ast.Name)]
+
+
+def extract_body(body, lines, in_class=False, instance=False):
+    """ The objects defined in a module or class body. With ``instance``, the ``self.<name>``
+    attributes assigned in the body of a method
+    """
+    objects = {}
+    for i, node in enumerate(body):
+        if instance and not isinstance(node, (ast.Assign, ast.AnnAssign)):
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            decorators = [ast.unparse(d) for d in node.decorator_list]
+            # The getter defines the property, skip the setters and deleters
+            if node.name in objects and any(d.endswith((".setter", ".deleter")) for d in decorators):
+                continue
+            objects[node.name] = {"kind": "function", "lineno": node.lineno,
+                                  "doc": ast.get_docstring(node, clean=False),
+                                  "params": render_params(node.args),
+                                  "returns": ast.unparse(node.returns) if node.returns else None,
+                                  "decorators": decorators,
+                                  "async": isinstance(node, ast.AsyncFunctionDef)}
+            if in_class:
+                # Documented instance attributes, in the order of the methods assigning them
+                for name, attribute in extract_body(node.body, lines, instance=True).items():
+                    if attribute["doc"]:
+                        objects.setdefault(name, attribute)
+        elif isinstance(node, ast.ClassDef):
+            objects[node.name] = {"kind": "class", "lineno": node.lineno,
+                                  "doc": ast.get_docstring(node, clean=False),
+                                  "bases": [ast.unparse(b) for b in node.bases],
+                                  "members": extract_body(node.body, lines, in_class=True)}
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            names = assigned_names(node, instance)
+            if not names:
+                continue
+            following = body[i + 1] if i + 1 < len(body) else None
+            if isinstance(following, ast.Expr) and isinstance(following.value, ast.Constant) \
+                    and isinstance(following.value.value, str):
+                doc = following.value.value
+            else:
+                doc = comment_doc(lines, node.lineno)
+            for name in names:
+                objects[name] = {"kind": "attribute", "lineno": node.lineno, "doc": doc,
+                                 "annotation": ast.unparse(node.annotation)
+                                 if isinstance(node, ast.AnnAssign) else None,
+                                 # The value of instance attributes is not known until runtime
+                                 "value": ast.unparse(node.value)
+                                 if node.value is not None and not instance else None}
+                # A plain "Alias = Other" is followed when resolving names
+                if not instance and isinstance(node.value, (ast.Name, ast.Attribute)):
+                    objects[name]["target"] = ast.unparse(node.value)
+    return objects
+
+
+def extract(source):
+    """ Everything the directives need from a module, as plain data that can be stored as JSON
+    """
+    tree = ast.parse(source)
+    imports = {}
+    star_imports = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                if alias.name == "*":
+                    star_imports.append([node.level, node.module])
+                else:
+                    imports[alias.asname or alias.name] = [node.level, node.module, alias.name]
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    imports[alias.asname] = [0, alias.name, None]
+                else:
+                    # "import a.b" binds "a"
+                    top = alias.name.split(".")[0]
+                    imports[top] = [0, top, None]
+    return {"doc": ast.get_docstring(tree, clean=False), "imports": imports,
+            "star_imports": star_imports, "objects": extract_body(tree.body, source.splitlines())}
+
+
+class SourceTree:
+    """ The modules of a source folder, parsed on demand
+    """
+    def __init__(self, app):
+        self.root = os.path.join(app.confdir, app.config.staticautodoc_path)
+        self.cache_dir = cache_folder(app)
+        self.used_files = set()
+
+    def module_file(self, modname):
+        base = os.path.join(self.root, *modname.split("."))
+        for path in (base + ".py", os.path.join(base, "__init__.py")):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def module(self, modname):
+        path = self.module_file(modname)
+        if path is None:
+            return None
+        self.used_files.add(path)
+        stat = os.stat(path)
+        memo = _summaries.get(path)
+        if memo is not None and memo[0] == (stat.st_mtime_ns, stat.st_size):
+            return memo[1]
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        cache_path = os.path.join(self.cache_dir, f"{digest}-{EXTRACTOR_VERSION}.json")
+        try:
+            with open(cache_path, encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            summary = extract(content.decode("utf-8"))
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(summary, f)
+            os.replace(tmp_path, cache_path)
+        _summaries[path] = ((stat.st_mtime_ns, stat.st_size), summary)
+        return summary
+
+    def is_package(self, modname):
+        path = self.module_file(modname)
+        return path is not None and os.path.basename(path) == "__init__.py"
+
+    def absolute_module(self, modname, level, module):
+        if not level:
+            return module
+        package = modname if self.is_package(modname) else modname.rpartition(".")[0]
+        for _ in range(level - 1):
+            package = package.rpartition(".")[0]
+        return f"{package}.{module}" if module else package
+
+    def lookup(self, modname, name, depth=0):
+        """ Where a module level name is defined: (modname, object), with the modules
+        represented as {"kind": "module"}
+        """
+        summary = self.module(modname)
+        if summary is None or depth > MAX_RESOLVE_DEPTH:
+            return None
+        obj = summary["objects"].get(name)
+        if obj is not None:
+            if "target" in obj:
+                return self.resolve(modname, obj["target"].split("."), depth + 1) or (modname, obj)
+            return modname, obj
+        if name in summary["imports"]:
+            level, module, attr = summary["imports"][name]
+            module = self.absolute_module(modname, level, module)
+            if attr is None:
+                return (module, {"kind": "module"}) if self.module(module) is not None else None
+            # "from package import submodule"
+            return self.lookup(module, attr, depth + 1) or \
+                ((f"{module}.{attr}", {"kind": "module"}) if self.module(f"{module}.{attr}") else None)
+        for level, module in summary["star_imports"]:
+            found = self.lookup(self.absolute_module(modname, level, module), name, depth + 1)
+            if found is not None:
+                return found
+        if self.module(f"{modname}.{name}") is not None:
+            return f"{modname}.{name}", {"kind": "module"}
+        return None
+
+    def resolve(self, modname, path, depth=0):
+        found = self.lookup(modname, path[0], depth)
+        for part in path[1:]:
+            if found is None:
+                return None
+            defining_module, obj = found
+            if obj["kind"] == "module":
+                found = self.lookup(defining_module, part, depth + 1)
+            elif obj["kind"] == "class":
+                found = self.class_member(defining_module, obj, part)
+            else:
+                return None
+        return found
+
+    def bases(self, modname, cls):
+        """ The classes in the MRO of a class, itself excluded, as (modname, class).
+        Depth first, enough for the single inheritance of the documented classes
+        """
+        result = []
+        for base in cls["bases"]:
+            found = self.resolve(modname, base.split("."))
+            if found is not None and found[1]["kind"] == "class" and found not in result:
+                result.append(found)
+                result.extend(b for b in self.bases(*found) if b not in result)
+        return result
+
+    def follow_alias(self, modname, cls, member):
+        """ A "name = other_method" in the body of a class is the other method
+        """
+        target = member.get("target")
+        if member["kind"] == "attribute" and target and "." not in target and target in cls["members"]:
+            return cls["members"][target]
+        return member
+
+    def class_member(self, modname, cls, name):
+        for owner_module, owner in [(modname, cls)] + self.bases(modname, cls):
+            if name in owner["members"]:
+                return owner_module, self.follow_alias(owner_module, owner, owner["members"][name])
+        return None
+
+    def member_doc(self, modname, cls, name):
+        # As autodoc_inherit_docstrings, the docstring of the overridden member if there is none
+        for owner_module, owner in [(modname, cls)] + self.bases(modname, cls):
+            member = owner["members"].get(name)
+            if member is not None:
+                member = self.follow_alias(owner_module, owner, member)
+                if member["doc"]:
+                    return member["doc"]
+        return None
+
+
+def signature(obj, bound):
+    params = list(obj["params"])
+    if bound and params and not is_staticmethod(obj):
+        params.pop(0)
+        if params and params[0] == "/":
+            params.pop(0)
+    returns = f" -> {obj['returns']}" if obj["returns"] else ""
+    return f"({', '.join(params)}){returns}"
+
+
+def is_staticmethod(obj):
+    return "staticmethod" in obj["decorators"]
+
+
+def is_property(obj):
+    return obj["kind"] == "function" and any(d in PROPERTY_DECORATORS for d in obj["decorators"])
+
+
+class StaticAutodocDirective(SphinxDirective):
+    option_spec = DummyOptionSpec()
+    has_content = True
+    required_arguments = 1
+    optional_arguments = 0
+    final_argument_whitespace = True
+
+    def run(self):
+        objtype = self.name.split(":")[-1][len("auto"):]
+        tree = SourceTree(self.env.app)
+        name = self.arguments[0].strip()
+        found = self.find(tree, objtype, name)
+        for path in tree.used_files:
+            self.state.document.settings.record_dependencies.add(path)
+        if found is None:
+            logger.warning(f"staticautodoc: cannot find {objtype} '{name}' in {tree.root}",
+                           location=self.get_location())
+            return []
+        modname, objpath, defining_module, obj = found
+
+        self.result = StringList()
+        self.source = f"docstring of {modname}.{'.'.join(objpath)}"
+        if objtype in ("class", "exception"):
+            self.add_class(tree, modname, objpath, defining_module, obj)
+        elif objtype in ("method", "property", "attribute"):
+            owner_module, owner = tree.resolve(modname, objpath[:1])
+            self.add_member(tree, modname, objpath, owner_module, owner, obj, "", self.content)
+        else:
+            # autodoc documents "module.Class.method" as a "method" function of a "module.Class"
+            # module, keep it for the references to them
+            self.add_directive("function", objpath[-1:], ".".join([modname] + objpath[:-1]),
+                               signature(obj, bound=False), obj, "")
+            self.add_docstring(obj["doc"], "   ", self.content)
+
+        node = nodes.paragraph()
+        node.document = self.state.document
+        with switch_source_input(self.state, self.result):
+            self.state.nested_parse(self.result, 0, node)
+        return node.children
+
+    def find(self, tree, objtype, name):
+        """ Finds the object as autodoc: the module from the name or the current one, and the
+        longest prefix that is a module
+        """
+        if "::" in name:
+            # Explicit module, as in "package.module::Class.method"
+            modname, _, path = name.partition("::")
+            found = tree.resolve(modname, path.split("."))
+            if found is not None and found[1]["kind"] != "module":
+                return modname, path.split("."), found[0], found[1]
+            return None
+        prefix, _, base = name.rpartition(".")
+        module = self.env.ref_context.get("py:module")
+        if objtype in ("method", "property", "attribute"):
+            if not prefix:
+                prefix = self.env.ref_context.get("py:class") or ""
+            full = (module.split(".") if module else []) + (prefix.split(".") if prefix else []) + [base]
+        else:
+            full = (prefix.split(".") if prefix else (module.split(".") if module else [])) + [base]
+        for i in range(len(full) - 1, 0, -1):
+            modname = ".".join(full[:i])
+            if tree.module(modname) is not None:
+                found = tree.resolve(modname, full[i:])
+                if found is not None and found[1]["kind"] != "module":
+                    return modname, full[i:], found[0], found[1]
+                return None
+        return None
+
+    def add_line(self, line, indent):
+        self.result.append(indent + line if line else "", self.source)
+
+    def add_directive(self, directive, objpath, modname, sig, obj, indent, options=()):
+        self.add_line(f".. py:{directive}:: {'.'.join(objpath)}{sig}", indent)
+        self.add_line(f"   :module: {modname}", indent)
+        if "no-index" in self.options or "noindex" in self.options:
+            self.add_line("   :no-index:", indent)
+        for option in options:
+            self.add_line(f"   {option}", indent)
+        self.add_line("", indent)
+
+    def add_docstring(self, doc, indent, more_content=None):
+        if doc:
+            for line in prepare_docstring(doc, self.state.document.settings.tab_width):
+                self.add_line(line, indent)
+        if more_content:
+            for line, src in zip(more_content.data, more_content.items):
+                self.result.append(indent + line if line else "", *src)
+            self.add_line("", indent)
+
+    def add_class(self, tree, modname, objpath, defining_module, cls):
+        init = tree.class_member(defining_module, cls, "__init__")
+        sig = signature(init[1], bound=True) if init and init[1]["kind"] == "function" else ""
+        directive = "exception" if self.name.endswith("autoexception") else "class"
+        self.add_directive(directive, objpath, modname, sig, cls, "")
+
+        docs = [cls["doc"]] if cls["doc"] else []
+        if self.config.autoclass_content in ("both", "init"):
+            init_doc = tree.member_doc(defining_module, cls, "__init__")
+            if init_doc:
+                docs = [init_doc] if self.config.autoclass_content == "init" else docs + [init_doc]
+        for doc in docs:
+            self.add_docstring(doc, "   ")
+        self.add_docstring(None, "   ", self.content)
+
+        if "members" in self.options:
+            for name, owner_module, owner, member in self.members(tree, defining_module, cls):
+                self.add_member(tree, modname, objpath + [name], owner_module, owner, member, "   ")
+
+    def members(self, tree, modname, cls):
+        wanted = self.options.get("members")
+        wanted = [m.strip() for m in wanted.split(",")] if wanted else None
+        excluded = {m.strip() for m in (self.options.get("exclude-members") or "").split(",")}
+        owners = [(modname, cls)]
+        if "inherited-members" in self.options:
+            owners += tree.bases(modname, cls)
+
+        members = []
+        seen = set()
+        for owner_module, owner in owners:
+            for name, member in owner["members"].items():
+                if name in seen:
+                    continue
+                seen.add(name)
+                if wanted is not None:
+                    if name not in wanted:
+                        continue
+                elif name.startswith("_") or name in excluded:
+                    continue
+                elif not tree.member_doc(modname, cls, name) and "undoc-members" not in self.options:
+                    continue
+                members.append((name, owner_module, owner, tree.follow_alias(owner_module, owner, member)))
+
+        order = self.options.get("member-order") or self.config.autodoc_member_order
+        if order == "alphabetical":
+            members.sort(key=lambda m: m[0])
+        elif order == "groupwise":
+            groups = {"attribute": 0, "function": 1}
+            members.sort(key=lambda m: (groups.get(m[3]["kind"], 2), m[0]))
+        else:
+            # As autodoc, the inherited members are not in the source of the class, they go
+            # after the own members in alphabetical order
+            members.sort(key=lambda m: (m[2] is not cls, m[0] if m[2] is not cls else ""))
+        return members
+
+    def add_member(self, tree, modname, objpath, owner_module, owner, member, indent, more_content=None):
+        doc = tree.member_doc(owner_module, owner, objpath[-1])
+        if is_property(member):
+            options = [f":type: {member['returns']}"] if member["returns"] else []
+            self.add_directive("property", objpath, modname, "", member, indent, options)
+        elif member["kind"] == "function":
+            options = [f":{o}:" for o in ("staticmethod", "classmethod", "abstractmethod")
+                       if o in member["decorators"] or f"abc.{o}" in member["decorators"]]
+            if member["async"]:
+                options.append(":async:")
+            self.add_directive("method", objpath, modname, signature(member, bound=True), member, indent,
+                               options)
+        elif member["kind"] == "class":
+            self.add_directive("class", objpath, modname, "", member, indent)
+        else:
+            options = []
+            if member["annotation"]:
+                options.append(f":type: {member['annotation']}")
+            if member["value"] is not None:
+                options.append(f":value: {member['value']}")
+            self.add_directive("attribute", objpath, modname, "", member, indent, options)
+        self.add_docstring(doc, indent + "   ", more_content)
+
+
+def setup(app):
+    app.setup_extension('sphinx.ext.autodoc')
+    app.add_config_value('staticautodoc_enabled', True, 'env')
+    app.add_config_value('staticautodoc_path', '.', 'env')
+    app.add_config_value('staticautodoc_cache_dir', '_build/.cache/autodoc', '')
+
+    def override_directives(app, config):
+        if config.staticautodoc_enabled:
+            for objtype in ("class", "exception", "function", "method", "property", "attribute"):
+                app.add_directive(f"auto{objtype}", StaticAutodocDirective, override=True)
+
+    app.connect('config-inited', override_directives)
+
+    return {
+        'version': '0.1',
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
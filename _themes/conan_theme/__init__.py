@@ -4,9 +4,14 @@ Sphinx Read the Docs theme.
 From https://github.com/ryan-roemer/sphinx-bootstrap-theme.
 """
 
+import json
+import os
+import posixpath
+import sys
 from os import path
 from sys import version_info as python_version
 
+from docutils import nodes
 from sphinx import version_info as sphinx_version
 from sphinx.locale import _
 from sphinx.util.logging import getLogger
@@ -32,9 +37,77 @@ def config_initiated(app, config):
         )
 
 
+def uses_nodes_of(package):
+    def check(doctree):
+        return any(type(node).__module__.startswith(package) for node in doctree.findall(nodes.Element))
+    return check
+
+
+def uses_scripts(doctree):
+    # Only the scripts of raw HTML contents can expect jQuery, the theme does not use it
+    return any(node.get('format') == 'html' and '<script' in node.astext()
+               for node in doctree.findall(nodes.raw))
+
+
+# The assets of these extensions (the CSS and JS files of their packages), and the contents
+# of a page that need them
+PAGE_ASSETS = {
+    'sphinx_tabs': uses_nodes_of('sphinx_tabs'),
+    'sphinxcontrib.youtube': uses_nodes_of('sphinxcontrib.youtube'),
+    'sphinxcontrib.jquery': uses_scripts,
+}
+
+
+def extension_assets(app):
+    # Cached in the builder, the same for all the pages
+    assets = getattr(app.builder, '_conan_theme_assets', None)
+    if assets is None:
+        assets = {}
+        for package in PAGE_ASSETS:
+            module = sys.modules.get(package)
+            folder = path.dirname(getattr(module, '__file__', None) or '')
+            if package not in app.extensions and not any(e.startswith(package + '.') for e in app.extensions):
+                continue
+            if folder:
+                assets[package] = {name for _, _, files in os.walk(folder) for name in files
+                                   if name.endswith(('.css', '.js'))}
+        app.builder._conan_theme_assets = assets
+    return assets
+
+
+def prune_page_assets(app, context, doctree):
+    """ Removes the CSS and JS files of the extensions that the page does not use
+    """
+    if sphinx_version < (6, 0, 0) or getattr(app.registry, 'html_assets_policy', None) == 'always':
+        return  # Before Sphinx 6 its own scripts need jQuery
+    unused = set()
+    for package, files in extension_assets(app).items():
+        if doctree is None or not PAGE_ASSETS[package](doctree):
+            unused.update(files)
+    if not unused:
+        return
+    for key in ('css_files', 'script_files'):
+        if key in context:
+            context[key][:] = [f for f in context[key]
+                               if posixpath.basename(str(getattr(f, 'filename', f)).split('?')[0]) not in unused]
+
+
 def extend_html_context(app, pagename, templatename, context, doctree):
      # Add ``sphinx_version_info`` tuple for use in Jinja templates
      context['sphinx_version_info'] = sphinx_version
+     prune_page_assets(app, context, doctree)
+
+
+def write_versions_json(app, exception):
+    # The versions of the selector next to the pages, for local builds served from their output
+    # folder. Published docs use the one at the root of the server, shared by all the versions
+    if exception is not None or app.builder.format != 'html':
+        return
+    versions = app.config.html_context.get('versions')
+    # Not from the globalcontext of the builder, it is not set when there is nothing to write
+    if versions and app.config.html_theme_options.get('versions_url'):
+        with open(path.join(app.outdir, 'versions.json'), 'w') as f:
+            json.dump(versions, f, indent=4)
 
 
 # See http://www.sphinx-doc.org/en/stable/theming.html#distribute-your-theme-as-a-python-package
@@ -73,5 +146,6 @@ def setup(app):
 
     # Extend the default context when rendering the templates.
     app.connect("html-page-context", extend_html_context)
+    app.connect("build-finished", write_versions_json)
 
     return {'parallel_read_safe': True, 'parallel_write_safe': True}
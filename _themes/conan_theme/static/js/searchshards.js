@@ -0,0 +1,68 @@
+/*
+ * Loads only the shards of the search index that the query needs (see _ext/searchshards.py),
+ * keeping them in localStorage. Falls back to the whole searchindex.js when fetch is not available.
+ */
+const ShardedSearch = {
+  storagePrefix: "conan-search-shard:",
+
+  load: (base, fallbackUrl) => {
+    // Scoped by the index URL, every version of the docs has its own shards
+    ShardedSearch.storagePrefix += new URL(base, window.location.href).pathname;
+    const query = new URLSearchParams(window.location.search).get("q") || "";
+    fetch(base + "manifest.json")
+      .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+      .then((manifest) => {
+        ShardedSearch.cleanStorage(manifest);
+        const names = ShardedSearch.shardsFor(query, manifest);
+        return Promise.all(names.map((name) => ShardedSearch.loadShard(base, name))).then((shards) => {
+          const index = Object.assign({}, manifest, { terms: {}, titleterms: {} });
+          shards.forEach((shard) => {
+            Object.assign(index.terms, shard.terms);
+            Object.assign(index.titleterms, shard.titleterms);
+          });
+          Search.setIndex(index);
+        });
+      })
+      .catch(() => Search.loadIndex(fallbackUrl));
+  },
+
+  shardsFor: (query, manifest) => {
+    // The same words searchtools.js will look for, stemmed and as typed
+    const stemmer = new Stemmer();
+    const names = new Set();
+    splitQuery(query.toLowerCase().trim()).forEach((word) => {
+      word = word.replace(/^-/, "");
+      [word, stemmer.stemWord(word)].forEach((term) => {
+        const key = Array.from(term).slice(0, manifest.prefix).join("");
+        if (manifest.shards[key]) names.add(manifest.shards[key]);
+      });
+    });
+    return [...names];
+  },
+
+  loadShard: (base, name) => {
+    try {
+      const cached = localStorage.getItem(ShardedSearch.storagePrefix + name);
+      if (cached) return Promise.resolve(JSON.parse(cached));
+    } catch (e) {}
+    return fetch(base + name)
+      .then((response) => response.json())
+      .then((shard) => {
+        try {
+          localStorage.setItem(ShardedSearch.storagePrefix + name, JSON.stringify(shard));
+        } catch (e) {}  // Full or disabled storage, just don't cache it
+        return shard;
+      });
+  },
+
+  cleanStorage: (manifest) => {
+    // Shard names change with their content, drop the ones of previous builds
+    try {
+      const current = new Set(Object.values(manifest.shards));
+      Object.keys(localStorage)
+        .filter((key) => key.startsWith(ShardedSearch.storagePrefix))
+        .filter((key) => !current.has(key.substr(ShardedSearch.storagePrefix.length)))
+        .forEach((key) => localStorage.removeItem(key));
+    } catch (e) {}
+  },
+};
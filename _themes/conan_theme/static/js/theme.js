@@ -1 +1,235 @@
-!function(n){var e={};function t(i){if(e[i])return e[i].exports;var o=e[i]={i:i,l:!1,exports:{}};return n[i].call(o.exports,o,o.exports,t),o.l=!0,o.exports}t.m=n,t.c=e,t.d=function(n,e,i){t.o(n,e)||Object.defineProperty(n,e,{enumerable:!0,get:i})},t.r=function(n){"undefined"!=typeof Symbol&&Symbol.toStringTag&&Object.defineProperty(n,Symbol.toStringTag,{value:"Module"}),Object.defineProperty(n,"__esModule",{value:!0})},t.t=function(n,e){if(1&e&&(n=t(n)),8&e)return n;if(4&e&&"object"==typeof n&&n&&n.__esModule)return n;var i=Object.create(null);if(t.r(i),Object.defineProperty(i,"default",{enumerable:!0,value:n}),2&e&&"string"!=typeof n)for(var o in n)t.d(i,o,function(e){return n[e]}.bind(null,o));return i},t.n=function(n){var e=n&&n.__esModule?function(){return n.default}:function(){return n};return t.d(e,"a",e),e},t.o=function(n,e){return Object.prototype.hasOwnProperty.call(n,e)},t.p="",t(t.s=0)}([function(n,e,t){t(1),n.exports=t(3)},function(n,e,t){(function(){var e="undefined"!=typeof window?window.jQuery:t(2);n.exports.ThemeNav={navBar:null,win:null,winScroll:!1,winResize:!1,linkScroll:!1,winPosition:0,winHeight:null,docHeight:null,isRunning:!1,enable:function(n){var t=this;void 0===n&&(n=!0),t.isRunning||(t.isRunning=!0,e((function(e){t.init(e),t.reset(),t.win.on("hashchange",t.reset),n&&t.win.on("scroll",(function(){t.linkScroll||t.winScroll||(t.winScroll=!0,requestAnimationFrame((function(){t.onScroll()})))})),t.win.on("resize",(function(){t.winResize||(t.winResize=!0,requestAnimationFrame((function(){t.onResize()})))})),t.onResize()})))},enableSticky:function(){this.enable(!0)},init:function(n){n(document);var e=this;this.navBar=n("div.wy-side-scroll:first"),this.win=n(window),n(document).on("click","[data-toggle='wy-nav-top']",(function(){n("[data-toggle='wy-nav-shift']").toggleClass("shift"),n("[data-toggle='rst-versions']").toggleClass("shift")})).on("click",".wy-menu-vertical .current ul li a",(function(){var t=n(this);n("[data-toggle='wy-nav-shift']").removeClass("shift"),n("[data-toggle='rst-versions']").toggleClass("shift"),e.toggleCurrent(t),e.hashChange()})).on("click","[data-toggle='rst-current-version']",(function(){n("[data-toggle='rst-versions']").toggleClass("shift-up")})),n("table.docutils:not(.field-list,.footnote,.citation)").wrap("<div class='wy-table-responsive'></div>"),n("table.docutils.footnote").wrap("<div class='wy-table-responsive footnote'></div>"),n("table.docutils.citation").wrap("<div class='wy-table-responsive citation'></div>"),n(".wy-menu-vertical ul").not(".simple").siblings("a").each((function(){var t=n(this);expand=n('<button class="toctree-expand" title="Open/close menu"></button>'),expand.on("click",(function(n){return e.toggleCurrent(t),n.stopPropagation(),!1})),t.prepend(expand)}))},reset:function(){var n=encodeURI(window.location.hash)||"#";try{var e=$(".wy-menu-vertical"),t=e.find('[href="'+n+'"]');if(0===t.length){var i=$('.document [id="'+n.substring(1)+'"]').closest("div.section");0===(t=e.find('[href="#'+i.attr("id")+'"]')).length&&(t=e.find('[href="#"]'))}if(t.length>0){$(".wy-menu-vertical .current").removeClass("current").attr("aria-expanded","false"),t.addClass("current").attr("aria-expanded","true"),t.closest("li.toctree-l1").parent().addClass("current").attr("aria-expanded","true");for(let n=1;n<=10;n++)t.closest("li.toctree-l"+n).addClass("current").attr("aria-expanded","true");t[0].scrollIntoView()}}catch(n){console.log("Error expanding nav for anchor",n)}},onScroll:function(){this.winScroll=!1;var n=this.win.scrollTop(),e=n+this.winHeight,t=this.navBar.scrollTop()+(n-this.winPosition);n<0||e>this.docHeight||(this.navBar.scrollTop(t),this.winPosition=n)},onResize:function(){this.winResize=!1,this.winHeight=this.win.height(),this.docHeight=$(document).height()},hashChange:function(){this.linkScroll=!0,this.win.one("hashchange",(function(){this.linkScroll=!1}))},toggleCurrent:function(n){var e=n.closest("li");e.siblings("li.current").removeClass("current").attr("aria-expanded","false"),e.siblings().find("li.current").removeClass("current").attr("aria-expanded","false");var t=e.find("> ul li");t.length&&(t.removeClass("current").attr("aria-expanded","false"),e.toggleClass("current").attr("aria-expanded",(function(n,e){return"true"==e?"false":"true"})))}},"undefined"!=typeof window&&(window.SphinxRtdTheme={Navigation:n.exports.ThemeNav,StickyNav:n.exports.ThemeNav}),function(){for(var n=0,e=["ms","moz","webkit","o"],t=0;t<e.length&&!window.requestAnimationFrame;++t)window.requestAnimationFrame=window[e[t]+"RequestAnimationFrame"],window.cancelAnimationFrame=window[e[t]+"CancelAnimationFrame"]||window[e[t]+"CancelRequestAnimationFrame"];window.requestAnimationFrame||(window.requestAnimationFrame=function(e,t){var i=(new Date).getTime(),o=Math.max(0,16-(i-n)),r=window.setTimeout((function(){e(i+o)}),o);return n=i+o,r}),window.cancelAnimationFrame||(window.cancelAnimationFrame=function(n){clearTimeout(n)})}()}).call(window)},function(n,e){n.exports=jQuery},function(n,e,t){}]);
\ No newline at end of file
+/*
+ * Navigation of the theme: sticky sidebar, expanding the toctree of the current
+ * section, the menu of small screens and responsive tables.
+ *
+ * Plain DOM APIs, the pages do not load jQuery unless one of their contents needs it.
+ */
+(function () {
+    "use strict";
+
+    function onReady(callback) {
+        if (document.readyState === "loading") {
+            document.addEventListener("DOMContentLoaded", callback);
+        } else {
+            callback();
+        }
+    }
+
+    function all(selector, root) {
+        return Array.prototype.slice.call((root || document).querySelectorAll(selector));
+    }
+
+    function setCurrent(element, current) {
+        element.classList.toggle("current", current);
+        element.setAttribute("aria-expanded", current ? "true" : "false");
+    }
+
+    function wrap(element, className) {
+        var wrapper = document.createElement("div");
+        wrapper.className = className;
+        element.parentNode.insertBefore(wrapper, element);
+        wrapper.appendChild(element);
+    }
+
+    // Click handlers for the elements matching a selector, also the ones added later
+    function delegate(selector, handler) {
+        document.addEventListener("click", function (event) {
+            var target = event.target.closest ? event.target.closest(selector) : null;
+            if (target) {
+                handler(target, event);
+            }
+        });
+    }
+
+    var ThemeNav = {
+        navBar: null,
+        winScroll: false,
+        winResize: false,
+        linkScroll: false,
+        winPosition: 0,
+        winHeight: null,
+        docHeight: null,
+        isRunning: false,
+
+        enable: function (withStickyNav) {
+            var self = this;
+            if (withStickyNav === undefined) {
+                withStickyNav = true;
+            }
+            if (self.isRunning) {
+                return;
+            }
+            self.isRunning = true;
+            onReady(function () {
+                self.init();
+                self.reset();
+                window.addEventListener("hashchange", function () { self.reset(); });
+                if (withStickyNav) {
+                    window.addEventListener("scroll", function () {
+                        if (!self.linkScroll && !self.winScroll) {
+                            self.winScroll = true;
+                            requestAnimationFrame(function () { self.onScroll(); });
+                        }
+                    });
+                }
+                window.addEventListener("resize", function () {
+                    if (!self.winResize) {
+                        self.winResize = true;
+                        requestAnimationFrame(function () { self.onResize(); });
+                    }
+                });
+                self.onResize();
+            });
+        },
+
+        enableSticky: function () {
+            this.enable(true);
+        },
+
+        init: function () {
+            var self = this;
+            self.navBar = document.querySelector("div.wy-side-scroll");
+
+            delegate("[data-toggle='wy-nav-top']", function () {
+                all("[data-toggle='wy-nav-shift']").forEach(function (e) { e.classList.toggle("shift"); });
+                all("[data-toggle='rst-versions']").forEach(function (e) { e.classList.toggle("shift"); });
+            });
+            delegate(".wy-menu-vertical .current ul li a", function (link) {
+                all("[data-toggle='wy-nav-shift']").forEach(function (e) { e.classList.remove("shift"); });
+                all("[data-toggle='rst-versions']").forEach(function (e) { e.classList.toggle("shift"); });
+                self.toggleCurrent(link);
+                self.hashChange();
+            });
+            delegate("[data-toggle='rst-current-version']", function () {
+                all("[data-toggle='rst-versions']").forEach(function (e) { e.classList.toggle("shift-up"); });
+            });
+
+            // Make tables responsive
+            all("table.docutils:not(.field-list):not(.footnote):not(.citation)").forEach(function (table) {
+                wrap(table, "wy-table-responsive");
+            });
+            all("table.docutils.footnote").forEach(function (table) {
+                wrap(table, "wy-table-responsive footnote");
+            });
+            all("table.docutils.citation").forEach(function (table) {
+                wrap(table, "wy-table-responsive citation");
+            });
+
+            // Add expand links to all parents of nested ul
+            all(".wy-menu-vertical ul:not(.simple)").forEach(function (ul) {
+                Array.prototype.forEach.call(ul.parentNode.children, function (link) {
+                    if (link === ul || link.tagName !== "A") {
+                        return;
+                    }
+                    var expand = document.createElement("button");
+                    expand.className = "toctree-expand";
+                    expand.title = "Open/close menu";
+                    expand.addEventListener("click", function (event) {
+                        self.toggleCurrent(link);
+                        event.stopPropagation();
+                        event.preventDefault();
+                    });
+                    link.insertBefore(expand, link.firstChild);
+                });
+            });
+        },
+
+        reset: function () {
+            // Get anchor from URL and open up nested nav
+            var anchor = encodeURI(window.location.hash) || "#";
+            try {
+                var menu = document.querySelector(".wy-menu-vertical");
+                if (!menu) {
+                    return;
+                }
+                var links = all('[href="' + anchor + '"]', menu);
+                if (links.length === 0) {
+                    // If we didn't find a link, it may be because we clicked on
+                    // something that is not in the sidenav (eg: a heading).
+                    // Find the section enclosing the anchor and use its link instead.
+                    var target = document.querySelector('.document [id="' + anchor.substring(1) + '"]');
+                    var section = target ? target.closest("div.section, section") : null;
+                    links = section ? all('[href="#' + section.id + '"]', menu) : [];
+                    if (links.length === 0) {
+                        links = all('[href="#"]', menu);
+                    }
+                }
+                if (links.length > 0) {
+                    all(".wy-menu-vertical .current").forEach(function (e) { setCurrent(e, false); });
+                    links.forEach(function (link) {
+                        setCurrent(link, true);
+                        var top = link.closest("li.toctree-l1");
+                        if (top && top.parentNode) {
+                            setCurrent(top.parentNode, true);
+                        }
+                        for (var level = 1; level <= 10; level++) {
+                            var item = link.closest("li.toctree-l" + level);
+                            if (item) {
+                                setCurrent(item, true);
+                            }
+                        }
+                    });
+                    links[0].scrollIntoView();
+                }
+            } catch (err) {
+                console.log("Error expanding nav for anchor", err);
+            }
+        },
+
+        onScroll: function () {
+            this.winScroll = false;
+            if (!this.navBar) {
+                return;
+            }
+            var newWinScroll = window.pageYOffset;
+            var winBottom = newWinScroll + this.winHeight;
+            var navPosition = this.navBar.scrollTop + (newWinScroll - this.winPosition);
+            if (newWinScroll < 0 || winBottom > this.docHeight) {
+                return;
+            }
+            this.navBar.scrollTop = navPosition;
+            this.winPosition = newWinScroll;
+        },
+
+        onResize: function () {
+            this.winResize = false;
+            this.winHeight = window.innerHeight;
+            this.docHeight = document.documentElement.scrollHeight;
+        },
+
+        hashChange: function () {
+            var self = this;
+            self.linkScroll = true;
+            window.addEventListener("hashchange", function () {
+                self.linkScroll = false;
+            }, {once: true});
+        },
+
+        toggleCurrent: function (link) {
+            var item = link.closest("li");
+            if (!item || !item.parentNode) {
+                return;
+            }
+            Array.prototype.forEach.call(item.parentNode.children, function (sibling) {
+                if (sibling === item || sibling.tagName !== "LI") {
+                    return;
+                }
+                if (sibling.classList.contains("current")) {
+                    setCurrent(sibling, false);
+                }
+                all("li.current", sibling).forEach(function (e) { setCurrent(e, false); });
+            });
+            var children = all(":scope > ul li", item);
+            if (children.length) {
+                children.forEach(function (e) { setCurrent(e, false); });
+                setCurrent(item, !item.classList.contains("current"));
+            }
+        }
+    };
+
+    window.SphinxRtdTheme = {
+        Navigation: ThemeNav,
+        // Backwards compatible name
+        StickyNav: ThemeNav
+    };
+})();
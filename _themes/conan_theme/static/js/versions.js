@@ -0,0 +1,54 @@
+/*
+ * Fills the version selector from the versions.json shared by all the versions of the docs,
+ * so publishing a new version does not require rebuilding the old ones. The list is kept in
+ * localStorage for a while, and refreshed in the background after that.
+ */
+const VersionSelector = {
+  storageKey: "conan-docs-versions",
+  maxAge: 60 * 60 * 1000,
+
+  load: (url) => {
+    const list = document.querySelector(".rst-other-versions .versions-list");
+    if (!list) return;
+    let cached = null;
+    try {
+      cached = JSON.parse(localStorage.getItem(VersionSelector.storageKey));
+    } catch (e) {}
+    if (cached && cached.url === url) {
+      VersionSelector.render(list, cached.versions);
+      if (Date.now() - cached.time < VersionSelector.maxAge) return;
+    }
+    fetch(url)
+      .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+      .then((versions) => {
+        try {
+          localStorage.setItem(VersionSelector.storageKey,
+                               JSON.stringify({ url: url, time: Date.now(), versions: versions }));
+        } catch (e) {}  // Full or disabled storage, fetch it again next time
+        VersionSelector.render(list, versions);
+      })
+      .catch(() => {});
+  },
+
+  render: (list, versions) => {
+    // 2.x versions first, then the 1.x ones (named "en/1.x" in the server)
+    const names = Object.keys(versions);
+    const groups = [
+      names.filter((v) => v.startsWith("2")),
+      names.filter((v) => v.startsWith("en/1.") || v.startsWith("1")),
+    ];
+    const items = [];
+    groups.forEach((group, i) => {
+      if (i > 0) items.push(document.createElement("br"));
+      group.forEach((version) => {
+        const dd = document.createElement("dd");
+        const a = document.createElement("a");
+        a.href = `/${version}/index.html`;
+        a.textContent = version.replace("en/", "");
+        dd.appendChild(a);
+        items.push(dd);
+      });
+    });
+    list.replaceChildren(list.firstElementChild, ...items);
+  },
+};
@@ -1,4 +1 @@
-:loop
-CALL make html
-timeout /t 2 /nobreak
-goto loop
\ No newline at end of file
+python autobuild.py %*
@@ -1,8 +1,3 @@
-# Don't wait till any change is done
-echo Building HTML files && make html
-watchmedo shell-command \
-    --patterns="*.rst" \
-    --recursive \
-    --command='echo Rebuilding && make html' \
-    --drop
-    .
+# Build once and rebuild incrementally on every change, serving the docs with live reload
+# at http://127.0.0.1:8000/index.html (see "python autobuild.py -h" for the options)
+python autobuild.py "$@"
@@ -0,0 +1,212 @@
+"""
+Live-rebuild server for writing the docs.
+
+Keeps a single Sphinx application (and its environment) in memory, so after the
+first build every change only re-reads the modified documents and the ones that
+depend on them (includes, literalincludes, templates...). Bursts of saves are
+debounced into a single rebuild and the open browser tabs are reloaded when it
+finishes.
+
+    $ python autobuild.py [--port 8000] [--delay 0.3] [-j auto]
+
+Changes to conf.py or to the Sphinx extensions restart the application.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from watchdog.events import (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED, EVENT_TYPE_MODIFIED,
+                             EVENT_TYPE_MOVED, FileSystemEventHandler)
+from watchdog.observers import Observer
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = os.path.join(SRC_DIR, "_build")
+OUT_DIR = os.path.join(BUILD_DIR, "html")
+DOCTREE_DIR = os.path.join(BUILD_DIR, "doctrees")
+
+IGNORED_DIRS = ("_build", ".git", "conan_sources", "__pycache__")
+# Sources, includes, examples, templates, theme and static files
+WATCHED_SUFFIXES = (".rst", ".inc", ".txt", ".py", ".html", ".conf", ".css", ".js", ".json",
+                    ".png", ".jpg", ".gif", ".svg", ".yml", ".cmake")
+# Changes to these need a new Sphinx application, not just an incremental build
+RESTART_PATHS = ("conf.py", "_ext" + os.sep, os.path.join("_themes", "conan_theme", "__init__.py"))
+
+RELOAD_SCRIPT = b"""<script>
+new EventSource("/__livereload").onmessage = function() { location.reload(); };
+</script>
+"""
+
+
+class ChangeCollector(FileSystemEventHandler):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.last_event = 0
+
+    def on_any_event(self, event):
+        # Sphinx itself opens and reads the sources, ignore anything but writes
+        if event.is_directory or event.event_type not in (EVENT_TYPE_CREATED, EVENT_TYPE_DELETED,
+                                                          EVENT_TYPE_MODIFIED, EVENT_TYPE_MOVED):
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if not path:
+                continue
+            rel_path = os.path.relpath(path, SRC_DIR)
+            if rel_path.split(os.sep)[0] in IGNORED_DIRS or not rel_path.endswith(WATCHED_SUFFIXES):
+                continue
+            with self.lock:
+                self.changed.add(rel_path)
+                self.last_event = time.monotonic()
+
+    def wait_changes(self, delay):
+        """ Block until there are changes and no new event arrived in the last ``delay`` seconds
+        """
+        while True:
+            time.sleep(delay / 3)
+            with self.lock:
+                if self.changed and time.monotonic() - self.last_event >= delay:
+                    changed, self.changed = self.changed, set()
+                    return changed
+
+
+class Reloader:
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.generation = 0
+
+    def notify(self):
+        with self.condition:
+            self.generation += 1
+            self.condition.notify_all()
+
+    def wait(self, generation, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.generation != generation, timeout=timeout)
+            return self.generation
+
+
+def make_handler(reloader):
+
+    class LiveReloadHandler(SimpleHTTPRequestHandler):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=OUT_DIR, **kwargs)
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/__livereload":
+                return self.send_events()
+            path = self.translate_path(self.path)
+            if os.path.isdir(path):
+                path = os.path.join(path, "index.html")
+            if not path.endswith(".html") or not os.path.isfile(path):
+                return super().do_GET()
+
+            with open(path, "rb") as f:
+                content = f.read()
+            content = content.replace(b"</body>", RELOAD_SCRIPT + b"</body>", 1)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(content)
+
+        def send_events(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            generation = reloader.generation
+            try:
+                while True:
+                    new_generation = reloader.wait(generation, timeout=15)
+                    if new_generation != generation:
+                        generation = new_generation
+                        self.wfile.write(b"data: reload\n\n")
+                    else:
+                        self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return LiveReloadHandler
+
+
+def create_app(jobs):
+    from sphinx.application import Sphinx
+    from sphinx.util.parallel import parallel_available
+
+    # Drop the modules loaded by a previous application from the extensions and the
+    # theme, so changes to conf.py, the extensions or the theme are picked up
+    local_dirs = tuple(os.path.join(SRC_DIR, d) + os.sep for d in ("_ext", "_themes"))
+    for name, module in list(sys.modules.items()):
+        if os.path.abspath(getattr(module, "__file__", None) or "").startswith(local_dirs):
+            del sys.modules[name]
+    # conf.py loads the extensions of this builder only
+    os.environ["CONAN_DOCS_BUILDER"] = "html"
+    return Sphinx(SRC_DIR, SRC_DIR, OUT_DIR, DOCTREE_DIR, "html",
+                  parallel=jobs if parallel_available else 0)
+
+
+def build(app):
+    start = time.monotonic()
+    try:
+        app.build()
+    except Exception as e:
+        print(f"Build failed: {e}")
+        return False
+    print(f"Build finished in {time.monotonic() - start:.2f}s")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the docs and rebuild them incrementally on changes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--delay", type=float, default=0.3,
+                        help="Seconds without changes to wait before rebuilding")
+    parser.add_argument("-j", "--jobs", default="1",
+                        help="Parallel jobs for the Sphinx build, a number or 'auto'")
+    args = parser.parse_args()
+    jobs = os.cpu_count() if args.jobs == "auto" else int(args.jobs)
+
+    app = create_app(jobs)
+    build(app)
+
+    reloader = Reloader()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(reloader))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving on http://{args.host}:{args.port}/index.html")
+
+    collector = ChangeCollector()
+    observer = Observer()
+    observer.schedule(collector, SRC_DIR, recursive=True)
+    observer.start()
+    try:
+        while True:
+            changed = collector.wait_changes(args.delay)
+            print(f"Changed: {', '.join(sorted(changed))}")
+            if any(p.startswith(RESTART_PATHS) for p in changed):
+                print("Configuration or extensions changed, restarting Sphinx")
+                app = create_app(jobs)
+            if build(app):
+                reloader.notify()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Benchmark of the docs build pipeline over synthetic corpora.
+
+Generates documentation trees of several sizes that use the same features as the
+real docs (autocommand:: with a local stub "conan", conan-home-file::, includes of
+common/*.inc, sphinx_tabs, graphviz, cross references and long code-blocks),
+built with the same theme and the extensions that conf.py loads for the html
+builder (with their caches), and times for each size and -j level:
+
+- clean: build from scratch, no doctrees nor caches
+- noop: build again without changes
+- edit: build after modifying a single page
+- cached: build a new checkout (no doctrees nor output) with the caches of the
+  previous builds, as CI does
+
+    $ python benchmarks/bench_build.py --sizes 100 1000 --jobs 1 4
+    $ python benchmarks/bench_build.py --compare <commit_a> <commit_b>
+
+Results are stored as _build/bench/results/<commit>.json (``--results``) to compare
+across commits, out of the sources like the rest of the build outputs.
+"""
+import argparse
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import time
+
+DOCS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(DOCS_DIR, "_build", "bench", "results")
+
+INCLUDES = 10
+PAGES_PER_SECTION = 100
+
+CONF_PY = """\
+import sys
+sys.path.append({themes!r})
+sys.path.append({ext!r})
+import conan_theme
+
+# The extensions of the conf.py of the docs for the html builder
+extensions = {extensions!r}
+startup_stub_directives = {stub_directives!r}
+doctreecache_enabled = True
+project = 'bench'
+master_doc = 'index'
+exclude_patterns = ['_build', 'bin', 'home']
+html_theme = 'conan_theme'
+html_theme_path = conan_theme.get_html_theme_path()
+html_context = {{'versions': {{'master': '2.0'}}, 'current_version': '2.0'}}
+pygments_style = 'sas'
+graphviz_output_format = 'svg'
+"""
+
+STUB_CONAN = """\
+#!{python}
+import sys
+if sys.argv[1:] == ["config", "home"]:
+    print({home!r})
+elif sys.argv[1:] == ["--version"]:
+    print("Conan version 2.0.0-bench")
+else:
+    print("usage: conan " + " ".join(sys.argv[1:]))
+    for i in range(40):
+        print("  --option-%d  Some help text for the option number %d of the command" % (i, i))
+"""
+
+CODE_BLOCK = """
+.. code-block:: python
+
+{code}
+"""
+
+PYTHON_CODE = "\n".join(f"    def method_{i}(self, value):\n        return self.settings.get('key_{i}', value) * {i}"
+                        for i in range(20))
+
+
+def page(index, size):
+    section = index // PAGES_PER_SECTION
+    lines = [f".. _page_{index}:", "", f"Page {index}", "=" * (len(str(index)) + 5), ""]
+    lines.append("Some introduction text for the page, with a reference to "
+                 f":ref:`the next page<page_{(index + 1) % size}>` and a ``literal``.\n")
+    lines.append(f".. include:: /common/snippet_{index % INCLUDES}.inc\n")
+    for s in range(3):
+        title = f"Section {s}"
+        lines += [title, "-" * len(title), "", "Paragraph " * 40, ""]
+        lines.append(CODE_BLOCK.format(code=PYTHON_CODE))
+    if index % 10 == 0:
+        lines += [".. autocommand::", f"    :command: conan command{index} -h", ""]
+    if index % 20 == 0:
+        lines += [".. conan-home-file::", "   :file-path: settings.yml", "   :language: yaml", ""]
+    if index % 10 == 5:
+        lines += [".. tabs::", ""]
+        for tab in ("Linux", "Windows"):
+            lines += [f"   .. tab:: {tab}", "", "      .. code-block:: bash", "",
+                      f"          $ conan install . -s os={tab}", ""]
+    if index % 15 == 0:
+        lines += [".. graphviz::", "", f"   digraph page{index} {{ a -> b; b -> c; a -> c; }}", ""]
+    return f"section_{section}/page_{index}", "\n".join(lines)
+
+
+def docs_extensions(builder):
+    """ The extensions (and the stub directives of the ones not loaded) of conf.py for a builder,
+    from executing it as sphinx-build would, with conf.extensions and startup.select_extensions
+    """
+    script = ("import json, runpy; conf = runpy.run_path('conf.py'); "
+              "print(json.dumps([conf['extensions'], list(conf.get('startup_stub_directives', ()))]))")
+    env = {k: v for k, v in os.environ.items() if not k.startswith("CONAN_DOCS_")}
+    env["CONAN_DOCS_BUILDER"] = builder
+    out = subprocess.check_output([sys.executable, "-c", script], cwd=DOCS_DIR, env=env, text=True)
+    return json.loads(out.splitlines()[-1])
+
+
+def generate(folder, size):
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(os.path.join(folder, "common"))
+    os.makedirs(os.path.join(folder, "bin"))
+    home = os.path.join(folder, "home")
+    os.makedirs(home)
+    with open(os.path.join(home, "settings.yml"), "w") as f:
+        f.write("\n".join(f"setting_{i}: [a, b, c]" for i in range(100)))
+
+    conan = os.path.join(folder, "bin", "conan")
+    with open(conan, "w") as f:
+        f.write(STUB_CONAN.format(python=sys.executable, home=home))
+    os.chmod(conan, os.stat(conan).st_mode | stat.S_IEXEC)
+
+    with open(os.path.join(folder, "conf.py"), "w") as f:
+        extensions, stub_directives = docs_extensions("html")
+        f.write(CONF_PY.format(themes=os.path.join(DOCS_DIR, "_themes"), ext=os.path.join(DOCS_DIR, "_ext"),
+                               extensions=extensions, stub_directives=tuple(stub_directives)))
+    for i in range(INCLUDES):
+        with open(os.path.join(folder, "common", f"snippet_{i}.inc"), "w") as f:
+            f.write(f".. note::\n\n    Common snippet {i} included from many pages.\n")
+
+    sections = {}
+    for i in range(size):
+        docname, content = page(i, size)
+        sections.setdefault(os.path.dirname(docname), []).append(os.path.basename(docname))
+        os.makedirs(os.path.join(folder, os.path.dirname(docname)), exist_ok=True)
+        with open(os.path.join(folder, docname + ".rst"), "w") as f:
+            f.write(content)
+    for section, pages in sections.items():
+        with open(os.path.join(folder, section, "index.rst"), "w") as f:
+            f.write(f"{section}\n{'=' * len(section)}\n\n.. toctree::\n   :maxdepth: 1\n\n")
+            f.write("".join(f"   {p}\n" for p in pages))
+    with open(os.path.join(folder, "index.rst"), "w") as f:
+        f.write("Benchmark\n=========\n\n.. toctree::\n   :maxdepth: 2\n\n")
+        f.write("".join(f"   {s}/index\n" for s in sorted(sections)))
+
+
+def build(folder, jobs):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("CONAN_DOCS_")}
+    env["PATH"] = os.path.join(folder, "bin") + os.pathsep + env.get("PATH", "")
+    cmd = [sys.executable, "-m", "sphinx", "-b", "html", "-q", "-j", str(jobs),
+           "-d", os.path.join(folder, "_build", "doctrees"), folder, os.path.join(folder, "_build", "html")]
+    start = time.monotonic()
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    elapsed = time.monotonic() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"Build failed:\n{proc.stdout}")
+    return round(elapsed, 3)
+
+
+def run_scenarios(folder, jobs):
+    shutil.rmtree(os.path.join(folder, "_build"), ignore_errors=True)
+    results = {"clean": build(folder, jobs)}
+    results["noop"] = build(folder, jobs)
+    with open(os.path.join(folder, "section_0", "page_1.rst"), "a") as f:
+        f.write(f"\nEdited at {time.time()}\n")
+    results["edit"] = build(folder, jobs)
+    for name in ("doctrees", "html"):
+        shutil.rmtree(os.path.join(folder, "_build", name))
+    results["cached"] = build(folder, jobs)
+    return results
+
+
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=DOCS_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results_dir, commit_a, commit_b):
+    with open(os.path.join(results_dir, f"{commit_a}.json")) as f:
+        a = json.load(f)["results"]
+    with open(os.path.join(results_dir, f"{commit_b}.json")) as f:
+        b = json.load(f)["results"]
+    print(f"{'size':>6} {'-j':>3} {'scenario':>8} {commit_a:>10} {commit_b:>10} {'change':>8}")
+    for key in sorted(set(a) & set(b), key=lambda k: tuple(int(x) for x in k.split("/"))):
+        size, jobs = key.split("/")
+        for scenario, time_a in a[key].items():
+            time_b = b[key].get(scenario)
+            if time_b is not None:
+                change = (time_b - time_a) / time_a * 100 if time_a else 0
+                print(f"{size:>6} {jobs:>3} {scenario:>8} {time_a:>9.2f}s {time_b:>9.2f}s {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the docs build over synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--workdir", default=os.path.join(DOCS_DIR, "_build", "bench"))
+    parser.add_argument("--results", default=RESULTS_DIR, help="Folder of the stored results")
+    parser.add_argument("--compare", nargs=2, metavar=("COMMIT_A", "COMMIT_B"),
+                        help="Compare two stored results instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.results, *args.compare)
+        return
+
+    results = {}
+    for size in args.sizes:
+        folder = os.path.join(args.workdir, f"corpus_{size}")
+        generate(folder, size)
+        for jobs in args.jobs:
+            timings = run_scenarios(folder, jobs)
+            results[f"{size}/{jobs}"] = timings
+            print(f"{size:>6} pages, -j {jobs}: " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+
+    commit = current_commit()
+    os.makedirs(args.results, exist_ok=True)
+    result_path = os.path.join(args.results, f"{commit}.json")
+    with open(result_path, "w") as f:
+        json.dump({"commit": commit, "python": sys.version.split()[0], "cpus": os.cpu_count(),
+                   "results": results}, f, indent=2)
+    print(f"Results stored in {result_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Build several versions of the docs at once.
+
+Every version listed in versions.json is checked out in its own git worktree
+(the current checkout is never touched), all of them are built concurrently and
+the outputs are assembled in a single publish tree, one folder per version,
+like the published site:
+
+    $ python build_versions.py [-j 4] [--output _build/versions] [--only 2.28 2.27]
+
+Version keys map to release branches ("2.28" -> "release/2.28", "en/1.66" ->
+"release/1.66"), any other key (like "master") builds the current HEAD.
+All the builds share the autocommand cache. Every version is built in its own
+worktree (``_build/html``), kept for the incremental builds of the next runs, and
+then copied to the publish tree, where identical files (theme fonts, scripts...)
+are hard-linked to a single copy. The build outputs are never linked, the next
+builds rewrite some of their files in place. Failed versions keep their previous
+folder in the publish tree.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def git(*args, cwd=SRC_DIR):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, text=True).stdout.strip()
+
+
+def version_ref(version, remote):
+    name = version.replace("en/", "")
+    if not name[:1].isdigit():
+        return git("rev-parse", "HEAD")
+    branch = f"release/{name}"
+    return f"{remote}/{branch}" if remote else branch
+
+
+def prepare_worktree(worktrees_dir, version, ref):
+    path = os.path.join(worktrees_dir, version.replace("/", "_"))
+    if os.path.exists(path):
+        git("checkout", "--detach", "--force", ref, cwd=path)
+    else:
+        git("worktree", "add", "--detach", "--force", path, ref)
+    # All versions get the same versions.json, for the selector of local builds
+    shutil.copyfile(os.path.join(SRC_DIR, "versions.json"), os.path.join(path, "versions.json"))
+    return path
+
+
+def build_version(version, path, args):
+    start = time.monotonic()
+    outdir = os.path.join(path, "_build", "html")
+    cmd = [sys.executable, "-m", "sphinx", "-b", "html", "-q",
+           "-j", args.sphinx_jobs,
+           "-d", os.path.join(path, "_build", "doctrees"),
+           "-D", f"autocommand_cache_dir={args.cache}",
+           path, outdir]
+    log_path = path + ".log"
+    with open(log_path, "w") as log:
+        proc = subprocess.run(cmd, cwd=path, stdout=log, stderr=subprocess.STDOUT)
+    error = None if proc.returncode == 0 else f"sphinx-build exited with {proc.returncode}, see {log_path}"
+    return error, round(time.monotonic() - start, 2)
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def publish_outputs(output, built):
+    """ Copies the (version, build output) to the publish tree, files with the same content
+    as one already there are hard-linked to it. Returns the bytes deduplicated
+    """
+    replaced = [os.path.join(output, version) for version, _ in built]
+    for folder in replaced:
+        shutil.rmtree(folder, ignore_errors=True)
+    # The files of the versions not built this time, published in previous runs. Not the
+    # ones at the root (versions.json, build-summary.json), they are written in place
+    seen = {}
+    for root, _, files in os.walk(output):
+        if root == output:
+            continue
+        for name in files:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                seen.setdefault(file_digest(path), path)
+
+    saved = 0
+    for (version, build_dir), folder in zip(built, replaced):
+        for root, _, files in os.walk(build_dir):
+            target_dir = os.path.join(folder, os.path.relpath(root, build_dir))
+            os.makedirs(target_dir, exist_ok=True)
+            for name in files:
+                source = os.path.join(root, name)
+                target = os.path.join(target_dir, name)
+                digest = file_digest(source)
+                if digest in seen:
+                    os.link(seen[digest], target)
+                    saved += os.path.getsize(target)
+                else:
+                    shutil.copy2(source, target)
+                    seen[digest] = target
+    return saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all the versions in versions.json concurrently")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Maximum number of versions built at the same time")
+    parser.add_argument("--sphinx-jobs", default="1", help="'-j' passed to each sphinx-build")
+    parser.add_argument("--output", default=os.path.join("_build", "versions"))
+    parser.add_argument("--worktrees", default=os.path.join("_build", ".worktrees"))
+    parser.add_argument("--cache", default=os.path.join("_build", ".cache", "autocommand"),
+                        help="autocommand cache shared by all the builds")
+    parser.add_argument("--remote", default="origin", help="Remote of the release branches, '' for local ones")
+    parser.add_argument("--only", nargs="*", help="Build only these versions")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+    args.worktrees = os.path.abspath(args.worktrees)
+    args.cache = os.path.abspath(args.cache)
+
+    versions_path = os.path.join(SRC_DIR, "versions.json")
+    if not os.path.exists(versions_path):
+        print(f"{versions_path} not found, nothing to build")
+        return 1
+    with open(versions_path) as f:
+        versions = list(json.load(f))
+    if args.only:
+        versions = [v for v in versions if v in args.only]
+    os.makedirs(args.worktrees, exist_ok=True)
+
+    start = time.monotonic()
+    results = {}
+    builds = []
+    # git takes locks when adding worktrees, so prepare them serially before the builds
+    for version in versions:
+        results[version] = {"version": version, "ref": None, "status": "ok", "seconds": None, "error": None}
+        try:
+            ref = version_ref(version, args.remote)
+            results[version]["ref"] = ref
+            builds.append((version, prepare_worktree(args.worktrees, version, ref)))
+        except subprocess.CalledProcessError as e:
+            results[version].update(status="failed", error=f"{' '.join(e.cmd)}: {e.stderr.strip()}")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = {version: executor.submit(build_version, version, path, args) for version, path in builds}
+    worktrees = dict(builds)
+    built = []
+    for version, future in futures.items():
+        try:
+            error, seconds = future.result()
+        except Exception as e:
+            error, seconds = f"{type(e).__name__}: {e}", None
+        results[version].update(status="failed" if error else "ok", error=error, seconds=seconds)
+        if not error:
+            built.append((version, os.path.join(worktrees[version], "_build", "html")))
+    results = list(results.values())
+
+    os.makedirs(args.output, exist_ok=True)
+    saved = publish_outputs(args.output, built)
+    # The version selector of every version loads this one, publishing a version only updates it
+    shutil.copyfile(versions_path, os.path.join(args.output, "versions.json"))
+
+    summary = {"seconds": round(time.monotonic() - start, 2),
+               "deduplicated_bytes": saved,
+               "versions": results}
+    with open(os.path.join(args.output, "build-summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    for r in results:
+        print(f"{r['version']:>12}  {r['status']:>6}  {r['seconds'] if r['seconds'] is not None else '-':>8}s  {r['error'] or ''}")
+    print(f"Built {len(results)} versions in {summary['seconds']}s, {saved} bytes deduplicated")
+    return 1 if any(r["status"] != "ok" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,8 +11,6 @@
 #
 # All configuration values have a default; values that are commented out
 # serve to show the default.
-import pathlib
-import subprocess
 import sys
 import os
 from shutil import copyfile
@@ -32,6 +30,8 @@ sys.path.append(os.path.abspath('./_themes'))
 sys.path.append(os.path.abspath(path_to_conan_sources))
 sys.path.append(os.path.abspath('./_ext'))
 
+import startup
+
 
 # -- General configuration ------------------------------------------------
 
@@ -42,24 +42,79 @@ sys.path.append(os.path.abspath('./_ext'))
 # extensions coming with Sphinx (named 'sphinx.ext.*') or your custom
 # ones.
 extensions = [
+    'startup',  # The first one, it times the loading of the rest
     'conan_theme',
     'sphinxcontrib.spelling',
     'sphinx_sitemap',
     'notfound.extension',
     'sphinx.ext.autodoc',
+    'staticautodoc',
     'sphinx.ext.graphviz',
+    'graphvizcache',
     'sphinx.ext.todo',
     'sphinx_tabs.tabs',
     'sphinxcontrib.jquery',
     'sphinxcontrib.youtube',
     'autocommand',
     'conanhomefile',
+    'buildprofile',
+    'imageoptim',
+    'searchshards',
+    'staticassets',
+    'linkcheckcache',
+    'spellingcache',
+    'redirects',
+    'doctreecache',
+    'gitdates',
+    'impactgraph',
+    'highlightcache',
+    'htmlminify',
+    'latexchapters',
 ]
 
+# Extensions only loaded for some builders (_ext/startup.py), the rest are always loaded
+builder_extensions = {
+    'conan_theme': startup.HTML_BUILDERS,
+    'sphinxcontrib.jquery': startup.HTML_BUILDERS,
+    'notfound.extension': startup.HTML_BUILDERS,
+    'imageoptim': startup.HTML_BUILDERS,
+    'searchshards': startup.HTML_BUILDERS,
+    'staticassets': startup.HTML_BUILDERS,
+    'gitdates': startup.HTML_BUILDERS,
+    'impactgraph': ('html', 'dirhtml'),
+    'htmlminify': ('html', 'dirhtml'),
+    'sphinx_sitemap': ('html', 'dirhtml'),
+    'redirects': ('html', 'dirhtml'),
+    'sphinxcontrib.spelling': ('spelling',),
+    'spellingcache': ('spelling',),
+    'linkcheckcache': ('linkcheck',),
+    'latexchapters': ('latex',),
+}
+extensions = startup.select_extensions(extensions, builder_extensions, startup.active_builder())
+if not os.path.isdir(path_to_conan_sources):
+    # Nothing to document, the auto* directives render nothing
+    extensions = [e for e in extensions if e not in ('sphinx.ext.autodoc', 'staticautodoc')]
+    startup_stub_directives = startup.AUTODOC_DIRECTIVES
+
+# Doctrees and environments reused between builds (_ext/doctreecache.py), only when CI
+# points this to a folder shared by the builds of all the branches, one per concurrent job
+doctreecache_enabled = 'CONAN_DOCS_DOCTREE_CACHE' in os.environ
+doctreecache_dir = os.environ.get('CONAN_DOCS_DOCTREE_CACHE', '_build/.cache/doctrees')
+
+# Minified pages with inlined critical CSS (_ext/htmlminify.py), for the published docs
+htmlminify_enabled = os.environ.get('CONAN_DOCS_MINIFY', '') == '1'
+
+# Warn when the build takes longer than this to start reading the documents. Disabled by
+# default: make html builds with -W, a slow machine would fail the build
+startup_budget = float(os.environ.get('CONAN_DOCS_STARTUP_BUDGET', '0'))
+
 # autodoc configuration
 add_module_names = False
 autoclass_content = 'both'
 autodoc_member_order = 'bysource'  # To order the methods following the order at the code, not alphabetically
+# The auto* directives parse the conan_sources instead of importing them (_ext/staticautodoc.py),
+# the mocked imports are only used with staticautodoc_enabled = False
+staticautodoc_path = path_to_conan_sources
 autodoc_mock_imports = ["PyJWT", "requests", "urllib3", "PyYAML",
                         "patch-ng", "fasteners", "six", "node-semver", "distro",
                         "pygments", "tqdm", "Jinja2", "MarkupSafe", "Jinja2",
@@ -179,7 +234,10 @@ sitemap_excludes = ["search", "genindex", "404", "Page Not Found"]
 # Theme options are theme-specific and customize the look and feel of a theme
 # further. For a list of options available for each theme, see the
 # documentation.
-html_theme_options = {}
+html_theme_options = {
+    # The version selector loads the versions from here, shared by all the versions
+    'versions_url': '/versions.json',
+}
 
 
 # Add any paths that contain custom themes here, relative to this directory.
@@ -217,6 +275,7 @@ html_css_files = [
 
 # If not '', a 'Last updated on:' timestamp is inserted at every page bottom,
 # using the given strftime format.
+# The dates of the last commits of the pages (_ext/gitdates.py), also the lastmod of the sitemap
 html_last_updated_fmt = '%b %d, %Y'
 
 # If true, SmartyPants will be used to convert quotes and dashes to
@@ -289,6 +348,8 @@ latex_elements = {
 #'figure_align': 'htbp',
 }
 
+# The LaTeX files are split in one file per chapter (_ext/latexchapters.py), that
+# latexpdf.py builds incrementally ("make latexpdf").
 # Grouping the document tree into LaTeX files. List of tuples
 # (source start file, target name, title,
 #  author, documentclass [howto, manual, or own class]).
@@ -429,6 +490,10 @@ linkcheck_ignore = [r'http://localhost:\d+', r'https://github.com/conan-io/conan
 linkcheck_workers = 15
 linkcheck_timeout = 90
 linkcheck_retries = 2
+# Incremental linkcheck (_ext/linkcheckcache.py): checked results are kept in _build/.cache/linkcheck.json,
+# use "-D linkcheckcache_refresh=1" to check all the links again
+linkcheckcache_host_workers = 4
+linkcheckcache_hosts = {'github.com': {'workers': 2, 'delay': 0.5}}
 
 # Not Found
 notfound_pagename = 'Page Not Found'
@@ -436,36 +501,7 @@ notfound_pagename = 'Page Not Found'
 # Graphviz output format, one of png, svg
 graphviz_output_format = 'svg'
 
-# copy legacy redirects
-def copy_legacy_redirects(app, docname): # Sphinx expects two arguments
-    # FILL in this dicts the necessary redirects
-    redirect_files = {    
-    }
-
-    redirect_template = """<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <meta http-equiv="refresh" content="1; url=%s" />
-</head>
-</html>
-"""
-
-    outdir = pathlib.Path(app.outdir)
-    if app.builder.name == 'html':
-        for html_src_path, dst_path in redirect_files.items():
-            target_path = outdir / html_src_path
-            html = redirect_template % dst_path
-            if not os.path.exists(os.path.dirname(target_path)):
-                os.makedirs(os.path.dirname(target_path))
-            with open(target_path, "w") as f:
-                f.write(html)
-
-def get_conan_version():
-    out, _ = subprocess.Popen("conan --version", stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, shell=True).communicate()
-    return out
-
-def setup(app):
-    app.connect('build-finished', copy_legacy_redirects)
-    # Run Conan once, so autocommands are executed without migrations
-    print("Running with Conan version: ", get_conan_version().decode().strip())
+# Redirects (_ext/redirects.py): the pages removed since the previous build are redirected
+# automatically, FILL in this dict the other necessary redirects, old page -> new URL
+redirects = {
+}
@@ -0,0 +1,148 @@
+"""
+Change-impact analysis: the pages to rebuild and upload for a git diff.
+
+Uses the dependency graph that ``_ext/impactgraph.py`` saves in every HTML build
+(``_build/.cache/impact.json``). A page is affected when its source, a file it
+includes or a Conan home file it shows changes, and also the pages linking to an
+affected one, as links show the titles of their targets. Changes to conf.py, the
+extensions, templates, theme or static files, new or removed documents, and
+changes to the titles or toctrees of any source affect all the pages.
+
+    $ python impact.py --base origin/develop2
+    $ python impact.py --base origin/develop2 --output pages > upload.txt
+
+With ``--output json`` (default) it prints ``{"full": ..., "reason": ..., "docs": [...],
+"sources": [...], "pages": [...]}``, that a partial build can consume::
+
+    $ python impact.py --base origin/develop2 > _build/impact-changes.json
+    $ sphinx-build -b html -D impactgraph_changes=_build/impact-changes.json . _build/html
+    $ python impact.py --pages-of _build/impact-changes.json > upload.txt
+
+as ``make html-changed BASE=origin/develop2`` does. ``--pages-of`` lists the pages of
+the analyzed documents with the graph of the new build, that knows their new images,
+or all the pages of the graph when the analysis asked for a full build.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SRC_DIR, "_ext"))
+
+from impactgraph import TEXT_SUFFIXES, file_hash, load_graph, structure_fingerprint  # noqa: E402
+
+# Outputs generated from all the documents, that change with any of them
+INDEX_PAGES = ["genindex.html", "objects.inv"]
+
+
+def git_lines(*args):
+    output = subprocess.run(["git", "-c", "core.quotePath=false", *args], cwd=SRC_DIR,
+                            stdout=subprocess.PIPE, text=True, check=True).stdout
+    return [line for line in output.splitlines() if line]
+
+
+def changed_files(base, worktree):
+    files = set(git_lines("diff", "--name-only", "--no-renames", f"{base}...HEAD"))
+    if worktree:
+        files.update(git_lines("diff", "--name-only", "--no-renames", "HEAD"))
+        files.update(git_lines("ls-files", "--others", "--exclude-standard"))
+    # The outputs and caches of the builds are not sources
+    return sorted(f for f in files if not f.startswith("_build/"))
+
+
+def full(reason):
+    return {"full": True, "reason": reason, "docs": [], "sources": [], "pages": []}
+
+
+def analyze(graph, changed):
+    docs = graph["docs"]
+    sources = {doc["source"]: docname for docname, doc in docs.items()}
+    dependents = {}
+    referrers = {}
+    for docname, doc in docs.items():
+        for dep in doc["dependencies"]:
+            dependents.setdefault(dep, set()).add(docname)
+        for target in doc["references"]:
+            referrers.setdefault(target, set()).add(docname)
+
+    affected = set()
+    for path in changed:
+        if any(path == g or (g.endswith("/") and path.startswith(g)) for g in graph["global"]):
+            return full(f"{path} affects all the pages")
+        full_path = os.path.join(SRC_DIR, path)
+        if path in sources:
+            docname = sources[path]
+            if not os.path.exists(full_path):
+                return full(f"{path} was removed")
+            if structure_fingerprint(full_path) != docs[docname]["structure"]:
+                return full(f"the titles or toctrees of {path} changed")
+            affected.add(docname)
+        elif path.endswith(".rst") and path not in dependents and os.path.exists(full_path):
+            return full(f"{path} is a new document")
+        if path in dependents:
+            if path.endswith(TEXT_SUFFIXES) and structure_fingerprint(full_path) != graph["structure"].get(path):
+                return full(f"the titles or toctrees included from {path} changed")
+            affected.update(dependents[path])
+
+    for path, external in graph["external"].items():
+        if file_hash(path) != external["hash"]:
+            affected.update(external["docs"])
+
+    for docname in list(affected):
+        affected.update(referrers.get(docname, ()))
+
+    affected = sorted(affected)
+    return {"full": False, "reason": None, "docs": affected,
+            "sources": [docs[d]["source"] for d in affected], "pages": document_pages(graph, affected)}
+
+
+def document_pages(graph, docnames):
+    pages = set()
+    for docname in docnames:
+        doc = graph["docs"].get(docname)
+        if doc is not None:
+            pages.add(doc["page"])
+            pages.update(doc["images"])
+    if pages:
+        pages.update(INDEX_PAGES)
+    return sorted(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pages affected by the changes since a git revision")
+    parser.add_argument("--base", default="origin/develop2", help="Revision to compare HEAD with")
+    parser.add_argument("--worktree", action="store_true", help="Include the uncommitted and untracked changes")
+    parser.add_argument("--graph", default=os.path.join(SRC_DIR, "_build", ".cache", "impact.json"),
+                        help="Dependency graph saved by the HTML build")
+    parser.add_argument("--output", choices=["json", "docs", "sources", "pages"], default="json")
+    parser.add_argument("--pages-of", metavar="JSON", help="List the pages of the documents of a previous analysis")
+    args = parser.parse_args()
+
+    graph = load_graph(args.graph)
+    if args.pages_of:
+        args.output = "pages"
+    if graph is None:
+        result = full(f"no dependency graph in {args.graph}, build the docs first")
+    elif args.pages_of:
+        with open(args.pages_of) as f:
+            result = json.load(f)
+        # After a full build every page of the graph, that the build just saved, is new
+        result["pages"] = document_pages(graph, graph["docs"] if result["full"] else result["docs"])
+    else:
+        result = analyze(graph, changed_files(args.base, args.worktree))
+
+    if args.output == "json":
+        print(json.dumps(result, indent=4))
+    else:
+        if result["full"]:
+            print(f"Full build: {result['reason']}", file=sys.stderr)
+        print("\n".join(result[args.output]))
+        if result["full"] and args.output == "pages" and not result["pages"]:
+            return 1  # Nothing to upload would leave the published docs out of date
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
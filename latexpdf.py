@@ -0,0 +1,154 @@
+"""
+Incremental PDF build of the LaTeX output split in chapters by ``_ext/latexchapters.py``.
+
+    $ python latexpdf.py _build/latex [-j 4]
+
+For every ``<target>.tex`` with a ``<target>.chapters.json``:
+
+- Nothing is compiled when the inputs (main file, chapters, styles and images)
+  have the same hashes of the last successful build and the PDF exists. The date
+  of the title page is ignored, it changes every day.
+- When only some chapters changed, each of them is typeset alone and in parallel
+  (``\\includeonly``, without PDF output, in a private output folder), with the
+  ``.aux`` of the rest of chapters from the previous build. Their new ``.aux``
+  are then copied back, so the labels, page numbers and table of contents are
+  already up to date for the final run, that needs fewer passes.
+- The final PDF is built with the Makefile that Sphinx generates (latexmk), that
+  reruns LaTeX only until the references are stable.
+
+Other documents, or any change out of the chapters, go straight to latexmk.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Files that are the input of the PDF, the rest are outputs of LaTeX
+INPUT_SUFFIXES = (".tex", ".sty", ".cls", ".cfg", ".def", ".fd", ".ist", ".xdy",
+                  ".png", ".jpg", ".jpeg", ".gif", ".pdf", ".eps", ".svg")
+# Typeset without writing the PDF, only the .aux are used
+CHAPTER_COMMANDS = {
+    "pdflatex": ["pdflatex", "-draftmode"],
+    "xelatex": ["xelatex", "--no-pdf"],
+    "lualatex": ["lualatex", "--draftmode"],
+}
+JOBS_DIR = "_chapterjobs"
+
+_date_re = re.compile(r"^\\date\{.*\}$", re.MULTILINE)
+
+
+def file_hash(path, main=False):
+    with open(path, "rb") as f:
+        content = f.read()
+    if main:
+        content = _date_re.sub("", content.decode("utf-8")).encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def input_hashes(latexdir, stem):
+    """ The hashes of the inputs of a document, by path relative to the LaTeX folder
+    """
+    hashes = {}
+    pdfs = {os.path.splitext(p)[0] + ".pdf" for p in glob.glob(os.path.join(latexdir, "*.tex"))}
+    for root, dirs, files in os.walk(latexdir):
+        dirs[:] = [d for d in dirs if d != JOBS_DIR]
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(INPUT_SUFFIXES) and path not in pdfs:
+                rel = os.path.relpath(path, latexdir).replace(os.sep, "/")
+                hashes[rel] = file_hash(path, main=rel == stem + ".tex")
+    return hashes
+
+
+def load_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def typeset_chapter(latexdir, stem, engine, chapter):
+    """ Typesets a chapter alone in its own output folder, returns if it succeeded
+    """
+    jobdir = os.path.join(latexdir, JOBS_DIR, chapter)
+    shutil.rmtree(jobdir, ignore_errors=True)
+    os.makedirs(os.path.join(jobdir, "chapters"))
+    # The references of the rest of the document, from the previous build
+    for aux in [f"{stem}.aux", f"{stem}.toc", f"{stem}.out"] + [
+            os.path.relpath(p, latexdir) for p in glob.glob(os.path.join(latexdir, "chapters", "*.aux"))]:
+        if os.path.isfile(os.path.join(latexdir, aux)):
+            shutil.copyfile(os.path.join(latexdir, aux), os.path.join(jobdir, aux))
+    cmd = CHAPTER_COMMANDS[engine] + shlex.split(os.environ.get("LATEXOPTS", "")) + [
+        "-interaction=nonstopmode", f"-output-directory={jobdir}", f"-jobname={stem}",
+        f"\\includeonly{{chapters/{chapter}}}\\input{{{stem}.tex}}"]
+    proc = subprocess.run(cmd, cwd=latexdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    aux = os.path.join(jobdir, "chapters", chapter + ".aux")
+    if proc.returncode != 0 or not os.path.isfile(aux):
+        return False
+    shutil.copyfile(aux, os.path.join(latexdir, "chapters", chapter + ".aux"))
+    return True
+
+
+def build_pdf(latexdir, target, jobs):
+    stem = os.path.splitext(target)[0]
+    manifest = load_json(os.path.join(latexdir, stem + ".chapters.json"))
+    state_path = os.path.join(latexdir, stem + ".pdfstate.json")
+    state = load_json(state_path) or {}
+    pdf = os.path.join(latexdir, stem + ".pdf")
+    hashes = input_hashes(latexdir, stem)
+
+    if hashes == state.get("inputs") and os.path.isfile(pdf):
+        print(f"{target}: no changes, {stem}.pdf is up to date")
+        return 0
+
+    changed = {path for path in set(hashes) | set(state.get("inputs", {}))
+               if hashes.get(path) != state.get("inputs", {}).get(path)}
+    chapters = {f"chapters/{c['name']}.tex": c["name"] for c in (manifest or {}).get("chapters", [])}
+    if (manifest and manifest["engine"] in CHAPTER_COMMANDS and os.path.isfile(os.path.join(latexdir, stem + ".aux"))
+            and changed and changed <= set(chapters)):
+        pending = sorted(chapters[path] for path in changed if path in hashes)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(pending)))) as executor:
+            results = list(executor.map(lambda c: typeset_chapter(latexdir, stem, manifest["engine"], c), pending))
+        shutil.rmtree(os.path.join(latexdir, JOBS_DIR), ignore_errors=True)
+        print(f"{target}: {sum(results)} of {len(pending)} changed chapters typeset in "
+              f"{time.monotonic() - start:.1f}s")
+    else:
+        print(f"{target}: {len(changed)} changed inputs, full build")
+
+    proc = subprocess.run(["make", "-C", latexdir, stem + ".pdf"])
+    if proc.returncode == 0:
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump({"inputs": hashes}, f, indent=1)
+    return proc.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental PDF build of the LaTeX output")
+    parser.add_argument("latexdir", help="Output folder of the latex builder")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="Maximum number of chapters typeset at the same time")
+    args = parser.parse_args()
+    args.latexdir = os.path.abspath(args.latexdir)
+
+    targets = [os.path.basename(p) for p in sorted(glob.glob(os.path.join(args.latexdir, "*.tex")))]
+    if not targets:
+        print(f"No LaTeX documents in {args.latexdir}, run 'make latex' first")
+        return 1
+    result = 0
+    for target in targets:
+        result = build_pdf(args.latexdir, target, args.jobs) or result
+    return result
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,16 @@
-import os
 import subprocess
-
-lines = subprocess.check_output(['git', 'branch', "-a"]).decode().split("\n")
-
-branches = []
-for line in lines:
-    line = line.strip()
-    if line.startswith("remotes/origin/release/"):
-        branches.append(line.split("remotes/origin/")[1])
+import sys
 
 old_code = "UA-68594724-3"
 old_code_2 = "GTM-53TFLK7"
 new_code = "GTM-WK44ZFM"
 
 if __name__ == "__main__":
-
-    for br in branches:
-        os.system("git checkout {}".format(br))
-        command = "find ./ -type f | grep -v .git | xargs sed -i 's/{}/{}/g'\\;".format(old_code, new_code)
-        print(command)
-        os.system(command)
-        os.system("find ./ -type f | grep -v .git | xargs sed -i 's/{}/{}/g'\\;".format(old_code_2, new_code))
-        os.system("git add .")
-        os.system("git commit -m \"Replaced old GA code\"")
-        os.system("git push origin {}".format(br))
+    # Rewrites all the release branches in parallel, without checking them out
+    # Pass --dry-run to only see the diff
+    sys.exit(subprocess.call([sys.executable, "rewrite_branches.py",
+                              "--replace", old_code, new_code,
+                              "--replace", old_code_2, new_code,
+                              "--branches", "origin/release/*",
+                              "--message", "Replaced old GA code",
+                              "--push", "origin", *sys.argv[1:]]))
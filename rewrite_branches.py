@@ -0,0 +1,184 @@
+"""
+Replace text in many branches at once, without checking any of them out.
+
+Works directly on the git objects: ``git grep`` finds the blobs that contain the
+patterns, only those are rewritten, and a new tree and commit are created on top
+of each branch using a temporary index. The branches are processed in parallel.
+
+    $ python rewrite_branches.py --replace UA-68594724-3 GTM-WK44ZFM --dry-run
+    $ python rewrite_branches.py --regex --replace "GTM-[0-9A-Z]{7}" GTM-WK44ZFM \\
+        --branches "origin/release/*" --push origin
+
+Without --dry-run the local branches (``release/2.0`` for ``origin/release/2.0``)
+are updated, and also pushed if --push is given.
+"""
+import argparse
+import difflib
+import fnmatch
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+def git(*args, input=None, env=None):
+    return subprocess.run(["git", *args], input=input, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE).stdout
+
+
+def list_branches(patterns):
+    refs = git("for-each-ref", "--format=%(refname:short)", "refs/heads", "refs/remotes").decode().split()
+    return [r for r in refs if any(fnmatch.fnmatch(r, p) for p in patterns) and not r.endswith("/HEAD")]
+
+
+def local_name(branch):
+    """ "origin/release/2.0" -> "release/2.0", local branches are kept as they are
+    """
+    if git("for-each-ref", f"refs/remotes/{branch}").strip():
+        return branch.split("/", 1)[1]
+    return branch
+
+
+def current_branch():
+    """ The checked out branch, None with a detached HEAD (as in most CI checkouts)
+    """
+    try:
+        return git("symbolic-ref", "-q", "--short", "HEAD").decode().strip()
+    except subprocess.CalledProcessError as e:
+        if e.returncode == 1:  # Not a symbolic ref
+            return None
+        raise
+
+
+def local_commit(local_branch):
+    """ The commit of a local branch, "" if it does not exist (what update-ref expects then)
+    """
+    try:
+        return git("rev-parse", "-q", "--verify", f"refs/heads/{local_branch}^{{commit}}").decode().strip()
+    except subprocess.CalledProcessError:
+        return ""
+
+
+def matching_paths(commit, replacements, regex):
+    args = ["grep", "-l", "-z", "-I", "-P" if regex else "-F"]
+    for old, _ in replacements:
+        args += ["-e", old]
+    try:
+        out = git(*args, commit)
+    except subprocess.CalledProcessError as e:
+        if e.returncode == 1:  # Nothing found
+            return []
+        raise
+    prefix = commit + ":"
+    return [p.decode()[len(prefix):] for p in out.split(b"\0") if p]
+
+
+def rewrite(text, replacements, regex):
+    for old, new in replacements:
+        text = re.sub(old, new, text) if regex else text.replace(old, new)
+    return text
+
+
+def rewrite_branch(branch, replacements, regex, message, dry_run, push):
+    commit = git("rev-parse", branch).decode().strip()
+    local_branch = local_name(branch)
+    old_local = local_commit(local_branch)
+    if not dry_run:
+        if current_branch() == local_branch:
+            raise RuntimeError(f"{local_branch} is checked out, it would leave the working tree out of sync")
+        if old_local and old_local != commit and subprocess.run(
+                ["git", "merge-base", "--is-ancestor", old_local, commit]).returncode != 0:
+            raise RuntimeError(f"{local_branch} has commits that are not in {branch}, it would lose them")
+    paths = matching_paths(commit, replacements, regex)
+    if not paths:
+        return branch, [], [], None
+
+    modes = {}
+    for entry in git("ls-tree", "-z", commit, "--", *paths).split(b"\0"):
+        if entry:
+            info, path = entry.decode().split("\t", 1)
+            modes[path] = info.split()[0]
+
+    updates = []
+    changed = []
+    diff = []
+    for path in paths:
+        old_text = git("cat-file", "blob", f"{commit}:{path}").decode("utf-8", errors="surrogateescape")
+        new_text = rewrite(old_text, replacements, regex)
+        if new_text == old_text:
+            continue
+        changed.append(path)
+        if dry_run:
+            diff.extend(difflib.unified_diff(old_text.splitlines(keepends=True), new_text.splitlines(keepends=True),
+                                             f"a/{path}", f"b/{path}"))
+        else:
+            blob = git("hash-object", "-w", "--stdin",
+                       input=new_text.encode("utf-8", errors="surrogateescape")).decode().strip()
+            updates.append(f"{modes[path]},{blob},{path}")
+    if dry_run or not updates:
+        return branch, changed, diff, None
+
+    # A private index per branch, so the branches can be rewritten concurrently
+    # and the working tree and the main index are never touched
+    fd, index_path = tempfile.mkstemp(prefix="rewrite-index-")
+    os.close(fd)
+    try:
+        env = dict(os.environ, GIT_INDEX_FILE=index_path)
+        git("read-tree", commit, env=env)
+        for update in updates:
+            git("update-index", "--cacheinfo", update, env=env)
+        tree = git("write-tree", env=env).decode().strip()
+    finally:
+        os.remove(index_path)
+    new_commit = git("commit-tree", tree, "-p", commit, "-m", message).decode().strip()
+
+    # With the value read at the start, git refuses if the branch moved meanwhile
+    git("update-ref", f"refs/heads/{local_branch}", new_commit, old_local)
+    if push:
+        git("push", push, f"{new_commit}:refs/heads/{local_branch}")
+    return branch, changed, diff, new_commit
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite text in many branches without checking them out")
+    parser.add_argument("--replace", nargs=2, action="append", metavar=("OLD", "NEW"), required=True,
+                        help="Replacement, can be repeated")
+    parser.add_argument("--regex", action="store_true", help="OLD are regular expressions, not literals")
+    parser.add_argument("--branches", nargs="+", default=["origin/release/*"],
+                        help="Branch patterns to rewrite")
+    parser.add_argument("--message", default="Replace text in all the release branches")
+    parser.add_argument("--dry-run", action="store_true", help="Show the diff, do not write anything")
+    parser.add_argument("--push", metavar="REMOTE", help="Push the rewritten branches to this remote")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    def process(branch):
+        try:
+            return rewrite_branch(branch, args.replace, args.regex, args.message, args.dry_run, args.push)
+        except (subprocess.CalledProcessError, RuntimeError) as e:
+            error = (e.stderr or b"").decode().strip() if isinstance(e, subprocess.CalledProcessError) else ""
+            error = error or str(e)
+            return branch, None, error, None
+
+    branches = list_branches(args.branches)
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        results = list(executor.map(process, branches))
+
+    failed = False
+    for branch, changed, diff, new_commit in results:
+        if changed is None:
+            failed = True
+            print(f"{branch}: ERROR {diff}", file=sys.stderr)
+        elif args.dry_run:
+            sys.stdout.writelines(diff)
+        elif new_commit:
+            print(f"{branch}: {len(changed)} files rewritten in {new_commit[:10]}")
+        else:
+            print(f"{branch}: nothing to replace")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Tests of _ext/linkcheckcache.py against local stub HTTP servers, one per host.
+
+    $ python -m unittest discover -s tests
+"""
+import http.server
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "_ext"))
+
+from sphinx.application import Sphinx  # noqa: E402
+from sphinx.builders.linkcheck import HyperlinkAvailabilityChecker  # noqa: E402
+
+import linkcheckcache  # noqa: E402
+
+DAY = 24 * 60 * 60
+
+
+class StubServer:
+    """ A host that answers /ok*, /missing (404) and /redirect (to /target), counting the
+    requests per path and the most requests it served at the same time
+    """
+    def __init__(self):
+        self.hits = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                with server.lock:
+                    server.hits[self.path] = server.hits.get(self.path, 0) + 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(0.05)
+                    if self.path == "/redirect":
+                        self.send_response(302)
+                        self.send_header("Location", "/target")
+                    else:
+                        self.send_response(404 if self.path == "/missing" else 200)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            do_GET = do_HEAD
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.netloc = f"127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return f"http://{self.netloc}{path}"
+
+    def reset(self):
+        self.hits = {}
+        self.max_in_flight = 0
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class LinkcheckCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.busy = StubServer()
+        self.quiet = StubServer()
+        self.addCleanup(self.busy.close)
+        self.addCleanup(self.quiet.close)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.folder = tmp.name
+        self.store = os.path.join(self.folder, "linkcheck.json")
+
+        links = [self.busy.url(f"/ok{i}") for i in range(6)] + [self.busy.url("/missing"),
+                                                                 self.busy.url("/redirect")]
+        links += [self.quiet.url(f"/ok{i}") for i in range(6)]
+        with open(os.path.join(self.folder, "index.rst"), "w") as f:
+            f.write("Links\n=====\n\n" + "".join(f"* `link {i} <{link}>`_\n" for i, link in enumerate(links)))
+        with open(os.path.join(self.folder, "conf.py"), "w") as f:
+            f.write("extensions = ['linkcheckcache']\n")
+
+    def linkcheck(self, **overrides):
+        overrides = dict({"linkcheckcache_file": self.store,
+                          "linkcheck_workers": 4,
+                          "linkcheckcache_host_workers": 3,
+                          "linkcheckcache_hosts": {self.busy.netloc: {"workers": 1}}}, **overrides)
+        app = Sphinx(self.folder, self.folder, os.path.join(self.folder, "_build", "linkcheck"),
+                     os.path.join(self.folder, "_build", "doctrees"), "linkcheck",
+                     confoverrides=overrides, status=io.StringIO(), warning=io.StringIO(), freshenv=True)
+        app.build()
+        with open(os.path.join(app.outdir, "output.json")) as f:
+            return {r["uri"]: r["status"] for r in map(json.loads, f)}
+
+    def test_lanes_per_host(self):
+        results = self.linkcheck()
+        self.assertEqual(results[self.busy.url("/ok0")], "working")
+        self.assertEqual(results[self.busy.url("/missing")], "broken")
+        self.assertEqual(results[self.busy.url("/redirect")], "redirected")
+        self.assertEqual(self.busy.max_in_flight, 1)
+        self.assertGreater(self.quiet.max_in_flight, 1)
+        self.assertLessEqual(self.quiet.max_in_flight, 3)
+
+    def test_results_reused_within_ttl(self):
+        first = self.linkcheck()
+        self.busy.reset()
+        self.quiet.reset()
+        second = self.linkcheck()
+        self.assertEqual(first, second)
+        # Working and redirected links are trusted, broken ones are checked again by default
+        self.assertEqual(set(self.busy.hits), {"/missing"})
+        self.assertEqual(self.quiet.hits, {})
+
+    def test_errors_and_redirects_cached(self):
+        self.linkcheck()
+        with open(self.store) as f:
+            store = json.load(f)
+        self.assertEqual(store[self.busy.url("/missing")]["status"], "broken")
+        self.assertEqual(store[self.busy.url("/redirect")]["status"], "redirected")
+        self.assertEqual(store[self.busy.url("/redirect")]["info"], self.busy.url("/target"))
+
+        self.busy.reset()
+        results = self.linkcheck(linkcheckcache_ttl={"working": DAY, "redirected": DAY, "broken": DAY})
+        self.assertEqual(results[self.busy.url("/missing")], "broken")
+        self.assertEqual(self.busy.hits, {})
+
+        # Expired redirects are checked again
+        results = self.linkcheck(linkcheckcache_ttl={"working": DAY, "redirected": 0, "broken": DAY})
+        self.assertEqual(results[self.busy.url("/redirect")], "redirected")
+        self.assertEqual(set(self.busy.hits), {"/redirect", "/target"})
+
+    def test_stock_checker_with_other_sphinx_versions(self):
+        self.assertIs(linkcheckcache.checker_class((7, 2, 6)), linkcheckcache.HostAwareChecker)
+        self.assertIs(linkcheckcache.checker_class((8, 0, 0)), HyperlinkAvailabilityChecker)
+
+
+if __name__ == "__main__":
+    unittest.main()